@@ -0,0 +1,91 @@
+"""Composite indexes and RANGE partitioning on drops
+
+Revision ID: 4c1d2e7f9a03
+Revises:
+Create Date: 2026-10-19 12:00:00.000000
+
+MySQL requires the partitioning column to be part of every unique key and doesn't allow foreign keys
+on partitioned tables (in either direction), so this also:
+  - makes `partition` NOT NULL, backfilling it from date_added where it's missing
+  - changes the primary key to (drop_id, partition); drop_id stays auto-incremented and unique
+  - drops the foreign keys on drops and the ones referencing drops.drop_id
+
+Rebuilding the table takes a while on a large drops table; run it during a maintenance window.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from db.drop_partitions import get_last_partition, partition_definitions
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1d2e7f9a03'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+## name -> columns; the leading columns serve the filters, the rest let the hot aggregations
+## (per-player and per-npc monthly totals, item re-valuation) be answered from the index alone
+COMPOSITE_INDEXES = {
+    'ix_drops_player_partition': ['player_id', 'partition', 'npc_id', 'item_id', 'quantity', 'value'],
+    'ix_drops_player_date': ['player_id', 'date_added'],
+    'ix_drops_npc_partition': ['npc_id', 'partition', 'player_id', 'quantity', 'value'],
+    'ix_drops_partition_item': ['partition', 'item_id', 'player_id', 'npc_id', 'quantity', 'value'],
+}
+
+## Single-column indexes made redundant by a composite index's leading column (or by partition pruning)
+REDUNDANT_INDEX_COLUMNS = ['player_id', 'npc_id', 'partition']
+
+## (table, column, referred table, referred column) recreated on downgrade
+FOREIGN_KEYS = [
+    ('drops', 'item_id', 'items', 'item_id'),
+    ('drops', 'player_id', 'players', 'player_id'),
+    ('drops', 'npc_id', 'npc_list', 'npc_id'),
+    ('notified', 'drop_id', 'drops', 'drop_id'),
+]
+
+
+def _drop_foreign_keys(inspector):
+    for table_name in inspector.get_table_names():
+        for foreign_key in inspector.get_foreign_keys(table_name):
+            if (table_name == 'drops' or foreign_key['referred_table'] == 'drops') and foreign_key.get('name'):
+                op.drop_constraint(foreign_key['name'], table_name, type_='foreignkey')
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    op.execute("UPDATE drops SET `partition` = DATE_FORMAT(COALESCE(date_added, NOW()), '%Y%m') + 0 "
+               "WHERE `partition` IS NULL")
+    op.alter_column('drops', 'partition', existing_type=sa.Integer(), nullable=False)
+
+    _drop_foreign_keys(inspector)
+    for index in inspector.get_indexes('drops'):
+        if index['column_names'] in ([column] for column in REDUNDANT_INDEX_COLUMNS):
+            op.drop_index(index['name'], table_name='drops')
+    for name, columns in COMPOSITE_INDEXES.items():
+        op.create_index(name, 'drops', columns)
+
+    ## Dropping and re-adding the primary key in one statement keeps drop_id's AUTO_INCREMENT valid
+    op.execute("ALTER TABLE drops DROP PRIMARY KEY, ADD PRIMARY KEY (drop_id, `partition`)")
+
+    first = bind.execute(sa.text("SELECT MIN(`partition`) FROM drops")).scalar()
+    last = get_last_partition()
+    first = min(first, last) if first else last
+    op.execute(f"ALTER TABLE drops PARTITION BY RANGE (`partition`) ({partition_definitions(first, last)})")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE drops REMOVE PARTITIONING")
+    op.execute("ALTER TABLE drops DROP PRIMARY KEY, ADD PRIMARY KEY (drop_id)")
+
+    for name in COMPOSITE_INDEXES:
+        op.drop_index(name, table_name='drops')
+    for column in REDUNDANT_INDEX_COLUMNS:
+        op.create_index(f'ix_drops_{column}', 'drops', [column])
+    op.alter_column('drops', 'partition', existing_type=sa.Integer(), nullable=True)
+
+    for table_name, column, referred_table, referred_column in FOREIGN_KEYS:
+        op.create_foreign_key(f'{table_name}_ibfk_{column}', table_name, referred_table, [column], [referred_column])
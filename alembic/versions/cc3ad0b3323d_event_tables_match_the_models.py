@@ -0,0 +1,89 @@
+"""Event tables match the event models
+
+Revision ID: cc3ad0b3323d
+Revises: 4c1d2e7f9a03
+Create Date: 2026-10-19 18:00:00.000000
+
+db/eventmodels.py now describes the event tables as they exist:
+  - event_configurations, which the board game saves its state into, has a model again; it's created
+    here where it's missing
+  - the event tables' event_id columns reference events.event_id (the models named a nonexistent
+    events.id); foreign keys to any other column of events are replaced, and missing ones are added
+
+Server defaults (mercy_rule's INTERVAL, ON UPDATE CURRENT_TIMESTAMP) and NOT NULL expiry dates are
+unchanged. Only what's missing is created, so this is a no-op on a database that already matches.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'cc3ad0b3323d'
+down_revision = '4c1d2e7f9a03'
+branch_labels = None
+depends_on = None
+
+## Tables whose event_id column references events.event_id
+EVENT_ID_TABLES = [
+    'board_game',
+    'event_configurations',
+    'event_teams',
+    'event_items',
+    'event_participants',
+    'event_tasks',
+]
+
+
+def _foreign_key_name(table_name):
+    return f'{table_name}_ibfk_event_id'
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    table_names = inspector.get_table_names()
+
+    if 'event_configurations' not in table_names:
+        op.create_table(
+            'event_configurations',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('event_id', sa.Integer(), nullable=False),
+            sa.Column('config_key', sa.String(255), nullable=False),
+            sa.Column('config_value', sa.String(255), nullable=True),
+            sa.Column('long_value', sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'), nullable=True),
+            sa.Column('update_number', sa.Integer(), nullable=False, server_default=sa.text('0')),
+            sa.Column('created_at', sa.TIMESTAMP(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+            sa.Column('updated_at', sa.TIMESTAMP(), nullable=False,
+                      server_default=sa.text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP')),
+            sa.ForeignKeyConstraint(['event_id'], ['events.event_id'], name=_foreign_key_name('event_configurations')),
+        )
+        op.create_index('idx_event_config_key_version', 'event_configurations',
+                        ['event_id', 'config_key', 'update_number'])
+        table_names.append('event_configurations')
+
+    for table_name in EVENT_ID_TABLES:
+        if table_name not in table_names:
+            continue
+        has_event_id_key = False
+        for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys(table_name):
+            if foreign_key['referred_table'] != 'events':
+                continue
+            if foreign_key['referred_columns'] == ['event_id'] and foreign_key['constrained_columns'] == ['event_id']:
+                has_event_id_key = True
+            elif foreign_key.get('name'):
+                op.drop_constraint(foreign_key['name'], table_name, type_='foreignkey')
+        if not has_event_id_key:
+            op.create_foreign_key(_foreign_key_name(table_name), table_name, 'events', ['event_id'], ['event_id'])
+
+
+def downgrade() -> None:
+    ## event_configurations holds the saved games and may predate this revision, so it's kept
+    inspector = sa.inspect(op.get_bind())
+    table_names = inspector.get_table_names()
+    for table_name in EVENT_ID_TABLES:
+        if table_name not in table_names:
+            continue
+        for foreign_key in inspector.get_foreign_keys(table_name):
+            if foreign_key.get('name') == _foreign_key_name(table_name):
+                op.drop_constraint(foreign_key['name'], table_name, type_='foreignkey')
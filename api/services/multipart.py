@@ -0,0 +1,197 @@
+import asyncio
+import os
+import shutil
+import uuid
+
+import aiofiles
+
+"""
+
+    Streaming multipart/form-data handling for the /webhook endpoint.
+
+    The request body is consumed chunk-by-chunk: small form fields (payload_json)
+    are kept in memory, while file parts are written straight to a temporary file,
+    so a request never holds more than one chunk (+ the boundary) of image data at a time.
+
+"""
+
+## Temporary storage for uploads; kept on the same disk as the user-upload directory
+## so that moving the finished file into place is a rename rather than a copy.
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", "/store/droptracker/disc/static/assets/img/user-upload/.incoming/")
+MAX_FIELD_SIZE = 1024 * 1024  # 1MB - payload_json is only ever a few KB
+MAX_HEADER_SIZE = 16 * 1024
+MAX_FILE_SIZE = 25 * 1024 * 1024  # Discord's own attachment limit
+
+
+class MultipartError(Exception):
+    pass
+
+
+class StreamedUpload:
+    """
+        A file part that has been streamed to disk.
+        Mirrors the parts of Quart's FileStorage used by utils.download.download_image
+    """
+    def __init__(self, name: str, filename: str, content_type: str, temp_path: str):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.temp_path = temp_path
+        self.size = 0
+
+    async def save(self, destination: str):
+        """Move the uploaded file to its final destination"""
+        await asyncio.to_thread(shutil.move, self.temp_path, destination)
+        self.temp_path = None
+
+    def discard(self):
+        """Remove the temporary file if it was never saved"""
+        if self.temp_path and os.path.exists(self.temp_path):
+            try:
+                os.remove(self.temp_path)
+            except OSError as e:
+                print(f"Couldn't remove temporary upload {self.temp_path}: {e}")
+        self.temp_path = None
+
+    def __repr__(self):
+        return f"<StreamedUpload {self.name}: {self.filename} ({self.content_type}, {self.size} bytes)>"
+
+
+def get_boundary(content_type: str):
+    for part in content_type.split(';'):
+        part = part.strip()
+        if part.startswith('boundary='):
+            return part[9:].strip('"')
+    return None
+
+
+def _parse_part_headers(raw_headers: bytes):
+    """Returns (field name, filename, content type) from a part's header block"""
+    name = None
+    filename = None
+    content_type = None
+    for line in raw_headers.decode('utf-8', errors='replace').split("\r\n"):
+        if ':' not in line:
+            continue
+        header, value = line.split(':', 1)
+        header = header.strip().lower()
+        if header == "content-disposition":
+            for param in value.split(';'):
+                param = param.strip()
+                if param.startswith('name='):
+                    name = param[5:].strip('"')
+                elif param.startswith('filename='):
+                    filename = param[9:].strip('"')
+        elif header == "content-type":
+            content_type = value.strip()
+    return name, filename, content_type
+
+
+async def parse_multipart_stream(body, boundary: str):
+    """
+        Parses a multipart/form-data body from an async iterable of byte chunks.
+        :param: body: the request body (e.g. Quart's request.body)
+        :param: boundary: the multipart boundary from the Content-Type header
+            Returns (fields, files) where fields maps names to strings
+            and files maps names to StreamedUpload objects
+    """
+    delimiter = b"--" + boundary.encode('latin1')
+    part_delimiter = b"\r\n" + delimiter
+    fields = {}
+    files = {}
+
+    buffer = bytearray()
+    state = "preamble"
+    part_name = None
+    field_data = None
+    current_upload = None
+    upload_handle = None
+
+    async def finish_part():
+        nonlocal field_data, current_upload, upload_handle
+        if upload_handle is not None:
+            await upload_handle.close()
+            files[part_name] = current_upload
+        elif field_data is not None:
+            fields[part_name] = field_data.decode('utf-8')
+        field_data = None
+        current_upload = None
+        upload_handle = None
+
+    async def write_part(data):
+        nonlocal field_data
+        if not data:
+            return
+        if upload_handle is not None:
+            current_upload.size += len(data)
+            if current_upload.size > MAX_FILE_SIZE:
+                raise MultipartError("Uploaded file is too large")
+            await upload_handle.write(data)
+        elif field_data is not None:
+            if len(field_data) + len(data) > MAX_FIELD_SIZE:
+                raise MultipartError(f"Form field '{part_name}' is too large")
+            field_data += data
+
+    try:
+        async for chunk in body:
+            buffer += chunk
+            while True:
+                if state == "preamble":
+                    index = buffer.find(delimiter)
+                    if index == -1:
+                        ## Keep just enough to match a delimiter split across chunks
+                        del buffer[:max(0, len(buffer) - len(delimiter))]
+                        break
+                    del buffer[:index + len(delimiter)]
+                    state = "delimiter"
+                elif state == "delimiter":
+                    if len(buffer) < 2:
+                        break
+                    if buffer[:2] == b"--":
+                        state = "done"
+                        break
+                    if buffer[:2] != b"\r\n":
+                        raise MultipartError("Malformed multipart boundary")
+                    del buffer[:2]
+                    state = "headers"
+                elif state == "headers":
+                    index = buffer.find(b"\r\n\r\n")
+                    if index == -1:
+                        if len(buffer) > MAX_HEADER_SIZE:
+                            raise MultipartError("Multipart headers are too large")
+                        break
+                    part_name, filename, content_type = _parse_part_headers(bytes(buffer[:index]))
+                    del buffer[:index + 4]
+                    if filename is not None:
+                        os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+                        temp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4()}.part")
+                        current_upload = StreamedUpload(part_name, filename, content_type, temp_path)
+                        upload_handle = await aiofiles.open(temp_path, 'wb')
+                    else:
+                        field_data = bytearray()
+                    state = "body"
+                elif state == "body":
+                    index = buffer.find(part_delimiter)
+                    if index == -1:
+                        ## Flush everything that can't be the start of the next delimiter
+                        safe_length = len(buffer) - len(part_delimiter) + 1
+                        if safe_length > 0:
+                            await write_part(bytes(buffer[:safe_length]))
+                            del buffer[:safe_length]
+                        break
+                    await write_part(bytes(buffer[:index]))
+                    del buffer[:index + len(part_delimiter)]
+                    await finish_part()
+                    state = "delimiter"
+            if state == "done":
+                break
+        if state != "done":
+            raise MultipartError("Unexpected end of multipart body")
+    except BaseException:
+        if upload_handle is not None:
+            await upload_handle.close()
+            current_upload.discard()
+        for upload in files.values():
+            upload.discard()
+        raise
+    return fields, files
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import time
+
+import redis
+from dotenv import load_dotenv
+
+from utils.redis import RedisClient
+
+load_dotenv()
+
+"""
+
+    Redis-backed rate limiting + duplicate submission coalescing for the
+    /submit and /webhook endpoints.
+
+    Every hypercorn worker shares the same buckets, so the configured limit
+    is the real limit no matter how many workers are running.
+
+    Duplicate coalescing is header/id-only: a submission is only discarded as a
+    retry when the client identifies it (Idempotency-Key header, or one of
+    SUBMISSION_ID_FIELDS in the payload). The RuneLite plugin sends neither yet,
+    so its submissions all reach the processors.
+
+"""
+
+## Tokens refilled per second, and the maximum burst size, for each bucket type
+IP_RATE = float(os.getenv("SUBMIT_IP_RATE", 10))
+IP_BURST = int(os.getenv("SUBMIT_IP_BURST", 20))
+ACCOUNT_RATE = float(os.getenv("SUBMIT_ACCOUNT_RATE", 2))
+ACCOUNT_BURST = int(os.getenv("SUBMIT_ACCOUNT_BURST", 10))
+## How long (seconds) a submission id is remembered, to discard a client's retries of it
+DUPLICATE_WINDOW = int(os.getenv("SUBMIT_DUPLICATE_WINDOW", 60))
+
+## Payload fields a client can use to identify one submission across its retries
+SUBMISSION_ID_FIELDS = ("submission_id", "nonce", "guid", "idempotency_key")
+
+## Atomic token bucket: refills based on elapsed time, then tries to take `requested` tokens.
+## Returns {allowed (0/1), milliseconds until a token is available}
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+
+local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= requested then
+    tokens = tokens - requested
+    allowed = 1
+else
+    retry_after = math.ceil((requested - tokens) / rate * 1000)
+end
+
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, retry_after}
+"""
+
+
+class SubmissionLimiter:
+    """
+        Shared limiter for the submission endpoints.
+        :param: redis_client: RedisClient instance to store bucket/idempotency state in
+        All checks fail open: if Redis is unavailable, the request is allowed through
+        rather than dropping player submissions.
+    """
+    def __init__(self, redis_client: RedisClient = None):
+        self.redis_client = redis_client or RedisClient()
+        self._bucket_script = None
+
+    def _get_bucket_script(self):
+        if self._bucket_script is None:
+            self._bucket_script = self.redis_client.client.register_script(TOKEN_BUCKET_SCRIPT)
+        return self._bucket_script
+
+    def take(self, bucket_key: str, rate: float, burst: int, tokens: int = 1):
+        """
+            Attempt to take `tokens` from the bucket stored at `bucket_key`.
+            Returns (allowed, retry_after_seconds)
+        """
+        try:
+            allowed, retry_after_ms = self._get_bucket_script()(
+                keys=[bucket_key],
+                args=[rate, burst, time.time(), tokens]
+            )
+            return bool(allowed), int(retry_after_ms) / 1000
+        except redis.RedisError as e:
+            print(f"Error checking rate limit bucket '{bucket_key}': {e}")
+            return True, 0
+
+    def check_ip(self, ip_address: str):
+        return self.take(f"ratelimit:submit:ip:{ip_address}", IP_RATE, IP_BURST)
+
+    def check_account(self, account_hash: str):
+        return self.take(f"ratelimit:submit:acc:{account_hash}", ACCOUNT_RATE, ACCOUNT_BURST)
+
+    def claim_submission(self, processed_data: dict, header_id: str = None):
+        """
+            Claims the idempotency key for a processed submission.
+            :param: header_id: an Idempotency-Key header sent with the request, if any
+            Returns (claimed, key) -- claimed is False if a submission with the same
+            client-supplied id was already accepted inside the duplicate window.
+            Payloads carry no per-event id of their own, so two identical drops are two
+            real drops: without a client-supplied id nothing is ever discarded (key is None).
+        """
+        submission_id = get_submission_id(processed_data, header_id)
+        if not submission_id:
+            return True, None
+        key = f"idempotency:submit:{submission_id}"
+        try:
+            claimed = self.redis_client.client.set(key, int(time.time()), nx=True, ex=DUPLICATE_WINDOW)
+            return bool(claimed), key
+        except redis.RedisError as e:
+            print(f"Error claiming idempotency key '{key}': {e}")
+            return True, key
+
+    def release_submission(self, key: str):
+        """
+            Releases a claimed idempotency key, so that a retry of a submission
+            which failed to process is not discarded as a duplicate.
+        """
+        if key:
+            self.redis_client.delete(key)
+
+
+def get_submission_id(processed_data: dict, header_id: str = None):
+    """
+        The client-supplied id of a submission, hashed to a fixed length together with the
+        account it belongs to, or None if the client didn't send one.
+    """
+    submission_id = header_id
+    if not submission_id:
+        submission_id = next((processed_data.get(field) for field in SUBMISSION_ID_FIELDS
+                              if processed_data.get(field)), None)
+    if not submission_id:
+        return None
+    scope = processed_data.get("acc_hash") or processed_data.get("player") or ""
+    return hashlib.sha256(f"{scope}:{submission_id}".encode()).hexdigest()
@@ -6,13 +6,17 @@ from db import models
 from db.update_player_total import update_player_in_redis
 from db.xf.recent_submissions import create_xenforo_entry
 from utils.embeds import update_boss_pb_embed
+from games.events.EventFactory import record_event_drop
 from utils.messages import confirm_new_npc, confirm_new_item, name_change_message, new_player_message
 from utils.msg_logger import HighThroughputLogger
-from utils.semantic_check import check_item_exists, get_current_ca_tier, get_ca_tier_progress, get_item_id, get_npc_id
+from utils.semantic_check import check_item_exists, get_current_ca_tier, get_ca_tier_progress, get_item_id
+from utils.npc_resolver import npc_resolver
 from utils.wiseoldman import check_user_by_id, check_user_by_username, check_group_by_id, fetch_group_members, get_collections_logged
 from utils.redis import RedisClient
 from db.ops import DatabaseOperations, associate_player_ids
 from utils.download import download_player_image, download_image
+from services.image_pipeline import image_pipeline
+from pb.leaderboards import update_pb_leaderboards
 from sqlalchemy import func, text
 from utils.format import format_number, get_command_id, get_extension_from_content_type, replace_placeholders, convert_from_ms
 import interactions
@@ -72,7 +76,6 @@ async def run_restart():
     except Exception as e:
         debug_print(f"Error running restart script: {e}")
 
-npc_list = {} # - stores a dict of the npc's and their corresponding IDs to prevent excessive querying
 player_list = {} # - stores a dict of player name:ids, and their last refresh from the DB.
 class RawDropData():
     def __init__(self) -> None:
@@ -190,36 +193,16 @@ async def drop_processor(drop_data: RawDropData, external_session=None):
             debug_print(player_name + " failed auth check")
             return
         
-        if npc_name in npc_list:
-            npc_id = npc_list[npc_name]
-        else:
-            npc = session.query(NpcList.npc_id).filter(NpcList.npc_name == npc_name).first()
-            if not npc:
-                npc_id = None
-                npc_obj = session.query(NpcList.npc_id).filter(NpcList.npc_name == npc).first()
-                if not npc_obj:
-                    try:
-                        npc_id = await get_npc_id(npc)
-                        if npc_id:
-                            npc = NpcList(npc_id=npc_id, npc_name=npc)
-                            session.add(npc)
-                            session.commit()
-                        npc_list[npc_name] = npc.npc_id
-                    except Exception as e:
-                        debug_print(f"NPC {npc} not found in database, aborting")
-                        return
-                if npc_name not in npc_list:
-                    debug_print(f"NPC {npc} not found in database")    
-                    notification_data = {
-                        'npc_name': npc_name,
-                        'player_name': player_name,
-                        'player_id': player_list[player_name]
-                    }
-                    await create_notification('new_npc', player_list[player_name], notification_data, existing_session=session if use_external_session else None)
-                return
-            else:
-                npc_list[npc_name] = npc.npc_id
-                npc_id = npc.npc_id
+        npc_id = await npc_resolver.resolve(npc_name, create=True)
+        if npc_id is None:
+            debug_print(f"NPC {npc_name} not found in database")    
+            notification_data = {
+                'npc_name': npc_name,
+                'player_name': player_name,
+                'player_id': player_list[player_name]
+            }
+            await create_notification('new_npc', player_list[player_name], notification_data, existing_session=session if use_external_session else None)
+            return
         
         player_id = player_list[player_name]
         item = redis_client.get(item_id)
@@ -281,6 +264,13 @@ async def drop_processor(drop_data: RawDropData, external_session=None):
             debug_print(f"Error updating player in redis: {e}")
             session.rollback()
             return
+        # Count the drop towards the player's team task in any event they're taking part in
+        try:
+            completed_tasks = await record_event_drop(player_id, item_name, int(quantity))
+            for event_id, team_name, task in completed_tasks:
+                debug_print(f"{player_name}'s {item_name} completed {team_name}'s task {task.name} in event {event_id}")
+        except Exception as e:
+            debug_print(f"Error recording drop for events: {e}")
         # Get player groups and check if notification is needed
         debug_print("Getting player groups")
         global_group = session.query(Group).filter(Group.group_id == 2).first()
@@ -316,6 +306,7 @@ async def drop_processor(drop_data: RawDropData, external_session=None):
                     'player_name': player_name,
                     'player_id': player_id,
                     'image_url': drop.image_url,
+                    'image_ref': image_pipeline.ref("drop", drop.drop_id),
                     'attachment_type': attachment_type
                 }
                 if player:
@@ -534,19 +525,8 @@ async def clog_processor(clog_data, external_session=None):
     player_id = player_list[player_name]
     try:
         if npc:
-            npc_obj = session.query(NpcList.npc_id).filter(NpcList.npc_name == npc).first()
-            if not npc_obj:
-                try:
-                    npc_id = await get_npc_id(npc)
-                    if npc_id:
-                        npc = NpcList(npc_id=npc_id, npc_name=npc)
-                        session.add(npc)
-                        session.commit()
-                    npc_list[npc_name] = npc.npc_id
-                except Exception as e:
-                    print(f"NPC {npc} not found in database, aborting")
-                    return
-            if npc_name not in npc_list:
+            npc_id = await npc_resolver.resolve(npc, create=True)
+            if npc_id is None:
                 print(f"NPC {npc} not found in database")    
                 notification_data = {
                     'npc_name': npc_name,
@@ -554,8 +534,6 @@ async def clog_processor(clog_data, external_session=None):
                     'player_id': player_list[player_name]
                 }
                 await create_notification('new_npc', player_list[player_name], notification_data, existing_session=session if use_external_session else None)
-        npc_id = session.query(NpcList.npc_id).filter(NpcList.npc_name == npc).first()
-        npc_id = npc_id.npc_id if npc_id else None
         if npc_id is None:
             print(f"NPC not able to be found in the database.")
         
@@ -600,27 +578,19 @@ async def clog_processor(clog_data, external_session=None):
         session.add(clog_entry)
         session.commit()  # Commit to get the log_id
         
-        # Process image if available
-        dl_path = ""
+        # Queue the image to be downloaded in the background
         if attachment_url and not downloaded:
             try:
-                file_extension = get_extension_from_content_type(attachment_type)
-                file_name = f"clog_{player_id}_{item_name.replace(' ', '_')}_{int(time.time())}"
-                
-                dl_path, external_url = await download_player_image(
+                image_pipeline.enqueue(
                     submission_type="clog",
-                    file_name=file_name,
-                    player=player,  # Now player is defined
-                    attachment_url=attachment_url,
-                    file_extension=file_extension,
                     entry_id=clog_entry.log_id,
+                    player=player,
+                    attachment_url=attachment_url,
+                    attachment_type=attachment_type,
                     entry_name=item_name
                 )
-                
-                # Update the image URL
-                clog_entry.image_url = dl_path if dl_path else ""
             except Exception as e:
-                app_logger.log(log_type="error", data=f"Couldn't download collection log image: {e}", app_name="core", description="clog_processor")
+                app_logger.log(log_type="error", data=f"Couldn't queue collection log image: {e}", app_name="core", description="clog_processor")
         elif downloaded:
                 clog_entry.image_url = image_url
         
@@ -656,6 +626,7 @@ async def clog_processor(clog_data, external_session=None):
                     'item_name': item_name,
                     'npc_name': npc,
                     'image_url': clog_entry.image_url,
+                    'image_ref': image_pipeline.ref("clog", clog_entry.log_id),
                     'kc_received': killcount,
                     'item_id': item_id
                 }
@@ -748,32 +719,24 @@ async def ca_processor(ca_data, external_session=None):
         )
         session.add(ca_entry)
         is_new_ca = True
-        # Process image if available
-        if attachment_url and not downloaded:
-            try:
-                file_extension = get_extension_from_content_type(attachment_type)
-                file_name = f"ca_{player_id}_{task_name.replace(' ', '_')}_{int(time.time())}"
-                player = session.query(Player).filter(Player.player_id == player_id).first()
-                if not player:
-                    debug_print("Player not found in database, aborting")
-                    return
-                dl_path, external_url = await download_player_image(
+        
+    session.commit()
+    debug_print("Committed a new CA entry")
+    if is_new_ca and attachment_url and not downloaded:
+        # Queue the image now that the entry has an ID
+        try:
+            player = session.query(Player).filter(Player.player_id == player_id).first()
+            if player:
+                image_pipeline.enqueue(
                     submission_type="ca",
-                    file_name=file_name,
+                    entry_id=ca_entry.id,
                     player=player,
                     attachment_url=attachment_url,
-                    file_extension=file_extension,
-                    entry_id=ca_entry.id,
+                    attachment_type=attachment_type,
                     entry_name=task_name
                 )
-                
-                if dl_path:
-                    ca_entry.image_url = dl_path
-            except Exception as e:
-                app_logger.log(log_type="error", data=f"Couldn't download CA image: {e}", app_name="core", description="ca_processor")
-        
-    session.commit()
-    debug_print("Committed a new CA entry")
+        except Exception as e:
+            app_logger.log(log_type="error", data=f"Couldn't queue CA image: {e}", app_name="core", description="ca_processor")
     # Create notification if it's a new CA
     if is_new_ca:
         debug_print("New CA entry, creating notification")
@@ -822,7 +785,8 @@ async def ca_processor(ca_data, external_session=None):
                                 'points_awarded': points_awarded,
                                 'points_total': points_total,
                                 'completed_tier': completed_tier,
-                                'image_url': ca_entry.image_url
+                                'image_url': ca_entry.image_url,
+                                'image_ref': image_pipeline.ref("ca", ca_entry.id)
                             }
                             if not has_xf_entry:
                                 try:
@@ -876,38 +840,17 @@ async def pb_processor(pb_data, external_session=None):
     has_xf_entry = False
     print("Raw pb data: " + str(pb_data))
     dl_path = None
-    npc: NpcList = session.query(NpcList.npc_id).filter(NpcList.npc_name == boss_name).first()
     npc_name = boss_name
-    if npc_name in npc_list:
-        npc_id = npc_list[npc_name]
-    else:
-        npc = session.query(NpcList.npc_id).filter(NpcList.npc_name == npc_name).first()
-        if not npc:
-            npc_id = None
-            npc_obj = session.query(NpcList.npc_id).filter(NpcList.npc_name == npc).first()
-            if not npc_obj:
-                try:
-                    npc_id = await get_npc_id(npc)
-                    if npc_id:
-                        npc = NpcList(npc_id=npc_id, npc_name=npc)
-                        session.add(npc)
-                        session.commit()
-                    npc_list[npc_name] = npc.npc_id
-                except Exception as e:
-                    debug_print(f"NPC {npc} not found in database, aborting")
-                    return
-            if npc_name not in npc_list:
-                debug_print(f"NPC {npc} not found in database")    
-                notification_data = {
-                    'npc_name': npc_name,
-                    'player_name': player_name,
-                    'player_id': player_list[player_name]
-                }
-                await create_notification('new_npc', player_list[player_name], notification_data, existing_session=session if use_external_session else None)
-            return
-        else:
-            npc_list[npc_name] = npc.npc_id
-            npc_id = npc.npc_id
+    npc_id = await npc_resolver.resolve(npc_name, create=True)
+    if npc_id is None:
+        debug_print(f"NPC {npc_name} not found in database")    
+        notification_data = {
+            'npc_name': npc_name,
+            'player_name': player_name,
+            'player_id': player_list.get(player_name)
+        }
+        await create_notification('new_npc', player_list.get(player_name), notification_data, existing_session=session if use_external_session else None)
+        return
     # Validate player
     if player_name not in player_list:
         player: Player = session.query(Player).filter(Player.player_name.ilike(player_name)).first()
@@ -934,35 +877,12 @@ async def pb_processor(pb_data, external_session=None):
     
     is_new_pb = False
     old_time = None
+    leaderboard_changed = pb_entry is None
     
     
     
-    # Process image if available
-    if is_personal_best:
-        print("Is personal best, processing image")
-        if attachment_url and not downloaded:
-            try:
-                file_extension = get_extension_from_content_type(attachment_type)
-                file_name = f"pb_{player_id}_{boss_name.replace(' ', '_')}_{int(time.time())}"
-                
-                dl_path, external_url = await download_player_image(
-                    submission_type="pb",
-                    file_name=file_name,
-                    player=player,
-                    attachment_url=attachment_url,
-                    file_extension=file_extension,
-                    entry_id=pb_entry.id,
-                    entry_name=boss_name
-                )
-                
-                if dl_path:
-                    pb_entry.image_url = dl_path
-                    session.commit()
-            except Exception as e:
-                print(f"Couldn't download PB image: {e}")
-                app_logger.log(log_type="error", data=f"Couldn't download PB image: {e}", app_name="core", description="pb_processor")
-        elif downloaded:
-            dl_path = image_url
+    if is_personal_best and downloaded:
+        dl_path = image_url
     if pb_entry:
         print("PB entry found, processing")
         if pb_entry.personal_best < time_ms:
@@ -973,6 +893,7 @@ async def pb_processor(pb_data, external_session=None):
             pb_entry.date_added = datetime.now()
             pb_entry.image_url = dl_path if dl_path else ""
             is_new_pb = True
+            leaderboard_changed = True
     else:
         print("PB entry not found, creating new entry")
         pb_entry = PersonalBestEntry(
@@ -989,6 +910,28 @@ async def pb_processor(pb_data, external_session=None):
     
     session.commit()
     print("Committed PB entry - personal best: " + str(is_personal_best))
+    if leaderboard_changed:
+        try:
+            group_ids = [group_id for (group_id,) in session.query(models.user_group_association.c.group_id).filter(
+                models.user_group_association.c.player_id == player_id).all()]
+            update_pb_leaderboards(player_id, npc_id, pb_entry.team_size, pb_entry.personal_best, group_ids)
+        except Exception as e:
+            app_logger.log(log_type="error", data=f"Couldn't update the PB leaderboards: {e}", app_name="core", description="pb_processor")
+    if is_personal_best and attachment_url and not downloaded:
+        # Queue the image now that the entry has an ID
+        try:
+            pb_player = player or session.query(Player).filter(Player.player_id == player_id).first()
+            if pb_player:
+                image_pipeline.enqueue(
+                    submission_type="pb",
+                    entry_id=pb_entry.id,
+                    player=pb_player,
+                    attachment_url=attachment_url,
+                    attachment_type=attachment_type,
+                    entry_name=boss_name
+                )
+        except Exception as e:
+            app_logger.log(log_type="error", data=f"Couldn't queue PB image: {e}", app_name="core", description="pb_processor")
     # Create notification if it's a new PB
     if is_personal_best:
         print("Is personal best, creating notification")
@@ -1022,7 +965,8 @@ async def pb_processor(pb_data, external_session=None):
                     'old_time_ms': old_time,
                     'team_size': team_size,
                     'kill_time_ms': current_ms,
-                    'image_url': pb_entry.image_url
+                    'image_url': pb_entry.image_url,
+                    'image_ref': image_pipeline.ref("pb", pb_entry.id)
                 }
                 print("Creating notification")
                 ## Check if we should send a notification for this npc
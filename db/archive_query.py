@@ -0,0 +1,131 @@
+import os
+import sys
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+
+from db.drop_archive import DROP_ARCHIVE_DIR, get_archive_path, get_archived_partitions
+from db.models import Session, user_group_association
+
+"""
+
+    Read side of the drops archive (see db/drop_archive.py).
+
+    Scans go through a pyarrow dataset over the monthly Parquet files: only the needed months' files
+    are opened (memory mapped), and filters are pushed down so row groups whose statistics can't
+    match are skipped without being read. Aggregations run in Arrow, so answering "top NPCs by value
+    in 2024" or a clan's yearly recap doesn't touch MySQL beyond looking up the clan's members.
+
+"""
+
+
+def _get_dataset(partitions=None):
+    archived = get_archived_partitions()
+    if partitions is not None:
+        wanted = set(partitions)
+        archived = [partition for partition in archived if partition in wanted]
+    if not archived:
+        return None
+    return ds.dataset([os.path.abspath(get_archive_path(partition)) for partition in archived],
+                      format="parquet", filesystem=fs.LocalFileSystem(use_mmap=True))
+
+
+def get_year_partitions(year: int):
+    return [year * 100 + month for month in range(1, 13)]
+
+
+def scan_drops(partitions=None, start: datetime = None, end: datetime = None, player_ids=None,
+               npc_ids=None, item_ids=None, columns=None) -> pa.Table:
+    """
+        Returns the archived drops matching every filter given, as an Arrow table.
+        :param: partitions: only read these months (YYYYMM); defaults to every archived month
+        :param: start, end: only drops added in [start, end)
+        :param: player_ids, npc_ids, item_ids: only drops for these ids
+        :param: columns: the columns to read, defaults to all of them
+    """
+    dataset = _get_dataset(partitions)
+    if dataset is None:
+        return pa.table({column: [] for column in (columns or [])})
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("date_added") >= pa.scalar(start, type=pa.timestamp("s")))
+    if end is not None:
+        conditions.append(ds.field("date_added") < pa.scalar(end, type=pa.timestamp("s")))
+    for column, ids in (("player_id", player_ids), ("npc_id", npc_ids), ("item_id", item_ids)):
+        if ids is not None:
+            conditions.append(ds.field(column).isin(list(ids)))
+    condition = None
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def _with_total(table: pa.Table) -> pa.Table:
+    return table.append_column("total", pc.multiply(pc.cast(table["value"], pa.int64()),
+                                                    pc.cast(table["quantity"], pa.int64())))
+
+
+def top_values(group_column: str, limit: int = 10, **filters):
+    """
+        Returns [(id, total value, drop count)] for the `limit` highest-value ids of group_column
+        (player_id, npc_id or item_id) among the archived drops matching `filters` (see scan_drops)
+    """
+    table = scan_drops(columns=[group_column, "value", "quantity"], **filters)
+    if table.num_rows == 0:
+        return []
+    totals = _with_total(table).group_by(group_column).aggregate([("total", "sum"), ("total", "count")])
+    totals = totals.sort_by([("total_sum", "descending")]).slice(0, limit)
+    return list(zip(totals[group_column].to_pylist(), totals["total_sum"].to_pylist(), totals["total_count"].to_pylist()))
+
+
+def top_npcs_by_value(year: int, limit: int = 10):
+    return top_values("npc_id", limit, partitions=get_year_partitions(year))
+
+
+def get_group_player_ids(group_id: int):
+    session = Session()
+    try:
+        return {player_id for (player_id,) in session.query(user_group_association.c.player_id).filter(
+            user_group_association.c.group_id == group_id, user_group_association.c.player_id.isnot(None)).all()}
+    finally:
+        session.close()
+
+
+def group_year_recap(group_id: int, year: int, limit: int = 10) -> dict:
+    """
+        A clan's year in drops, for its current members
+        Returns the total value and drop count, with the top players, NPCs and items by value
+    """
+    player_ids = get_group_player_ids(group_id)
+    filters = {"partitions": get_year_partitions(year), "player_ids": player_ids}
+    table = scan_drops(columns=["player_id", "npc_id", "item_id", "value", "quantity"], **filters)
+    if table.num_rows == 0:
+        return {"group_id": group_id, "year": year, "total_value": 0, "drops": 0,
+                "top_players": [], "top_npcs": [], "top_items": []}
+    table = _with_total(table)
+    recap = {
+        "group_id": group_id,
+        "year": year,
+        "total_value": pc.sum(table["total"]).as_py() or 0,
+        "drops": table.num_rows,
+    }
+    for key, column in (("top_players", "player_id"), ("top_npcs", "npc_id"), ("top_items", "item_id")):
+        totals = table.group_by(column).aggregate([("total", "sum"), ("total", "count")])
+        totals = totals.sort_by([("total_sum", "descending")]).slice(0, limit)
+        recap[key] = list(zip(totals[column].to_pylist(), totals["total_sum"].to_pylist(), totals["total_count"].to_pylist()))
+    return recap
+
+
+if __name__ == "__main__":
+    ## python -m db.archive_query top-npcs YYYY
+    ## python -m db.archive_query group-recap GROUP_ID YYYY
+    if len(sys.argv) == 3 and sys.argv[1] == "top-npcs":
+        for npc_id, total, count in top_npcs_by_value(int(sys.argv[2])):
+            print(f"npc {npc_id}: {total:,} gp from {count:,} drops")
+    elif len(sys.argv) == 4 and sys.argv[1] == "group-recap":
+        print(group_year_recap(int(sys.argv[2]), int(sys.argv[3])))
+    else:
+        print(f"Usage: python -m db.archive_query top-npcs YYYY | group-recap GROUP_ID YYYY (archive: {DROP_ARCHIVE_DIR})")
@@ -0,0 +1,140 @@
+import os
+import sys
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import func, select
+
+from db.app_logger import AppLogger
+from db.drop_partitions import partition_range
+from db.models import Drop, Session, get_current_partition
+
+"""
+
+    Columnar archive of closed months of drops, for analytics that shouldn't load the live database.
+
+    Each month (partition) that has ended is exported once to {DROP_ARCHIVE_DIR}/drops-{YYYYMM}.parquet,
+    zstd compressed, with the id columns dictionary-encoded. Rows are written sorted by npc_id and
+    player_id, so the row group statistics let readers skip most of a file when filtering on either.
+    See db/archive_query.py for reading them.
+
+"""
+
+app_logger = AppLogger()
+
+DROP_ARCHIVE_DIR = os.getenv("DROP_ARCHIVE_DIR", "data/drop-archive")
+EXPORT_BATCH_SIZE = 50000  # rows fetched from MySQL, and written as one row group
+DICTIONARY_COLUMNS = ["player_id", "npc_id", "item_id"]
+
+ARCHIVE_SCHEMA = pa.schema([
+    ("drop_id", pa.int64()),
+    ("player_id", pa.int32()),
+    ("npc_id", pa.int32()),
+    ("item_id", pa.int32()),
+    ("value", pa.int64()),
+    ("quantity", pa.int32()),
+    ("date_added", pa.timestamp("s")),
+    ("authed", pa.bool_()),
+    ("partition", pa.int32()),
+])
+
+
+def get_archive_path(partition: int) -> str:
+    return os.path.join(DROP_ARCHIVE_DIR, f"drops-{partition}.parquet")
+
+
+def get_archived_partitions():
+    """The YYYYMM of every month that has been archived, oldest first"""
+    if not os.path.isdir(DROP_ARCHIVE_DIR):
+        return []
+    partitions = []
+    for file_name in os.listdir(DROP_ARCHIVE_DIR):
+        if file_name.startswith("drops-") and file_name.endswith(".parquet"):
+            try:
+                partitions.append(int(file_name[6:-8]))
+            except ValueError:
+                continue
+    return sorted(partitions)
+
+
+def export_partition(partition: int, overwrite: bool = False) -> int:
+    """
+        Exports one closed month of drops to Parquet. The file is written under a temporary name
+        and only moved into place once its row count matches the database.
+            Returns the number of rows exported
+    """
+    if partition >= get_current_partition():
+        raise ValueError(f"Partition {partition} hasn't ended yet")
+    path = get_archive_path(partition)
+    if os.path.exists(path) and not overwrite:
+        print(f"Partition {partition} is already archived")
+        return 0
+    os.makedirs(DROP_ARCHIVE_DIR, exist_ok=True)
+    temp_path = path + ".tmp"
+    columns = [Drop.drop_id, Drop.player_id, Drop.npc_id, Drop.item_id, Drop.value,
+               Drop.quantity, Drop.date_added, Drop.authed, Drop.partition]
+    session = Session()
+    exported = 0
+    try:
+        expected = session.query(func.count(Drop.drop_id)).filter(Drop.partition == partition).scalar()
+        result = session.execute(
+            select(*columns).where(Drop.partition == partition)
+            .order_by(Drop.npc_id, Drop.player_id, Drop.drop_id)
+            .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        )
+        with pq.ParquetWriter(temp_path, ARCHIVE_SCHEMA, compression="zstd",
+                              use_dictionary=DICTIONARY_COLUMNS, write_statistics=True) as writer:
+            for batch in result.partitions(EXPORT_BATCH_SIZE):
+                rows = list(zip(*batch))
+                table = pa.Table.from_arrays([
+                    pa.array(column_values, type=field.type)
+                    for column_values, field in zip(rows, ARCHIVE_SCHEMA)
+                ], schema=ARCHIVE_SCHEMA)
+                writer.write_table(table, row_group_size=EXPORT_BATCH_SIZE)
+                exported += table.num_rows
+        if exported != expected:
+            raise ValueError(f"exported {exported} rows but the partition has {expected}")
+        os.replace(temp_path, path)
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        app_logger.log(log_type="error", data=f"Couldn't archive drops partition {partition}: {e}",
+                       app_name="core", description="export_partition")
+        raise
+    finally:
+        session.close()
+    app_logger.log(log_type="access", data=f"Archived {exported} drops from partition {partition} to {path}",
+                   app_name="core", description="export_partition")
+    return exported
+
+
+def archive_closed_partitions():
+    """
+        Exports every ended month that hasn't been archived yet.
+            Returns {partition: rows exported}
+    """
+    session = Session()
+    try:
+        first = session.query(func.min(Drop.partition)).scalar()
+    finally:
+        session.close()
+    current = get_current_partition()
+    if not first or first >= current:
+        return {}
+    archived = set(get_archived_partitions())
+    exported = {}
+    for partition in partition_range(first, current - 1):
+        if partition not in archived:
+            exported[partition] = export_partition(partition)
+    return exported
+
+
+if __name__ == "__main__":
+    ## python -m db.drop_archive [YYYYMM ...] [--overwrite]
+    partitions = [int(arg) for arg in sys.argv[1:] if not arg.startswith("--")]
+    if partitions:
+        for partition in partitions:
+            print(f"{partition}: {export_partition(partition, overwrite='--overwrite' in sys.argv):,} rows")
+    else:
+        for partition, rows in archive_closed_partitions().items():
+            print(f"{partition}: {rows:,} rows")
@@ -0,0 +1,206 @@
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from db.drop_partitions import get_last_partition, next_partition, partition_definitions
+from db.models import engine
+
+"""
+
+    Before/after benchmark for the drops table's layout (see the drops partitioning migration).
+
+    Fills two scratch tables with the same synthetic drops: one laid out like drops was before the
+    migration (single-column indexes, no partitioning) and one laid out like it is after (composite
+    indexes, RANGE partitioned by month), then times the hot query shapes against both.
+
+        python -m db.drop_benchmark populate --rows 50000000
+        python -m db.drop_benchmark run
+        python -m db.drop_benchmark cleanup
+
+"""
+
+FLAT_TABLE = "drops_bench_flat"
+PARTITIONED_TABLE = "drops_bench_partitioned"
+SEQUENCE_TABLE = "drops_bench_seq"
+BATCH_SIZE = 100000  # rows per INSERT ... SELECT
+
+COLUMNS = """
+    drop_id INT NOT NULL AUTO_INCREMENT,
+    item_id INT,
+    player_id INT NOT NULL,
+    date_added DATETIME,
+    npc_id INT,
+    date_updated DATETIME,
+    value INT,
+    quantity INT,
+    image_url VARCHAR(150),
+    authed TINYINT(1) DEFAULT 0,
+    `partition` INT NOT NULL,
+"""
+
+FLAT_DDL = f"""CREATE TABLE {FLAT_TABLE} ({COLUMNS}
+    PRIMARY KEY (drop_id),
+    KEY ix_item_id (item_id),
+    KEY ix_player_id (player_id),
+    KEY ix_date_added (date_added),
+    KEY ix_npc_id (npc_id),
+    KEY ix_partition (`partition`)
+) ENGINE=InnoDB"""
+
+PARTITIONED_DDL = f"""CREATE TABLE {PARTITIONED_TABLE} ({COLUMNS}
+    PRIMARY KEY (drop_id, `partition`),
+    KEY ix_item_id (item_id),
+    KEY ix_date_added (date_added),
+    KEY ix_drops_player_partition (player_id, `partition`, npc_id, item_id, quantity, value),
+    KEY ix_drops_player_date (player_id, date_added),
+    KEY ix_drops_npc_partition (npc_id, `partition`, player_id, quantity, value),
+    KEY ix_drops_partition_item (`partition`, item_id, player_id, npc_id, quantity, value)
+) ENGINE=InnoDB PARTITION BY RANGE (`partition`) ({{partitions}})"""
+
+## The query shapes the bot and API run most; parameters are filled in per run
+QUERIES = {
+    "player month total": (
+        "SELECT SUM(value * quantity) FROM {table} WHERE player_id = :player_id AND `partition` = :partition"
+    ),
+    "player date range": (
+        "SELECT COUNT(*), SUM(value * quantity) FROM {table} "
+        "WHERE player_id = :player_id AND date_added BETWEEN :start AND :end"
+    ),
+    "npc month leaderboard": (
+        "SELECT player_id, SUM(value * quantity) AS total FROM {table} "
+        "WHERE npc_id = :npc_id AND `partition` = :partition GROUP BY player_id ORDER BY total DESC LIMIT 10"
+    ),
+    "month item re-valuation": (
+        "SELECT player_id, item_id, npc_id, SUM(quantity), SUM(value * quantity) FROM {table} "
+        "WHERE `partition` = :partition AND item_id IN (:item_a, :item_b, :item_c) GROUP BY player_id, item_id, npc_id"
+    ),
+    "month drop count": (
+        "SELECT COUNT(*) FROM {table} WHERE `partition` = :partition"
+    ),
+}
+
+
+def get_months(count: int, last: int):
+    months = [last]
+    while len(months) < count:
+        year, month = divmod(months[0], 100)
+        months.insert(0, (year - 1) * 100 + 12 if month == 1 else months[0] - 1)
+    return months
+
+
+def populate(rows: int, players: int, npcs: int, items: int, months: int):
+    """Creates both scratch tables and fills them with the same `rows` synthetic drops"""
+    month_list = get_months(months, get_last_partition(0))
+    cleanup()
+    with engine.begin() as connection:
+        connection.execute(text(FLAT_DDL))
+        connection.execute(text(PARTITIONED_DDL.format(
+            partitions=partition_definitions(month_list[0], next_partition(month_list[-1]))
+        )))
+        ## 0..BATCH_SIZE-1, from a cross join of digits
+        connection.execute(text(f"CREATE TABLE {SEQUENCE_TABLE} (n INT NOT NULL PRIMARY KEY) ENGINE=InnoDB"))
+        digits = " UNION ALL ".join(f"SELECT {digit} AS d" for digit in range(10))
+        joins = ", ".join(f"({digits}) d{i}" for i in range(len(str(BATCH_SIZE - 1))))
+        value = " + ".join(f"d{i}.d * {10 ** i}" for i in range(len(str(BATCH_SIZE - 1))))
+        connection.execute(text(f"INSERT INTO {SEQUENCE_TABLE} (n) SELECT {value} FROM {joins}"))
+
+    first_month = month_list[0]
+    started_at = time.time()
+    for offset in range(0, rows, BATCH_SIZE):
+        batch_rows = min(BATCH_SIZE, rows - offset)
+        ## Pseudo-random but reproducible columns, skewed towards a few heavy players and popular npcs
+        generated = f"""SELECT
+                1 + CRC32(CONCAT('i', n + {offset})) % {items} AS item_id,
+                1 + FLOOR(POW((CRC32(CONCAT('p', n + {offset})) % 1000000) / 1000000, 2) * {players}) AS player_id,
+                DATE_ADD(STR_TO_DATE('{first_month}01', '%Y%m%d'),
+                         INTERVAL (CRC32(CONCAT('m', n + {offset})) % {len(month_list)}) MONTH) AS month_start,
+                1 + FLOOR(POW((CRC32(CONCAT('n', n + {offset})) % 1000000) / 1000000, 3) * {npcs}) AS npc_id,
+                CRC32(CONCAT('v', n + {offset})) % 5000000 AS value,
+                1 + CRC32(CONCAT('q', n + {offset})) % 10 AS quantity
+            FROM {SEQUENCE_TABLE} WHERE n < {batch_rows}"""
+        with engine.begin() as connection:
+            connection.execute(text(
+                f"""INSERT INTO {FLAT_TABLE} (item_id, player_id, date_added, npc_id, date_updated, value, quantity, `partition`)
+                SELECT item_id, player_id,
+                    DATE_ADD(month_start, INTERVAL CRC32(CONCAT('d', player_id, item_id)) % 2419200 SECOND),
+                    npc_id, NOW(), value, quantity, DATE_FORMAT(month_start, '%Y%m') + 0
+                FROM ({generated}) AS generated"""
+            ))
+        print(f"Inserted {offset + batch_rows:,}/{rows:,} rows ({time.time() - started_at:.0f}s)")
+    with engine.begin() as connection:
+        connection.execute(text(f"INSERT INTO {PARTITIONED_TABLE} SELECT * FROM {FLAT_TABLE}"))
+        connection.execute(text(f"ANALYZE TABLE {FLAT_TABLE}, {PARTITIONED_TABLE}"))
+    print(f"Populated both tables with {rows:,} rows in {time.time() - started_at:.0f}s")
+
+
+def get_parameters(connection):
+    """Picks a random player, npc, month and items that actually have drops"""
+    player_id, partition = connection.execute(text(
+        f"SELECT player_id, `partition` FROM {FLAT_TABLE} WHERE drop_id >= :drop_id LIMIT 1"
+    ), {"drop_id": random.randint(1, connection.execute(text(f"SELECT MAX(drop_id) FROM {FLAT_TABLE}")).scalar())}).first()
+    npc_id = connection.execute(text(
+        f"SELECT npc_id FROM {FLAT_TABLE} WHERE player_id = :player_id LIMIT 1"
+    ), {"player_id": player_id}).scalar()
+    year, month = divmod(partition, 100)
+    return {
+        "player_id": player_id,
+        "partition": partition,
+        "npc_id": npc_id,
+        "start": f"{year}-{month:02d}-01",
+        "end": f"{year}-{month:02d}-15",
+        "item_a": random.randint(1, 100),
+        "item_b": random.randint(100, 1000),
+        "item_c": random.randint(1000, 5000),
+    }
+
+
+def run(iterations: int):
+    """Times every query against both tables with the same parameters. Returns {query: {table: median ms}}"""
+    results = {}
+    with engine.connect() as connection:
+        parameter_sets = [get_parameters(connection) for _ in range(iterations)]
+        for name, query in QUERIES.items():
+            results[name] = {}
+            for table in (FLAT_TABLE, PARTITIONED_TABLE):
+                statement = text(query.format(table=table))
+                timings = []
+                for parameters in parameter_sets:
+                    started_at = time.perf_counter()
+                    connection.execute(statement, parameters).fetchall()
+                    timings.append((time.perf_counter() - started_at) * 1000)
+                plan = connection.execute(text("EXPLAIN " + query.format(table=table)), parameter_sets[0]).mappings().first()
+                results[name][table] = statistics.median(timings)
+                print(f"{name:<26} {table:<26} median {results[name][table]:9.2f} ms  " +
+                      f"key={plan.get('key')} partitions={plan.get('partitions')} rows={plan.get('rows')}")
+    print()
+    for name, timings in results.items():
+        before, after = timings[FLAT_TABLE], timings[PARTITIONED_TABLE]
+        print(f"{name:<26} {before:9.2f} ms -> {after:9.2f} ms ({before / after if after else 0:.1f}x)")
+    return results
+
+
+def cleanup():
+    with engine.begin() as connection:
+        for table in (FLAT_TABLE, PARTITIONED_TABLE, SEQUENCE_TABLE):
+            connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the drops table layout before and after partitioning")
+    parser.add_argument("command", choices=["populate", "run", "cleanup"])
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--players", type=int, default=200_000)
+    parser.add_argument("--npcs", type=int, default=1_500)
+    parser.add_argument("--items", type=int, default=30_000)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    if args.command == "populate":
+        populate(args.rows, args.players, args.npcs, args.items, args.months)
+    elif args.command == "run":
+        run(args.iterations)
+    else:
+        cleanup()
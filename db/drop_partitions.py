@@ -0,0 +1,97 @@
+import sys
+
+from sqlalchemy import text
+
+from db.app_logger import AppLogger
+from db.models import engine, get_current_partition
+
+"""
+
+    Storage-level partitioning of the drops table.
+
+    Drops are RANGE partitioned on their `partition` column (YYYYMM), one partition per month,
+    named p{YYYYMM}, plus a catch-all pmax partition. Month-scoped queries are pruned to a single
+    partition, and an old month can be archived or dropped without scanning the rest of the table.
+
+    Partitions are created a few months ahead; maintain_drop_partitions splits the upcoming months
+    out of pmax and should run at least once a month (drops landing in pmax are still stored fine,
+    they just aren't pruned until the month gets its own partition).
+
+"""
+
+app_logger = AppLogger()
+
+PARTITIONS_AHEAD = 3  # months of empty partitions to keep ready
+MAX_PARTITION_NAME = "pmax"
+
+
+def next_partition(partition: int) -> int:
+    year, month = divmod(partition, 100)
+    return (year + 1) * 100 + 1 if month == 12 else partition + 1
+
+
+def partition_range(first: int, last: int):
+    """Every YYYYMM from first to last, inclusive"""
+    partition = first
+    while partition <= last:
+        yield partition
+        partition = next_partition(partition)
+
+
+def partition_name(partition: int) -> str:
+    return f"p{partition}"
+
+
+def partition_definitions(first: int, last: int, include_max: bool = True) -> str:
+    """The PARTITION (...) clauses for the months from first to last"""
+    definitions = [f"PARTITION {partition_name(partition)} VALUES LESS THAN ({next_partition(partition)})"
+                   for partition in partition_range(first, last)]
+    if include_max:
+        definitions.append(f"PARTITION {MAX_PARTITION_NAME} VALUES LESS THAN MAXVALUE")
+    return ", ".join(definitions)
+
+
+def get_last_partition(months_ahead: int = PARTITIONS_AHEAD) -> int:
+    last = get_current_partition()
+    for _ in range(months_ahead):
+        last = next_partition(last)
+    return last
+
+
+def get_existing_partitions(connection, table_name: str = "drops"):
+    """Returns the YYYYMM of each monthly partition the table has, oldest first"""
+    rows = connection.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"table_name": table_name}).fetchall()
+    return [int(name[1:]) for (name,) in rows if name != MAX_PARTITION_NAME]
+
+
+def maintain_drop_partitions(months_ahead: int = PARTITIONS_AHEAD, table_name: str = "drops"):
+    """
+        Splits the next months out of pmax, so there's always a partition ready for upcoming drops.
+            Returns the YYYYMM of the partitions that were added
+    """
+    with engine.begin() as connection:
+        existing = get_existing_partitions(connection, table_name)
+        if not existing:
+            print(f"The {table_name} table isn't partitioned; nothing to maintain")
+            return []
+        last = get_last_partition(months_ahead)
+        if existing[-1] >= last:
+            return []
+        first = next_partition(existing[-1])
+        connection.execute(text(
+            f"ALTER TABLE {table_name} REORGANIZE PARTITION {MAX_PARTITION_NAME} INTO ({partition_definitions(first, last)})"
+        ))
+    added = list(partition_range(first, last))
+    app_logger.log(log_type="access", data=f"Added {table_name} partitions {added[0]} to {added[-1]}",
+                   app_name="core", description="maintain_drop_partitions")
+    return added
+
+
+if __name__ == "__main__":
+    ## python -m db.drop_partitions [months ahead]
+    added = maintain_drop_partitions(int(sys.argv[1]) if len(sys.argv) > 1 else PARTITIONS_AHEAD)
+    print(f"Added {len(added)} partitions" + (f": {added[0]} to {added[-1]}" if added else ""))
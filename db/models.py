@@ -139,19 +139,28 @@ class Drop(Base):
         :param: value
         :param: quantity
         :param: image_url (nullable)
+        The table is RANGE partitioned by month on `partition` (see db/drop_partitions.py), so its
+        primary key is (drop_id, partition) and the foreign keys below only exist for the ORM.
     """
     __tablename__ = 'drops'
     drop_id = Column(Integer, primary_key=True, autoincrement=True)
     item_id = Column(Integer, ForeignKey('items.item_id'), index=True)
-    player_id = Column(Integer, ForeignKey('players.player_id'), index=True, nullable=False)
+    player_id = Column(Integer, ForeignKey('players.player_id'), nullable=False)
     date_added = Column(DateTime, index=True, default=func.now())
-    npc_id = Column(Integer, ForeignKey('npc_list.npc_id'), index=True)
+    npc_id = Column(Integer, ForeignKey('npc_list.npc_id'))
     date_updated = Column(DateTime, onupdate=func.now(), default=func.now())
     value = Column(Integer)
     quantity = Column(Integer)
     image_url = Column(String(150), nullable=True)
     authed = Column(Boolean, default=False)
-    partition = Column(Integer, default=get_current_partition, index=True)
+    partition = Column(Integer, default=get_current_partition, nullable=False)
+
+    __table_args__ = (
+        Index('ix_drops_player_partition', 'player_id', 'partition', 'npc_id', 'item_id', 'quantity', 'value'),
+        Index('ix_drops_player_date', 'player_id', 'date_added'),
+        Index('ix_drops_npc_partition', 'npc_id', 'partition', 'player_id', 'quantity', 'value'),
+        Index('ix_drops_partition_item', 'partition', 'item_id', 'player_id', 'npc_id', 'quantity', 'value'),
+    )
     
     player = relationship("Player", back_populates="drops")
     notified_drops = relationship("NotifiedSubmission", back_populates="drop")
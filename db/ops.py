@@ -14,13 +14,16 @@ import os
 import asyncio
 from datetime import datetime, timedelta
 from db.update_player_total import add_drop_to_ignore, process_drops_batch
+from db.player_index import player_index
+from pb.leaderboards import apply_membership_changes as apply_pb_membership_changes
 from db import models
 from db.xf.recent_submissions import create_xenforo_entry
 from utils.ranking.npc_ranker import check_npc_rank_change_from_drop
 from utils.ranking.rank_checker import check_rank_change_from_drop
 from utils.embeds import get_global_drop_embed
 from utils.download import download_player_image
-from utils.wiseoldman import fetch_group_members, check_user_by_id, check_user_by_username
+from services.image_pipeline import image_pipeline
+from utils.wiseoldman import fetch_group_members, fetch_many_group_memberships, apply_player_renames, cache_group_members, check_user_by_id, check_user_by_username
 from utils.redis import RedisClient, calculate_rank_amongst_groups, get_true_player_total
 from utils.format import format_number, get_extension_from_content_type, parse_redis_data, parse_stored_sheet, replace_placeholders
 from utils.sheets.sheet_manager import SheetManager
@@ -321,39 +324,25 @@ class DatabaseOperations:
             print(f"Error committing new drop to the database: {e}")
             return None
 
-        # Attempt to download the image and update the drop entry
-        if attachment_url and attachment_type:
+        # Queue the image to be downloaded in the background; the drop's image_url is filled in once it's stored
+        if attachment_url and attachment_type and (value * quantity) > 50000:
             try:
-                # Set up the file extension and file name
-                file_extension = get_extension_from_content_type(attachment_type)
-                file_name = f"{item_id}_{npc_id}_{newdrop.drop_id}"  # Create a unique file name
-
                 player = session.query(Player).filter(Player.player_id == player_id).first()
                 if player:
-                    # Download the image and update the drop with the image URL
-                    if (value * quantity) > 50000:
-                        dl_path, external_url = await download_player_image(
-                            submission_type="drop",
-                            file_name=str(file_name),
-                            player=player,
-                            attachment_url=str(attachment_url),
-                            file_extension=str(file_extension),
-                            entry_id=str(newdrop.drop_id),
-                            entry_name=str(item_id),
-                            npc_name=str(npc_id)
-                        )
-                    
-                        # Update the image URL in the drop entry
-                        newdrop.image_url = external_url
-                        #print(f"Image downloaded and URL set: {external_url}")
-
-                        # Commit the updated drop to the database
-                        session.commit()
+                    image_pipeline.enqueue(
+                        submission_type="drop",
+                        entry_id=newdrop.drop_id,
+                        player=player,
+                        attachment_url=attachment_url,
+                        attachment_type=attachment_type,
+                        entry_name=item_id,
+                        npc_name=npc_id,
+                        store_as="url"
+                    )
                 else:
                     print("Player not found.")
             except Exception as e:
-                print(f"Couldn't download the image: {e}")
-                session.rollback()
+                print(f"Couldn't queue the image: {e}")
 
         # Create notification entries for this drop
         drop_value = value * quantity
@@ -399,6 +388,7 @@ class DatabaseOperations:
                     'player_name': player_name,
                     'player_id': player_id,
                     'image_url': newdrop.image_url,
+                    'image_ref': image_pipeline.ref("drop", newdrop.drop_id),
                     'attachment_type': attachment_type
                 }
                 
@@ -827,90 +817,200 @@ async def notify_group(bot: interactions.Client, type: str, group: Group, member
         else:
             print(f"Channel not found for ID: {channel_id}")
 
+GLOBAL_GROUP_ID = 2
+MEMBERSHIP_CHUNK_SIZE = 1000
+
+def _chunks(values, size: int = MEMBERSHIP_CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def _get_current_memberships(group_ids):
+    """Returns {group_id: set of player_ids} from the association table"""
+    memberships = {group_id: set() for group_id in group_ids}
+    for chunk in _chunks(group_ids):
+        rows = session.query(user_group_association.c.group_id, user_group_association.c.player_id).filter(
+            user_group_association.c.group_id.in_(chunk),
+            user_group_association.c.player_id.isnot(None)
+        ).all()
+        for group_id, player_id in rows:
+            memberships[group_id].add(player_id)
+    return memberships
+
+def _add_memberships(additions):
+    """
+        Inserts player (and their user's) associations for a list of (group_id, player_id) pairs,
+        mirroring Player.add_group
+    """
+    if not additions:
+        return
+    session.execute(user_group_association.insert(), [{"player_id": player_id, "group_id": group_id}
+                                                      for group_id, player_id in additions])
+    user_ids = {}
+    for chunk in _chunks({player_id for _, player_id in additions}):
+        for player_id, user_id in session.query(Player.player_id, Player.user_id).filter(
+                Player.player_id.in_(chunk), Player.user_id.isnot(None)).all():
+            user_ids[player_id] = user_id
+    wanted = {(group_id, user_ids[player_id]) for group_id, player_id in additions if player_id in user_ids}
+    if not wanted:
+        return
+    existing = set()
+    for chunk in _chunks({user_id for _, user_id in wanted}):
+        existing.update(session.query(user_group_association.c.group_id, user_group_association.c.user_id).filter(
+            user_group_association.c.user_id.in_(chunk),
+            user_group_association.c.player_id.is_(None)
+        ).all())
+    missing = wanted - {(group_id, user_id) for group_id, user_id in existing}
+    if missing:
+        session.execute(user_group_association.insert(), [{"user_id": user_id, "group_id": group_id}
+                                                          for group_id, user_id in missing])
+
 async def update_group_members(bot: interactions.Client, forced_id: int = None):
+    """
+        Reconciles every group's member associations with its WiseOldMan group.
+        All groups are fetched concurrently (paced by the WOM limiter), memberships are diffed as sets,
+        and the adds/removes/renames are applied in bulk before the groups are notified of the changes.
+        :param: forced_id: only reconcile the group with this WOM ID
+    """
     app_logger.log(log_type="access", data="Updating group member association tables...", app_name="core", description="update_group_members")
+    group_query = session.query(Group.group_id, Group.wom_id, Group.group_name)
     if forced_id:
-        group_ids = [forced_id]
-    else:
-        # Use scalar_subquery to get just the values
-        group_ids = session.scalars(session.query(Group.wom_id)).all()
-    total_updated = 0
-    for wom_id in group_ids:
-        # wom_id should now be a simple integer
-        #app_logger.log(log_type="access", data=f"Processing WOM ID: {wom_id}", app_name="core", description="update_group_members")
+        group_query = group_query.filter(Group.wom_id == forced_id)
+    groups = {}
+    for group_id, wom_id, group_name in group_query.all():
         try:
-            wom_id = int(wom_id)
-        except (ValueError, TypeError) as e:
-            #app_logger.log(log_type="error", data=f"Error converting WOM ID to int: {e} - womid: {wom_id} (type: {type(wom_id)})", app_name="core", description="update_group_members")
+            groups[group_id] = (int(wom_id), group_name)
+        except (ValueError, TypeError):
             continue
-        group: Group = session.query(Group).filter(Group.wom_id == wom_id).first()
-        if group:
-            group_wom_ids = await fetch_group_members(wom_id)
-            #app_logger.log(log_type="ex_info", data=f"Group WOM IDs: {group_wom_ids}", app_name="core", description="update_group_members")
-                
-            # Only proceed with member updates if we successfully got the member list
-            if group_wom_ids:
-                # Get current group members from database
-                group_members = session.query(Player).filter(Player.wom_id.in_(group_wom_ids)).all()
-                # Remove members no longer in the group
-                app_logger.log(log_type="info", data=f"Found {len(group_members)} from our database in {group.group_name}", app_name="core", description="update_group_members")
-                for member in group.players:
-                    if member.wom_id and member.wom_id not in group_wom_ids:
-                        member = session.query(Player).filter(Player.player_id == member.player_id).first()
-                        app_logger.log(log_type="access", data=f"{member.player_name} has been removed from {group.group_name}", app_name="core", description="update_group_members")
-                        member.remove_group(group)
-                        try:
-                            await notify_group(bot, "player_removed", group, member)
-                        except Exception as e:
-                            app_logger.log(log_type="error", data=f"Couldn't notify {group.group_name} that {member.player_name} has been removed: {e}", app_name="core", description="update_group_members")
-                
-                # Add new members to the group
-                for member in group_members:
-                    if member not in group.players:
-                        if member.user:
-                            member.user.add_group(group)
-                        member.add_group(group)
-                        member = session.query(Player).filter(Player.player_id == member.player_id).first()
-                        try:
-                            await notify_group(bot, "player_added", group, member)
-                        except Exception as e:
-                            pass
-                group.date_updated = func.now()
-                try:
-                    session.commit()
-                except Exception as e:
-                    session.rollback()
+
+    memberships = await fetch_many_group_memberships({wom_id for wom_id, _ in groups.values() if wom_id != 1})
+    added = []
+    removed = []
+    try:
+        ## Renames for every fetched group at once
+        all_names = {}
+        for members in memberships.values():
+            if members:
+                all_names.update(members)
+        apply_player_renames(all_names, session)
+
+        player_ids_by_wom = player_index.get_player_ids(all_names.keys(), session_to_use=session)
+        synced_group_ids = [group_id for group_id, (wom_id, _) in groups.items()
+                            if wom_id == 1 or memberships.get(wom_id)]
+        for group_id, (wom_id, group_name) in groups.items():
+            if group_id not in synced_group_ids:
+                print(f"Failed to fetch member list for group {group_name} (WOM ID: {wom_id})")
+        for wom_id, members in memberships.items():
+            if members:
+                cache_group_members(wom_id, members.keys())
+        current_members = _get_current_memberships(synced_group_ids)
+        players_with_wom_id = None
+
+        for group_id in synced_group_ids:
+            wom_id, group_name = groups[group_id]
+            if wom_id == 1:
+                ## WOM ID 1 stands for every player we track
+                if players_with_wom_id is None:
+                    players_with_wom_id = {player_id for (player_id,) in session.query(Player.player_id).filter(Player.wom_id.isnot(None)).all()}
+                desired = players_with_wom_id
             else:
-                print(f"Failed to fetch member list for group {group.group_name} (WOM ID: {wom_id})")
-        else:
-            print("Group not found for wom_id", wom_id)
+                desired = {player_ids_by_wom[member_wom_id] for member_wom_id in memberships[wom_id]
+                           if member_wom_id in player_ids_by_wom}
+            current = current_members[group_id]
+            added.extend((group_id, player_id) for player_id in desired - current)
+            ## Only members that are linked to a WOM account can be removed by a WOM refresh
+            removed.extend((group_id, player_id) for player_id in current - desired)
+        if removed:
+            linked_ids = set()
+            for chunk in _chunks({player_id for _, player_id in removed}):
+                linked_ids.update(player_id for (player_id,) in session.query(Player.player_id).filter(
+                    Player.player_id.in_(chunk), Player.wom_id.isnot(None)).all())
+            removed = [(group_id, player_id) for group_id, player_id in removed if player_id in linked_ids]
+
+        app_logger.log(log_type="info", data=f"Group sync: {len(added)} members added and {len(removed)} removed across {len(synced_group_ids)} groups",
+                       app_name="core", description="update_group_members")
+        removed_by_group = {}
+        for group_id, player_id in removed:
+            removed_by_group.setdefault(group_id, []).append(player_id)
+        for group_id, player_ids in removed_by_group.items():
+            for chunk in _chunks(player_ids):
+                session.execute(user_group_association.delete().where(
+                    user_group_association.c.group_id == group_id,
+                    user_group_association.c.player_id.in_(chunk)
+                ))
+        _add_memberships(added)
+        if synced_group_ids:
+            session.query(Group).filter(Group.group_id.in_(synced_group_ids)).update(
+                {Group.date_updated: func.now()}, synchronize_session=False
+            )
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        app_logger.log(log_type="error", data=f"Couldn't reconcile group members: {e}", app_name="core", description="update_group_members")
+        return
 
-    ## Update the global group
-    player_ids = session.query(Player.player_id).all()
-    for player_id in player_ids:
-        player = session.query(Player).filter(Player.player_id == player_id).first()
-        if player:
-            if 2 not in [group.group_id for group in player.groups]:
-                player.add_group(session.query(Group).filter(Group.group_id == 2).first())
-                session.commit()
+    try:
+        apply_pb_membership_changes(added, removed, session_to_use=session)
+    except Exception as e:
+        app_logger.log(log_type="error", data=f"Couldn't update the PB leaderboards' members: {e}", app_name="core", description="update_group_members")
+
+    ## Only the changes are sent on to the groups
+    await _notify_membership_changes(bot, added, removed)
+
+    if not forced_id:
+        _sync_global_group()
+
+async def _notify_membership_changes(bot: interactions.Client, added, removed):
+    changes = [("player_added", group_id, player_id) for group_id, player_id in added] + \
+              [("player_removed", group_id, player_id) for group_id, player_id in removed]
+    if not changes:
+        return
+    group_objs = {group.group_id: group for group in session.query(Group).filter(
+        Group.group_id.in_({group_id for _, group_id, _ in changes})).all()}
+    players = {}
+    for chunk in _chunks({player_id for _, _, player_id in changes}):
+        players.update({player.player_id: player for player in session.query(Player).filter(Player.player_id.in_(chunk)).all()})
+    for change_type, group_id, player_id in changes:
+        group = group_objs.get(group_id)
+        member = players.get(player_id)
+        if not group or not member:
+            continue
+        if change_type == "player_removed":
+            app_logger.log(log_type="access", data=f"{member.player_name} has been removed from {group.group_name}", app_name="core", description="update_group_members")
+        try:
+            await notify_group(bot, change_type, group, member)
+        except Exception as e:
+            app_logger.log(log_type="error", data=f"Couldn't notify {group.group_name} of {change_type} for {member.player_name}: {e}", app_name="core", description="update_group_members")
+
+def _sync_global_group():
+    """Makes sure every player is a member of the global group"""
+    try:
+        all_player_ids = {player_id for (player_id,) in session.query(Player.player_id).all()}
+        current = _get_current_memberships([GLOBAL_GROUP_ID])[GLOBAL_GROUP_ID]
+        _add_memberships([(GLOBAL_GROUP_ID, player_id) for player_id in all_player_ids - current])
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        app_logger.log(log_type="error", data=f"Couldn't sync the global group: {e}", app_name="core", description="update_group_members")
 
 async def associate_player_ids(player_wom_ids, before_date: datetime = None, session_to_use = None):
-    # Query the database for all players' WOM IDs and Player IDs
+    """
+        Returns the Player IDs of our players whose WOM IDs are in `player_wom_ids`,
+        using the cached index in db.player_index
+    """
+    if player_wom_ids is None:
+        return []
     if session_to_use is not None:
         session = session_to_use
     else:
         session = models.session
-    if before_date:
-        all_players = session.query(Player.wom_id, Player.player_id).filter(Player.date_added < before_date).all()
-    else:
-        all_players = session.query(Player.wom_id, Player.player_id).all()
-    if player_wom_ids is None:
-        return []
-    all_players = [player for player in all_players if player.player_id != None and player.wom_id != None]
-    # Create a mapping of WOM ID to Player ID
-    db_wom_to_ids = [{"wom": player.wom_id, "id": player.player_id} for player in all_players]
-    
-    # Filter out the Player IDs where the WOM ID matches any of the given `player_wom_ids`
-    matched_ids = [player['id'] for player in db_wom_to_ids if player['wom'] in player_wom_ids]
-    
-    return matched_ids
+    player_ids = player_index.get_player_ids(player_wom_ids, session_to_use=session)
+    if before_date and player_ids:
+        ## Rarely used; narrow the matches down to players added before the given date
+        matched_ids = []
+        candidate_ids = list(player_ids.values())
+        for chunk in _chunks(candidate_ids):
+            matched_ids.extend(player_id for (player_id,) in session.query(Player.player_id).filter(
+                Player.player_id.in_(chunk), Player.date_added < before_date).all())
+        return matched_ids
+    return list(player_ids.values())
@@ -0,0 +1,126 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession, object_session
+
+from db.models import Player, Session
+from utils.redis import redis_client
+
+"""
+
+    Cached WiseOldMan ID -> Player ID index, used to map WOM group member lists to our players.
+
+    Each process keeps its own dict, along with the WOM IDs that are known not to belong to a player
+    (most members of a WOM group aren't tracked). A WOM ID's player never changes once it exists, so
+    the only entries that can go stale are those negative ones: creating a player appends its WOM ID
+    to a shared log in Redis (a zset scored by a sequence number), and every process drops just the
+    logged WOM IDs from its `unknown` set on its next lookup. A process that fell further behind than
+    the log keeps clears its whole `unknown` set instead.
+
+"""
+
+CREATED_KEY = "player_index:created"  # zset: wom_id -> sequence number it was logged at
+SEQUENCE_KEY = "player_index:sequence"
+CREATED_LOG_SIZE = 10000
+QUERY_CHUNK_SIZE = 1000
+
+## Appends WOM IDs to the created log atomically, so readers never see a sequence number before its entry
+LOG_CREATED_SCRIPT = """
+for i, wom_id in ipairs(ARGV) do
+    local sequence = redis.call('INCR', KEYS[2])
+    redis.call('ZADD', KEYS[1], sequence, wom_id)
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -%d - 1)
+return redis.call('GET', KEYS[2])
+""" % CREATED_LOG_SIZE
+
+
+class PlayerIndex:
+    def __init__(self):
+        self.player_ids = {}  # wom_id -> player_id
+        self.unknown = set()  # wom_ids that had no player the last time they were looked up
+        self.sequence = None  # last entry of the created log applied to `unknown`
+        self._log_script = None
+
+    def _apply_created(self):
+        """Forgets the WOM IDs players were created for since the last lookup"""
+        try:
+            sequence = int(redis_client.client.get(SEQUENCE_KEY) or 0)
+            if self.sequence is None or sequence < self.sequence:
+                ## First lookup, or the log was reset: start from a clean copy
+                self.unknown = set()
+            elif sequence > self.sequence:
+                oldest = redis_client.client.zrange(CREATED_KEY, 0, 0, withscores=True)
+                if not oldest or oldest[0][1] > self.sequence + 1:
+                    ## Part of what we missed has been trimmed from the log
+                    self.unknown = set()
+                else:
+                    created = redis_client.client.zrangebyscore(CREATED_KEY, f"({self.sequence}", sequence)
+                    self.unknown.difference_update(int(wom_id) for wom_id in created)
+            self.sequence = sequence
+        except Exception as e:
+            print(f"Couldn't read the player index log: {e}")
+            self.unknown = set()
+
+    def player_created(self, wom_ids):
+        """Logs newly created players' WOM IDs, so no process keeps them cached as unknown"""
+        wom_ids = [int(wom_id) for wom_id in wom_ids if wom_id is not None]
+        self.unknown.difference_update(wom_ids)
+        if not wom_ids:
+            return
+        try:
+            if self._log_script is None:
+                self._log_script = redis_client.client.register_script(LOG_CREATED_SCRIPT)
+            self._log_script(keys=[CREATED_KEY, SEQUENCE_KEY], args=wom_ids)
+        except Exception as e:
+            print(f"Couldn't log created players in the player index: {e}")
+
+    def invalidate(self):
+        """Drops this process' copy of the index"""
+        self.player_ids = {}
+        self.unknown = set()
+
+    def get_player_ids(self, wom_ids, session_to_use=None) -> dict:
+        """
+            Returns {wom_id: player_id} for the WOM IDs that belong to one of our players.
+            WOM IDs that haven't been seen yet are looked up with chunked IN (...) queries.
+        """
+        self._apply_created()
+        wom_ids = {int(wom_id) for wom_id in wom_ids if wom_id is not None}
+        missing = [wom_id for wom_id in wom_ids if wom_id not in self.player_ids and wom_id not in self.unknown]
+        if missing:
+            session = session_to_use if session_to_use is not None else Session()
+            try:
+                for i in range(0, len(missing), QUERY_CHUNK_SIZE):
+                    chunk = missing[i:i + QUERY_CHUNK_SIZE]
+                    rows = session.query(Player.wom_id, Player.player_id).filter(Player.wom_id.in_(chunk)).all()
+                    for wom_id, player_id in rows:
+                        self.player_ids[wom_id] = player_id
+                    self.unknown.update(wom_id for wom_id in chunk if wom_id not in self.player_ids)
+            finally:
+                if session_to_use is None:
+                    session.close()
+        return {wom_id: self.player_ids[wom_id] for wom_id in wom_ids if wom_id in self.player_ids}
+
+
+player_index = PlayerIndex()
+
+
+## Players are created from several places (submissions, commands, the API); catch them all here.
+## The WOM IDs are only logged once the new player is committed, so that another process
+## can't re-cache them as unknown in between.
+@event.listens_for(Player, "after_insert")
+def mark_player_created(mapper, connection, target):
+    session = object_session(target)
+    if session is not None and target.wom_id is not None:
+        session.info.setdefault("player_index_created", []).append(target.wom_id)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def log_created_players(session):
+    created = session.info.pop("player_index_created", None)
+    if created:
+        player_index.player_created(created)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def discard_created_players(session):
+    session.info.pop("player_index_created", None)
@@ -0,0 +1,213 @@
+import asyncio
+import sys
+from collections import defaultdict
+
+from sqlalchemy import func, select
+
+from db.app_logger import AppLogger
+from db.models import Drop, ItemList, Session, get_current_partition, user_group_association
+from utils.ge_value import get_most_recent_price_by_id, get_true_item_value, price_snapshot
+from utils.keys import determine_key
+from utils.redis import redis_client
+
+"""
+
+    Re-values a partition's drops against the current GE price snapshot.
+
+    Values are recomputed once per item (rather than once per drop), the per-player deltas are
+    aggregated in SQL, and the corrections are applied to the player's Redis aggregates as
+    increments in a handful of pipelines -- so a month's totals can be corrected without
+    force-rebuilding every player through update_player_in_redis.
+
+"""
+
+app_logger = AppLogger()
+
+PIPELINE_BATCH_SIZE = 1000
+PLAYER_CHUNK_SIZE = 1000
+
+
+async def get_revalued_prices(item_rows, reprice_tradeables: bool = False):
+    """
+        Returns {item_id: new unit value} for the items whose value should change.
+        Items valued by get_true_item_value's component rules (vestiges, hydra parts, etc.) are always
+        re-valued; plain tradeables are only re-priced to their latest price if reprice_tradeables is set.
+    """
+    new_values = {}
+    for item_id, item_name in item_rows:
+        if not item_name:
+            continue
+        new_value = await get_true_item_value(item_name, None)
+        if new_value is None and reprice_tradeables:
+            new_value = await get_most_recent_price_by_id(item_id)
+        if new_value is not None:
+            new_values[item_id] = max(int(new_value), 0)
+    return new_values
+
+
+def get_player_groups(session, player_ids):
+    player_groups = defaultdict(list)
+    player_ids = list(player_ids)
+    for i in range(0, len(player_ids), PLAYER_CHUNK_SIZE):
+        rows = session.query(user_group_association.c.player_id, user_group_association.c.group_id).filter(
+            user_group_association.c.player_id.in_(player_ids[i:i + PLAYER_CHUNK_SIZE]),
+            user_group_association.c.group_id.isnot(None)
+        ).all()
+        for player_id, group_id in rows:
+            player_groups[player_id].append(group_id)
+    return player_groups
+
+
+def apply_redis_deltas(partition, player_deltas, player_groups):
+    """
+        Applies the value corrections to the same aggregates update_player_in_redis maintains,
+        for both the partition and all-time totals.
+        :param: player_deltas: {player_id: {'total': int, 'items': {item_id: int}, 'npcs': {npc_id: int}}}
+    """
+    ## total_items values are stored as "qty,value" strings, so they have to be read before being corrected
+    item_fields = [(player_id, scope, item_id)
+                   for player_id, deltas in player_deltas.items()
+                   for scope in (partition, "all")
+                   for item_id in deltas['items']]
+    existing_items = []
+    for i in range(0, len(item_fields), PIPELINE_BATCH_SIZE):
+        pipeline = redis_client.client.pipeline(transaction=False)
+        for player_id, scope, item_id in item_fields[i:i + PIPELINE_BATCH_SIZE]:
+            pipeline.hget(f"player:{player_id}:{scope}:total_items", str(item_id))
+        existing_items.extend(pipeline.execute())
+
+    pipeline = redis_client.client.pipeline(transaction=False)
+    pipeline_count = 0
+    for (player_id, scope, item_id), raw_value in zip(item_fields, existing_items):
+        if not raw_value:
+            continue
+        try:
+            qty, value = map(int, raw_value.decode('utf-8').split(','))
+        except ValueError:
+            continue
+        new_item_value = max(value + player_deltas[player_id]['items'][item_id], 0)
+        pipeline.hset(f"player:{player_id}:{scope}:total_items", str(item_id), f"{qty},{new_item_value}")
+        if scope == "all":
+            pipeline.zadd(determine_key(item_id=item_id), {player_id: new_item_value})
+            for group_id in player_groups.get(player_id, []):
+                pipeline.zadd(determine_key(item_id=item_id, group_id=group_id), {player_id: new_item_value})
+        pipeline_count += 1
+        if pipeline_count >= PIPELINE_BATCH_SIZE:
+            pipeline.execute()
+            pipeline_count = 0
+
+    for player_id, deltas in player_deltas.items():
+        group_ids = player_groups.get(player_id, [])
+        for scope in (partition, None):
+            scope_name = scope or "all"
+            pipeline.incrby(f"player:{player_id}:{scope_name}:total_loot", deltas['total'])
+            pipeline.zincrby(determine_key(partition=scope), deltas['total'], player_id)
+            for group_id in group_ids:
+                pipeline.zincrby(determine_key(partition=scope, group_id=group_id), deltas['total'], player_id)
+            for npc_id, npc_delta in deltas['npcs'].items():
+                pipeline.hincrby(f"player:{player_id}:{scope_name}:npc_totals", str(npc_id), npc_delta)
+                pipeline.zincrby(determine_key(npc_id=npc_id, partition=scope), npc_delta, player_id)
+                for group_id in group_ids:
+                    pipeline.zincrby(determine_key(npc_id=npc_id, partition=scope, group_id=group_id), npc_delta, player_id)
+        pipeline_count += 1
+        if pipeline_count >= PIPELINE_BATCH_SIZE:
+            pipeline.execute()
+            pipeline_count = 0
+    pipeline.execute()
+
+
+async def revalue_partition(partition: int = None, item_ids=None, reprice_tradeables: bool = False, dry_run: bool = False):
+    """
+        Re-values the drops stored in a partition against the current price snapshot.
+        :param: partition: YYYYMM partition to re-value, defaults to the current month
+        :param: item_ids: only re-value these items
+        :param: reprice_tradeables: also re-price tradeable items to their latest GE price
+        :param: dry_run: only report the deltas, without storing anything
+            Returns a report of the deltas per item, per player and in total
+    """
+    partition = partition or get_current_partition()
+    price_snapshot.load()
+    session = Session()
+    try:
+        item_query = session.query(ItemList.item_id, ItemList.item_name).filter(
+            ItemList.item_id.in_(select(Drop.item_id).where(Drop.partition == partition).distinct())
+        )
+        if item_ids:
+            item_query = item_query.filter(ItemList.item_id.in_(item_ids))
+        new_values = await get_revalued_prices(item_query.all(), reprice_tradeables)
+        report = {'partition': partition, 'items': {}, 'players': {}, 'total_delta': 0}
+        if not new_values:
+            return report
+
+        ## One row per player/item/npc: everything needed to re-value their drops at once
+        rows = session.query(
+            Drop.player_id, Drop.item_id, Drop.npc_id,
+            func.sum(Drop.quantity), func.sum(Drop.value * Drop.quantity)
+        ).filter(
+            Drop.partition == partition,
+            Drop.item_id.in_(list(new_values.keys()))
+        ).group_by(Drop.player_id, Drop.item_id, Drop.npc_id).all()
+
+        player_deltas = {}
+        for player_id, item_id, npc_id, quantity, old_total in rows:
+            delta = int(quantity or 0) * new_values[item_id] - int(old_total or 0)
+            item_report = report['items'].setdefault(item_id, {'new_value': new_values[item_id], 'quantity': 0, 'delta': 0})
+            item_report['quantity'] += int(quantity or 0)
+            item_report['delta'] += delta
+            if delta == 0:
+                continue
+            deltas = player_deltas.setdefault(player_id, {'total': 0, 'items': defaultdict(int), 'npcs': defaultdict(int)})
+            deltas['total'] += delta
+            deltas['items'][item_id] += delta
+            deltas['npcs'][npc_id] += delta
+        report['players'] = {player_id: deltas['total'] for player_id, deltas in player_deltas.items()}
+        report['total_delta'] = sum(report['players'].values())
+
+        if dry_run or not player_deltas:
+            return report
+
+        changed_items = [item_id for item_id, item_report in report['items'].items() if item_report['delta'] != 0]
+        for item_id in changed_items:
+            session.query(Drop).filter(
+                Drop.partition == partition,
+                Drop.item_id == item_id
+            ).update({Drop.value: new_values[item_id]}, synchronize_session=False)
+        session.commit()
+
+        player_groups = get_player_groups(session, player_deltas.keys())
+        apply_redis_deltas(partition, player_deltas, player_groups)
+        app_logger.log(log_type="access", data=f"Re-valued {len(changed_items)} items in partition {partition} " +
+                       f"for {len(player_deltas)} players, total delta {report['total_delta']}",
+                       app_name="core", description="revalue_partition")
+        return report
+    except Exception as e:
+        session.rollback()
+        app_logger.log(log_type="error", data=f"Couldn't re-value partition {partition}: {e}",
+                       app_name="core", description="revalue_partition")
+        raise
+    finally:
+        session.close()
+
+
+def format_report(report: dict, limit: int = 15):
+    lines = [f"Partition {report['partition']}: total delta {report['total_delta']:,} gp"]
+    items = sorted(report['items'].items(), key=lambda entry: abs(entry[1]['delta']), reverse=True)
+    for item_id, item_report in items[:limit]:
+        lines.append(f"  item {item_id}: {item_report['quantity']:,} @ {item_report['new_value']:,} gp -> {item_report['delta']:+,} gp")
+    players = sorted(report['players'].items(), key=lambda entry: abs(entry[1]), reverse=True)
+    lines.append(f"  {len(players)} players affected")
+    for player_id, delta in players[:limit]:
+        lines.append(f"  player {player_id}: {delta:+,} gp")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    ## python -m db.revaluation [partition] [--all] [--dry-run]
+    ## The price snapshot on disk (see utils.ge_value) is used as-is; run it after a refresh.
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    report = asyncio.run(revalue_partition(
+        partition=int(args[0]) if args else None,
+        reprice_tradeables="--all" in sys.argv,
+        dry_run="--dry-run" in sys.argv
+    ))
+    print(format_report(report))
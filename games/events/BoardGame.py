@@ -1,4 +1,3 @@
-from collections import Counter
 import json
 import random
 import time
@@ -20,6 +19,8 @@ import os
 from dotenv import load_dotenv
 from games.events.event import Event as BaseEvent, EventType
 from games.events.utils.classes.base import Task, Team, Tile, TileType, TaskItem, ShopItem, ShopItemType
+from games.events.utils.state_store import GameStateStore, turns_expiry
+from games.events.utils.task_index import TaskMatcher, TaskProgress, get_requirements, normalize_item_name
 
 
 default_tasks_raw = json.load(open("games/events/task_store/default.json"))
@@ -67,6 +68,12 @@ class BoardGame(BaseEvent):
         
         # Initialize board game specific attributes
         self.tiles = {}
+        self.shop_items = []
+        self.current_team_index = 0
+        self.state_store = GameStateStore(self.event_id)
+        self.task_matcher = TaskMatcher()
+        # A drop that meets a task's last requirement finishes it right away
+        self.task_matcher.on_complete.append(self.complete_task)
         self.tasks = self._load_tasks()
         #self.load_config()
         
@@ -137,19 +144,26 @@ class BoardGame(BaseEvent):
             EventShopItem.event_id == self.event_id
         ).all()
         
-        items = []
-        for db_item in db_items:
-            item = ShopItem(
-                name=db_item.name,
-                cost=db_item.quantity,  # Using quantity as cost
-                effect=db_item.description or "",
-                emoji="🔮",  # Default emoji
-                item_type=ShopItemType(db_item.type),
-                cooldown=db_item.cooldown
-            )
-            items.append(item)
+        return [self._shop_item_from_db(db_item) for db_item in db_items]
+    
+    def _shop_item_from_db(self, db_item: EventShopItem) -> ShopItem:
+        """
+        Build a shop item from its event_items row
         
-        return items
+        Args:
+            db_item: The EventShopItem row
+            
+        Returns:
+            The ShopItem
+        """
+        return ShopItem(
+            name=db_item.name,
+            cost=db_item.cost,
+            effect=db_item.effect or db_item.description or "",
+            emoji=db_item.emoji or "🔮",  # Default emoji
+            item_type=ShopItemType(db_item.item_type),
+            cooldown=db_item.cooldown or 0
+        )
     
     def _load_tasks(self) -> List[Task]:
         """
@@ -179,6 +193,7 @@ class BoardGame(BaseEvent):
                 parsed_tasks = self._parse_tasks(tasks)
                 self.tasks = parsed_tasks
                 print(f"Loaded {len(parsed_tasks)} tasks")
+                return self.tasks
         except Exception as e:
             print(f"Error loading tasks: {e}")
             return []
@@ -290,7 +305,7 @@ class BoardGame(BaseEvent):
                 if task_data.get("name") == "The Fremennik":
                     print("Required items is a list: ", required_items)
                 required_items = [
-                    TaskItem(name=item.get("item_name", ""), points=item.get("points", 1))
+                    TaskItem(name=item.get("item_name", ""), points=item.get("points", 1), quantity=item.get("quantity", 1))
                     for item in required_items
                 ]
             elif isinstance(required_items, dict):
@@ -299,7 +314,8 @@ class BoardGame(BaseEvent):
                     print("Required items is a dict: ", required_items)
                 required_items = TaskItem(
                     name=required_items.get("item_name", ""),
-                    points=required_items.get("points", 1)
+                    points=required_items.get("points", 1),
+                    quantity=required_items.get("quantity", 1)
                 )
             
             task = Task(
@@ -360,15 +376,7 @@ class BoardGame(BaseEvent):
                 db_item = session.query(EventShopItem).get(inv_item.item_id)
                 if db_item:
                     for _ in range(inv_item.quantity):
-                        item = ShopItem(
-                            name=db_item.name,
-                            cost=db_item.quantity,  # Using quantity as cost
-                            effect=db_item.description or "",
-                            emoji="🔮",  # Default emoji
-                            item_type=ShopItemType(db_item.type),
-                            cooldown=db_item.cooldown
-                        )
-                        team.inventory.append(item)
+                        team.inventory.append(self._shop_item_from_db(db_item))
             
             self.teams.append(team)
     
@@ -538,6 +546,25 @@ class BoardGame(BaseEvent):
             "cooldown": item.cooldown
         }
     
+    def _deserialize_item(self, item_data: Dict[str, Any]) -> ShopItem:
+        """
+        Deserialize an item object
+        
+        Args:
+            item_data: Dictionary representation of item
+            
+        Returns:
+            The ShopItem
+        """
+        return ShopItem(
+            name=item_data["name"],
+            cost=item_data["cost"],
+            effect=item_data["effect"],
+            emoji=item_data["emoji"],
+            item_type=ShopItemType(item_data["item_type"]),
+            cooldown=item_data["cooldown"]
+        )
+    
     def _serialize_task(self, task: Task) -> Dict[str, Any]:
         """
         Serialize a task object
@@ -618,15 +645,7 @@ class BoardGame(BaseEvent):
             
             # Restore inventory
             for item_data in team_data.get("inventory", []):
-                item = ShopItem(
-                    name=item_data["name"],
-                    cost=item_data["cost"],
-                    effect=item_data["effect"],
-                    emoji=item_data["emoji"],
-                    item_type=ShopItemType(item_data["item_type"]),
-                    cooldown=item_data["cooldown"]
-                )
-                team.inventory.append(item)
+                team.inventory.append(self._deserialize_item(item_data))
             
             # Restore cooldowns and effects
             team.cooldowns = team_data.get("cooldowns", {})
@@ -665,75 +684,37 @@ class BoardGame(BaseEvent):
         
         return game
     
-    def save_game_state(self):
+    def _get_game_state(self) -> Dict[str, Any]:
         """
-        Save the current game state to the database
+        The game-level state that is versioned in the database (teams are stored in their own rows)
         """
-        try:
-            # Convert tiles to dictionaries for JSON serialization
-            tiles_dict = []
-            for tile in self.tiles:
-                # Convert Tile object to dictionary
-                # Handle TileType enum by converting to string
-                tile_dict = {
-                    "position": tile.position,
-                    "type": tile.type.name if hasattr(tile.type, 'name') else tile.type
-                }
-                tiles_dict.append(tile_dict)
-            
-            # Save basic game state
-            game_state = {
-                "tiles": tiles_dict,
-                "shop_items": self.shop_items,
-                "current_turn": self.current_turn
+        # Convert tiles to dictionaries for JSON serialization
+        # Handle TileType enum by converting to string
+        tiles_dict = [
+            {
+                "position": tile.position,
+                "type": tile.type.name if hasattr(tile.type, 'name') else tile.type
             }
-            
-            # Save to database
-            config = session.query(EventConfigModel).filter(
-                EventConfigModel.event_id == self.event_id,
-                EventConfigModel.config_key == "game_state"
-            ).order_by(EventConfigModel.update_number.desc()).first()
-            
-            update_number = 1
-            if config:
-                update_number = config.update_number + 1
-            
-            new_config = EventConfigModel(
-                event_id=self.event_id,
-                config_key="game_state",
-                update_number=update_number,
-                long_value=json.dumps(game_state)
-            )
-
-            teams = self.teams
-            for team in teams:
-                team: Team = team
-                db_team = session.query(EventTeamModel).filter(EventTeamModel.name == team.name).first()
-                if team.current_task:
-                    db_task = session.query(EventTask).filter(EventTask.name == team.current_task.name).first()
-                    db_team.current_task = db_task.id
-                db_team.task_progress = team.task_progress
-                db_team.assembled_items = team.assembled_items
-                db_team.mercy_rule = team.mercy_rule
-                db_team.mercy_count = team.mercy_count
-                db_team.gold = team.gold
-                db_team.current_location = team.position
-                db_team.points = team.points
+            for tile in self.tiles
+        ]
+        return {
+            "tiles": tiles_dict,
+            "shop_items": [self._serialize_item(item) for item in self.shop_items],
+            "current_turn": self.current_turn,
+            # Per-requirement counts towards the teams' current tasks (point totals are in the team rows)
+            "task_progress": self.task_matcher.get_saved_progress()
+        }
 
-                session.commit()
-            
-            session.add(new_config)
-            
-            # Save team cooldowns and effects
-            self._save_team_cooldowns_and_effects()
-            
-            session.commit()
-            logger.info(f"Saved game state version {update_number} for event {self.event_id}")
+    def save_game_state(self):
+        """
+        Save whatever changed in the game state since it was last loaded or saved
+        """
+        try:
+            self.state_store.save(self._get_game_state(), self.teams)
             return True
         except Exception as e:
             logger.error(f"Error saving game state: {e}")
             logger.error(traceback.format_exc())
-            session.rollback()
             return False
 
     def load_game_state(self, version: int = None) -> bool:
@@ -750,41 +731,24 @@ class BoardGame(BaseEvent):
             # Load event status first
             self._load_event_status()
             
-            # If no version specified, get the latest
-            if version is None:
-                latest_config = session.query(EventConfigModel).filter(
-                    EventConfigModel.event_id == self.event_id,
-                    EventConfigModel.config_key == "game_state"
-                ).order_by(EventConfigModel.update_number.desc()).first()
+            # Rebuild the state from the latest snapshot (at or before the version) and the changes after it
+            game_state = self.state_store.load(version)
+            if game_state is None:
+                if version is not None:
+                    logger.error(f"Game state version {version} not found for event {self.event_id}")
+                    return False
+                # No saved state exists, initialize a new game
+                logger.info(f"No saved state found for event {self.event_id}, initializing new game")
+                self._initialize_new_game()
                 
-                if latest_config:
-                    version = latest_config.update_number
-                else:
-                    # No saved state exists, initialize a new game
-                    logger.info(f"No saved state found for event {self.event_id}, initializing new game")
-                    self._initialize_new_game()
-                    
-                    # Only save if event is active
-                    if self._check_event_active():
-                        self.save_game_state()
-                    
-                    return True
-            
-            # Get the specified version
-            config = session.query(EventConfigModel).filter(
-                EventConfigModel.event_id == self.event_id,
-                EventConfigModel.config_key == "game_state",
-                EventConfigModel.update_number == version
-            ).first()
-            
-            if not config:
-                logger.error(f"Game state version {version} not found for event {self.event_id}")
-                return False
+                # Only save if event is active
+                if self._check_event_active():
+                    self.save_game_state()
+                
+                return True
+            version = self.state_store.version
             
-            # Parse the game state
             try:
-                game_state = json.loads(config.long_value)
-                
                 # Load tiles
                 if "tiles" in game_state:
                     # Convert tile dictionaries to Tile objects
@@ -823,7 +787,7 @@ class BoardGame(BaseEvent):
                 
                 # Load shop items
                 if "shop_items" in game_state:
-                    self.shop_items = game_state["shop_items"]
+                    self.shop_items = [self._deserialize_item(item) for item in game_state["shop_items"]]
                 else:
                     # Generate shop items if not in saved state
                     self._generate_shop_items()
@@ -842,6 +806,13 @@ class BoardGame(BaseEvent):
                 # Load team cooldowns and effects
                 self._load_team_cooldowns_and_effects()
                 
+                # Index who plays for which team and which items each team's task needs,
+                # picking up the counts towards each task where the last save left them
+                self.task_matcher.rebuild(self.teams, self._load_player_teams(), game_state.get("task_progress"))
+                
+                # What was just loaded is what's in the database; later saves only write what changes
+                self.state_store.mark_persisted(self._get_game_state(), self.teams)
+                
                 logger.info(f"Loaded game state version {version} for event {self.event_id}")
                 return True
             except json.JSONDecodeError:
@@ -943,16 +914,7 @@ class BoardGame(BaseEvent):
                 for inv, item_data in inventory_items:
                     for _ in range(inv.quantity):
                         # Add item to team inventory
-                        item = ShopItem(
-                            id=item_data.id,
-                            name=item_data.name,
-                            cost=item_data.cost,
-                            effect=item_data.effect,
-                            emoji=item_data.emoji,
-                            type=item_data.type if hasattr(item_data, 'type') else "consumable",
-                            cooldown=item_data.cooldown if hasattr(item_data, 'cooldown') else 0
-                        )
-                        team.inventory.append(item)
+                        team.inventory.append(self._shop_item_from_db(item_data))
                 
                 self.teams.append(team)
             
@@ -971,9 +933,8 @@ class BoardGame(BaseEvent):
             return False
 
     def _generate_shop_items(self):
-        """Generate shop items"""
-        # TODO: Implement shop generation
-        pass
+        """Stock the shop with the event's items"""
+        self.shop_items = self._load_shop_items()
     
         
     def _load_effects(self, effects: str) -> Dict[str, int]:
@@ -1072,6 +1033,7 @@ class BoardGame(BaseEvent):
             
             session.add(participant)
             session.commit()
+            self.task_matcher.set_player_team(player_id, team_name)
             
             logger.info(f"Added player {player_name} to team '{team_name}'")
             return True
@@ -1116,6 +1078,7 @@ class BoardGame(BaseEvent):
                 if participant:
                     session.delete(participant)
                     session.commit()
+                self.task_matcher.remove_player(player_id)
                 
                 self.save_game_state()
                 return True
@@ -1246,6 +1209,24 @@ class BoardGame(BaseEvent):
         self.save_game_state()  
         return team.gold
     
+    def purchase_item(self, team_name: str, item_name: str) -> bool:
+        """
+        Buy an item from the shop with a team's gold
+        
+        Args:
+            team_name: Name of the team
+            item_name: Name of the item to buy
+            
+        Returns:
+            True if the team could afford the item and it was added to its inventory, False otherwise
+        """
+        team = self.get_team(team_name)
+        item = next((shop_item for shop_item in self.shop_items if shop_item.name == item_name), None)
+        if not team or not item or team.gold < item.cost:
+            return False
+        team.gold -= item.cost
+        return self.add_item_to_team(team_name, item_name)
+    
     def add_item_to_team(self, team_name: str, item_name: str) -> bool:
         """
         Add an item to a team's inventory
@@ -1403,7 +1384,7 @@ class BoardGame(BaseEvent):
             Description of the effect
         """
         # This is a placeholder - subclasses should implement specific effects
-        return f"Used {item['name']} - {item['effect']}"
+        return f"Used {item.name} - {item.effect}"
     
     def next_turn(self) -> str:
         """
@@ -1522,17 +1503,21 @@ class BoardGame(BaseEvent):
             if task:
                 # Save the task to the database to get an ID
                 print("Finding database task for task: ", task.name)
-                db_task = session.query(EventTask).filter(EventTask.name == task.name).first()
+                db_task = session.query(EventTask).filter(
+                    EventTask.event_id == self.event_id,
+                    EventTask.name == task.name
+                ).first()
                 # Update the task with the database ID
                 if not db_task:
+                    task_items = task.required_items if isinstance(task.required_items, list) else [task.required_items]
                     db_task = EventTask(
                         event_id=self.event_id,
                         type=task.type,
                         name=task.name,
                         description=task.description,
-                        difficulty=task.difficulty,
+                        difficulty=task.difficulty.value,
                         points=task.points,
-                        required_items=[event_item.name + "," for event_item in task.required_items],
+                        required_items="".join(event_item.name + "," for event_item in task_items),
                         is_assembly=task.is_assembly
                     )
                     session.add(db_task)
@@ -1553,6 +1538,9 @@ class BoardGame(BaseEvent):
                 if hasattr(team, 'assembled_items'):
                     team.assembled_items = None
                 
+                # Route drops of the task's items to this team from now on
+                self.task_matcher.assign(team_name, task)
+                
                 # Save the updated team state
                 self._save_teams_to_database()
                 
@@ -1582,56 +1570,13 @@ class BoardGame(BaseEvent):
                 return False
             
             task = team.current_task
-            task_type = getattr(task, 'type', 'exact_item')  # Default to exact_item if not specified
-            
-            # Convert items list to a counter for easier counting
-            item_counter = Counter(items)
-            
-            if task_type == "exact_item":
-                # Check if all required items are present in the required quantities
-                for required_item in task.required_items:
-                    item_id = required_item.get('item_id')
-                    quantity = required_item.get('quantity', 1)
-                    
-                    if item_counter.get(item_id, 0) < quantity:
-                        return False
-                return True
-            
-            elif task_type == "assembly":
-                # For assembly tasks, check if at least one of each component is present
-                for required_item in task.required_items:
-                    item_id = required_item.get('item_id')
-                    
-                    if item_counter.get(item_id, 0) < 1:
-                        return False
-                return True
-            
-            elif task_type == "point_collection":
-                # Calculate points from submitted items
-                total_points = 0
-                for required_item in task.required_items:
-                    item_id = required_item.get('item_id')
-                    points_per_item = required_item.get('points', 1)
-                    
-                    count = item_counter.get(item_id, 0)
-                    total_points += count * points_per_item
-                
-                # Check if enough points have been collected
-                target_points = getattr(task, 'target_points', 10)
-                return total_points >= target_points
-            
-            elif task_type == "any_of":
-                # Check if any of the required items is present
-                for required_item in task.required_items:
-                    item_id = required_item.get('item_id')
-                    quantity = required_item.get('quantity', 1)
-                    
-                    if item_counter.get(item_id, 0) >= quantity:
-                        return True
-                return False
-            
-            # Default case - unknown task type
-            logger.warning(f"Unknown task type: {task_type}")
+            # Look each submitted item up among the task's requirements instead of scanning them per item
+            requirements = {normalize_item_name(requirement.name): requirement for requirement in get_requirements(task)}
+            progress = TaskProgress(task)
+            for item_name in items:
+                requirement = requirements.get(normalize_item_name(item_name))
+                if requirement and progress.add(requirement):
+                    return True
             return False
             
         except Exception as e:
@@ -1639,6 +1584,67 @@ class BoardGame(BaseEvent):
             logger.error(traceback.format_exc())
             return False
 
+    def complete_task(self, team_name: str, task: Optional[Task] = None) -> bool:
+        """
+        Finish a team's current task: award its points and free the team to roll again
+        
+        Args:
+            team_name: Name of the team
+            task: The task being completed; ignored unless it is still the team's current task
+            
+        Returns:
+            True if the team's task was completed, False otherwise
+        """
+        team = self.get_team(team_name)
+        if not team or not team.current_task:
+            return False
+        if task is not None and task.name != team.current_task.name:
+            return False
+        task = team.current_task
+        team.points += task.points or 0
+        team.current_task = None
+        team.current_task_id = None
+        team.task_progress = 0
+        team.assembled_items = None
+        self.task_matcher.clear(team_name)
+        logger.info(f"Team {team_name} completed task {task.name} for {task.points or 0} points")
+        return True
+
+    def record_drop(self, player_id: int, item_name: str, quantity: int = 1) -> Optional[Tuple[str, Task]]:
+        """
+        Count a player's drop towards their team's current task, completing the task (complete_task)
+        if the drop meets its last requirement. The caller saves the game afterwards
+        
+        Args:
+            player_id: ID of the player who received the drop
+            item_name: Name of the item
+            quantity: How many were received
+            
+        Returns:
+            (team name, task) if the drop completed the team's task, None otherwise
+        """
+        completed = self.task_matcher.record_drop(player_id, item_name, quantity)
+        team = self.get_team(self.task_matcher.get_player_team(player_id) or "")
+        if team and team.current_task and getattr(team.current_task, 'type', None) == "point_collection":
+            team.task_progress = self.task_matcher.get_points(team.name) if not completed else team.current_task.points
+        if completed:
+            logger.info(f"Team {completed[0]} completed task {completed[1].name} with a drop of {item_name}")
+        return completed
+
+    def _load_player_teams(self) -> Dict[int, str]:
+        """
+        Load which team every participant of the event plays for, in one query
+        
+        Returns:
+            Dictionary of player_id -> team name
+        """
+        rows = session.query(EventParticipant.player_id, EventTeamModel.name).join(
+            EventTeamModel, EventParticipant.team_id == EventTeamModel.id
+        ).filter(
+            EventTeamModel.event_id == self.event_id
+        ).all()
+        return {player_id: team_name for player_id, team_name in rows}
+
     def roll_and_move(self, team_name: str):
         """
         Roll dice and move a team
@@ -1692,8 +1698,8 @@ class BoardGame(BaseEvent):
             # If a task was assigned, update the team's task ID
             if task and hasattr(task, 'id'):
                 team.current_task_id = task.id
-                db_team.current_task = task.id
-                session.commit()
+            # Saved through the state store, so a later completion (current_task -> None) is seen as a change
+            self.save_game_state()
             
             return roll_result, new_tile, task
         else:
@@ -1710,6 +1716,11 @@ class BoardGame(BaseEvent):
             Team name if player is in a team, None otherwise
         """
         try:
+            # The player -> team map answers without a query once the teams are loaded
+            team_name = self.task_matcher.get_player_team(player_id)
+            if team_name and self.get_team(team_name):
+                return team_name
+            
             # Check database first
             participant = session.query(EventParticipant).join(
                 EventTeamModel, EventParticipant.team_id == EventTeamModel.id
@@ -1743,6 +1754,7 @@ class BoardGame(BaseEvent):
                         
                         return None
                 
+                    self.task_matcher.set_player_team(player_id, team.name)
                     return team.name
             
             return None
@@ -1784,6 +1796,7 @@ class BoardGame(BaseEvent):
             if participant:
                 session.delete(participant)
                 session.commit()
+            self.task_matcher.remove_player(player_id)
             
             # Remove from memory if team exists
             if team:
@@ -1925,7 +1938,8 @@ class BoardGame(BaseEvent):
                             cooldown = EventTeamCooldown(
                                 team_id=db_team.id,
                                 cooldown_name=cooldown_name,
-                                remaining_turns=turns
+                                remaining_turns=turns,
+                                expiry_date=turns_expiry(turns)
                             )
                             session.add(cooldown)
                     elif isinstance(team.cooldowns, list):
@@ -1936,14 +1950,16 @@ class BoardGame(BaseEvent):
                                 cooldown_obj = EventTeamCooldown(
                                     team_id=db_team.id,
                                     cooldown_name=cooldown.get('name', 'unknown'),
-                                    remaining_turns=cooldown.get('turns', 0)
+                                    remaining_turns=cooldown.get('turns', 0),
+                                    expiry_date=turns_expiry(cooldown.get('turns', 0))
                                 )
                             else:
                                 # Assuming it's an object with name and turns attributes
                                 cooldown_obj = EventTeamCooldown(
                                     team_id=db_team.id,
                                     cooldown_name=getattr(cooldown, 'name', 'unknown'),
-                                    remaining_turns=getattr(cooldown, 'turns', 0)
+                                    remaining_turns=getattr(cooldown, 'turns', 0),
+                                    expiry_date=turns_expiry(getattr(cooldown, 'turns', 0))
                                 )
                             session.add(cooldown_obj)
                 
@@ -1955,7 +1971,8 @@ class BoardGame(BaseEvent):
                             effect = EventTeamEffect(
                                 team_id=db_team.id,
                                 effect_name=effect_name,
-                                remaining_turns=turns
+                                remaining_turns=turns,
+                                expiry_date=turns_expiry(turns)
                             )
                             session.add(effect)
                     elif isinstance(team.active_effects, list):
@@ -1966,14 +1983,16 @@ class BoardGame(BaseEvent):
                                 effect_obj = EventTeamEffect(
                                     team_id=db_team.id,
                                     effect_name=effect.get('name', 'unknown'),
-                                    remaining_turns=effect.get('turns', 0)
+                                    remaining_turns=effect.get('turns', 0),
+                                    expiry_date=turns_expiry(effect.get('turns', 0))
                                 )
                             else:
                                 # Assuming it's an object with name and turns attributes
                                 effect_obj = EventTeamEffect(
                                     team_id=db_team.id,
                                     effect_name=getattr(effect, 'name', 'unknown'),
-                                    remaining_turns=getattr(effect, 'turns', 0)
+                                    remaining_turns=getattr(effect, 'turns', 0),
+                                    expiry_date=turns_expiry(getattr(effect, 'turns', 0))
                                 )
                             session.add(effect_obj)
             
@@ -2109,15 +2128,29 @@ class BoardGame(BaseEvent):
             session.rollback()
             return False
 
-    def _load_teams_from_database(self):
+    def _load_teams_from_database(self, default_gold=None):
         """
         Load teams from the database
+        
+        Args:
+            default_gold: Default gold to assign if not specified in team record
         """
         try:
             db_teams = session.query(EventTeamModel).filter(
                 EventTeamModel.event_id == self.event_id
             ).all()
             
+            # Every team's items, in one query
+            inventories = {}
+            for inventory, db_item in session.query(EventTeamInventory, EventShopItem).join(
+                EventShopItem, EventTeamInventory.item_id == EventShopItem.id
+            ).filter(
+                EventShopItem.event_id == self.event_id
+            ).all():
+                inventories.setdefault(inventory.event_team_id, []).extend(
+                    self._shop_item_from_db(db_item) for _ in range(inventory.quantity)
+                )
+            
             self.teams = []
             
             for db_team in db_teams:
@@ -2126,6 +2159,8 @@ class BoardGame(BaseEvent):
                     name=db_team.name,
                     position=int(db_team.current_location) if db_team.current_location else 0,
                     points=db_team.points or 0,
+                    gold=db_team.gold if db_team.gold is not None else (default_gold or self.config.starting_gold),
+                    inventory=inventories.get(db_team.id, []),
                     team_id=db_team.id,
                     current_task=None,  # Will be loaded below if needed
                     current_task_id=db_team.current_task,  # Store the task ID
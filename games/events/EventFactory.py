@@ -1,18 +1,160 @@
+import asyncio
 import logging
-from typing import Optional, Union, Dict
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple, Union, Dict
 from sqlalchemy.sql import text
 
-from db.eventmodels import EventModel as EventModel, session
+from db.eventmodels import EventModel as EventModel, EventParticipant, session
 from db.models import User, Group
 from games.events.event import Event
 from games.events.BoardGame import BoardGame
-from games.events.utils.classes.base import EventType
+from games.events.utils.classes.base import EventType, Task
 
 logger = logging.getLogger(__name__)
 
+EVENT_CACHE_SIZE = 32  # event instances kept in memory at once
+EVENT_CACHE_TTL = 1800  # seconds an unused event instance stays cached
+
+
+class EventCache:
+    """
+    Bounded LRU cache of event instances
+    
+    Idle instances expire after `ttl` seconds, and the least recently used one is evicted once
+    more than `max_size` are cached. Evicted and expired instances are saved on the way out.
+    Each event has a lock, so concurrent loads of the same event only hit the database once
+    and commands editing the same game (see edit_event) don't interleave.
+    
+    An event is pinned while a command holds or waits for its edit lock: pinned instances are
+    never evicted, expired or replaced, so there's only ever one live instance being edited,
+    and the edit lock itself is kept until nobody holds or waits for it.
+    """
+    
+    def __init__(self, max_size: int = EVENT_CACHE_SIZE, ttl: float = EVENT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[int, list]" = OrderedDict()  # event_id -> [event, loaded_at, last_used]
+        self.locks: Dict[int, threading.RLock] = {}
+        self.edit_locks: Dict[int, asyncio.Lock] = {}
+        self.pins: Dict[int, int] = {}  # event_id -> commands holding or waiting for its edit lock
+        self.stats = {"hits": 0, "misses": 0, "loads": 0, "load_seconds": 0.0,
+                      "evictions": 0, "expirations": 0, "saves": 0, "save_errors": 0}
+    
+    def __contains__(self, event_id: int) -> bool:
+        return self.get(event_id, count=False) is not None
+    
+    def lock(self, event_id: int) -> threading.RLock:
+        return self.locks.setdefault(event_id, threading.RLock())
+    
+    def edit_lock(self, event_id: int) -> asyncio.Lock:
+        return self.edit_locks.setdefault(event_id, asyncio.Lock())
+    
+    def pin(self, event_id: int) -> None:
+        self.pins[event_id] = self.pins.get(event_id, 0) + 1
+    
+    def unpin(self, event_id: int) -> None:
+        pins = self.pins.get(event_id, 0) - 1
+        if pins > 0:
+            self.pins[event_id] = pins
+            return
+        self.pins.pop(event_id, None)
+        if event_id not in self.entries:
+            self.edit_locks.pop(event_id, None)
+    
+    def is_pinned(self, event_id: int) -> bool:
+        return self.pins.get(event_id, 0) > 0
+    
+    def get(self, event_id: int, count: bool = True) -> Optional[Union[Event, BoardGame]]:
+        entry = self.entries.get(event_id)
+        if entry and time.time() - entry[2] > self.ttl and not self.is_pinned(event_id):
+            self.stats["expirations"] += 1
+            self.remove(event_id)
+            entry = None
+        if not entry:
+            if count:
+                self.stats["misses"] += 1
+            return None
+        if count:
+            self.stats["hits"] += 1
+        entry[2] = time.time()
+        self.entries.move_to_end(event_id)
+        return entry[0]
+    
+    def loaded_at(self, event_id: int) -> float:
+        entry = self.entries.get(event_id)
+        return entry[1] if entry else 0
+    
+    def put(self, event_id: int, event: Union[Event, BoardGame], load_seconds: float = None) -> None:
+        now = time.time()
+        self.entries[event_id] = [event, now, now]
+        self.entries.move_to_end(event_id)
+        if load_seconds is not None:
+            self.stats["loads"] += 1
+            self.stats["load_seconds"] += load_seconds
+        while len(self.entries) > self.max_size:
+            # Events being edited stay cached, even if that briefly takes the cache over its size
+            oldest_id = next((cached_id for cached_id in self.entries if not self.is_pinned(cached_id)), None)
+            if oldest_id is None:
+                break
+            self.stats["evictions"] += 1
+            self.remove(oldest_id)
+    
+    def save(self, event: Union[Event, BoardGame]) -> bool:
+        """Write an instance's state through to the database"""
+        save_game_state = getattr(event, "save_game_state", None)
+        if not save_game_state:
+            return True
+        if save_game_state():
+            self.stats["saves"] += 1
+            return True
+        self.stats["save_errors"] += 1
+        return False
+    
+    def remove(self, event_id: int, save: bool = True) -> bool:
+        if self.is_pinned(event_id):
+            logger.debug(f"Event {event_id} is being edited, keeping it cached")
+            return False
+        entry = self.entries.pop(event_id, None)
+        if not entry:
+            return False
+        if save:
+            try:
+                self.save(entry[0])
+            except Exception as e:
+                self.stats["save_errors"] += 1
+                logger.error(f"Error saving event {event_id} on its way out of the cache: {e}")
+        ## Load locks are kept (a reload removes the entry while holding its lock); the edit lock can go
+        ## since the event isn't pinned, so nobody holds or waits for it
+        self.edit_locks.pop(event_id, None)
+        return True
+    
+    def discard(self, event_id: int) -> None:
+        """
+        Drop an instance without saving it, even while pinned; only for the holder of its edit lock,
+        so commands queued on the lock load the event again instead of reusing the dropped instance
+        """
+        self.entries.pop(event_id, None)
+    
+    def clear(self, save: bool = True) -> None:
+        for event_id in list(self.entries):
+            self.remove(event_id, save=save)
+    
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self.entries),
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0,
+            "average_load_seconds": self.stats["load_seconds"] / self.stats["loads"] if self.stats["loads"] else 0,
+        }
+
+
 # Cache to store active event instances
 # Key: event_id, Value: event instance
-_event_cache: Dict[int, Union[Event, BoardGame]] = {}
+_event_cache = EventCache()
 
 def create_new_event(event_type: str, group_id: int, 
                    notification_channel_id: Optional[int] = None, 
@@ -50,7 +192,7 @@ def create_new_event(event_type: str, group_id: int,
         
         # Add to cache if it has a valid ID
         if event and event.id > 0:
-            _event_cache[event.id] = event
+            _event_cache.put(event.id, event)
             
         return event
             
@@ -74,51 +216,59 @@ def get_or_create_event(event_id: int, notification_channel_id: Optional[int] =
     Returns:
         Event object if found/created, None otherwise
     """
+    requested_at = time.time()
     try:
-        # Check if we already have this event in the cache and we're not forcing a reload
-        if not force_reload and event_id in _event_cache:
-            logger.debug(f"Returning cached event instance for event ID {event_id}")
-            # Update the notification channel and bot if provided
-            if notification_channel_id is not None:
-                _event_cache[event_id].notification_channel_id = notification_channel_id
-            if bot is not None:
-                _event_cache[event_id].bot = bot
-                
-            return _event_cache[event_id]
-        
-        # If we need to load from database
-        event_model = session.query(EventModel).filter(EventModel.id == event_id).first()
-        if not event_model:
-            logger.error(f"Event {event_id} not found in database")
-            return None
-        
-        # Create appropriate event type
-        event = None
-        if event_model.type == EventType.BOARD_GAME.value or event_model.type == "board_game":
-            event = BoardGame(group_id=event_model.group_id, id=event_id, 
+        # Only one load per event at a time; callers waiting on it reuse its result
+        with _event_cache.lock(event_id):
+            event = _event_cache.get(event_id)
+            # A forced reload that another caller already did while we waited doesn't need repeating,
+            # and an instance that's being edited can't be replaced under the command editing it
+            if event is not None and (not force_reload or _event_cache.loaded_at(event_id) >= requested_at
+                                      or _event_cache.is_pinned(event_id)):
+                logger.debug(f"Returning cached event instance for event ID {event_id}")
+                # Update the notification channel and bot if provided
+                if notification_channel_id is not None:
+                    event.notification_channel_id = notification_channel_id
+                if bot is not None:
+                    event.bot = bot
+                return event
+            
+            # If we need to load from database
+            load_started = time.perf_counter()
+            event_model = session.query(EventModel).filter(EventModel.id == event_id).first()
+            if not event_model:
+                logger.error(f"Event {event_id} not found in database")
+                return None
+            
+            # Create appropriate event type
+            event = None
+            if event_model.type == EventType.BOARD_GAME.value or event_model.type == "board_game":
+                event = BoardGame(group_id=event_model.group_id, id=event_id, 
+                                notification_channel_id=notification_channel_id, bot=bot)
+            # Add more event types here as needed
+            elif event_model.type == EventType.BINGO.value:
+                # event = BingoEvent(...)
+                logger.warning("Bingo events not yet implemented, returning base event")
+                event = Event(group_id=event_model.group_id, id=event_id, 
+                            notification_channel_id=notification_channel_id, bot=bot)
+            elif event_model.type == EventType.BOSS_HUNT.value:
+                # event = BossHuntEvent(...)
+                logger.warning("Boss Hunt events not yet implemented, returning base event")
+                event = Event(group_id=event_model.group_id, id=event_id, 
+                            notification_channel_id=notification_channel_id, bot=bot)
+            else:
+                # Default to base event
+                logger.warning(f"Unknown event type '{event_model.type}', using base Event")
+                event = Event(group_id=event_model.group_id, id=event_id, 
                             notification_channel_id=notification_channel_id, bot=bot)
-        # Add more event types here as needed
-        elif event_model.type == EventType.BINGO.value:
-            # event = BingoEvent(...)
-            logger.warning("Bingo events not yet implemented, returning base event")
-            event = Event(group_id=event_model.group_id, id=event_id, 
-                        notification_channel_id=notification_channel_id, bot=bot)
-        elif event_model.type == EventType.BOSS_HUNT.value:
-            # event = BossHuntEvent(...)
-            logger.warning("Boss Hunt events not yet implemented, returning base event")
-            event = Event(group_id=event_model.group_id, id=event_id, 
-                        notification_channel_id=notification_channel_id, bot=bot)
-        else:
-            # Default to base event
-            logger.warning(f"Unknown event type '{event_model.type}', using base Event")
-            event = Event(group_id=event_model.group_id, id=event_id, 
-                        notification_channel_id=notification_channel_id, bot=bot)
-        
-        # Add to cache
-        if event:
-            _event_cache[event_id] = event
             
-        return event
+            # Add to cache
+            if event:
+                # A reload replaces the cached instance, which must not be saved over what was just loaded
+                _event_cache.remove(event_id, save=False)
+                _event_cache.put(event_id, event, load_seconds=time.perf_counter() - load_started)
+                
+            return event
             
     except Exception as e:
         logger.error(f"Error getting event: {e}")
@@ -126,6 +276,104 @@ def get_or_create_event(event_id: int, notification_channel_id: Optional[int] =
         logger.error(traceback.format_exc())
         return None
 
+@asynccontextmanager
+async def edit_event(event_id: int, notification_channel_id: Optional[int] = None, bot=None):
+    """
+    Hold an event's lock while editing its game, and write the changes through when done
+    
+    Usage:
+        async with edit_event(event_id) as game:
+            game.roll_and_move(team_name)
+    
+    Args:
+        event_id: ID of the event
+        notification_channel_id: ID of the channel to send notifications to
+        bot: Discord bot instance
+    """
+    # Pinned from before waiting for the lock until after releasing it, so the instance
+    # isn't evicted while it's edited and the lock isn't dropped while anyone is queued on it
+    _event_cache.pin(event_id)
+    try:
+        async with _event_cache.edit_lock(event_id):
+            event = get_or_create_event(event_id, notification_channel_id, bot)
+            try:
+                yield event
+            except BaseException:
+                # Whatever the failed command changed is neither kept nor saved; the next one reloads
+                _event_cache.discard(event_id)
+                raise
+            if event is not None:
+                _event_cache.save(event)
+    finally:
+        _event_cache.unpin(event_id)
+
+@asynccontextmanager
+async def edit_event_by_uid(discord_id: str, notification_channel_id: Optional[int] = None, bot=None):
+    """
+    Like edit_event, for the active event of a user's groups; yields None if there isn't one
+    
+    Args:
+        discord_id: Discord ID of the user
+        notification_channel_id: ID of the channel to send notifications to
+        bot: Discord bot instance
+    """
+    event_id = find_event_id_by_uid(discord_id)
+    if event_id is None:
+        yield None
+        return
+    async with edit_event(event_id, notification_channel_id, bot) as event:
+        yield event
+
+def find_active_event_ids_by_player(player_id: int) -> List[int]:
+    """
+    Find the active events a player takes part in
+    
+    Args:
+        player_id: ID of the player
+        
+    Returns:
+        IDs of the active events the player is a participant of
+    """
+    rows = session.query(EventParticipant.event_id).join(
+        EventModel, EventParticipant.event_id == EventModel.event_id
+    ).filter(
+        EventParticipant.player_id == player_id,
+        EventModel.status == "active"
+    ).distinct().all()
+    return [event_id for (event_id,) in rows]
+
+async def record_event_drop(player_id: int, item_name: str, quantity: int = 1) -> List[Tuple[int, str, Task]]:
+    """
+    Feed a submitted drop to the active events the player takes part in
+    
+    Each game is edited through edit_event, so the drop is counted under the event's lock
+    and the game is saved when the drop changed it.
+    
+    Args:
+        player_id: ID of the player who received the drop
+        item_name: Name of the item
+        quantity: How many were received
+        
+    Returns:
+        (event ID, team name, task) for every task the drop completed
+    """
+    completed = []
+    for event_id in find_active_event_ids_by_player(player_id):
+        async with edit_event(event_id) as game:
+            record_drop = getattr(game, "record_drop", None)
+            if record_drop is None:
+                continue
+            result = record_drop(player_id, item_name, quantity)
+            if result:
+                completed.append((event_id, *result))
+    return completed
+
+def get_event_cache_stats() -> Dict[str, Union[int, float]]:
+    """
+    Get the event cache's hit, load-time, eviction and save statistics
+    """
+    return _event_cache.get_stats()
+
 def get_event_by_id(event_id: int, notification_channel_id: Optional[int] = None, 
                   bot=None, force_reload: bool = False) -> Optional[Union[Event, BoardGame]]:
     """
@@ -142,18 +390,15 @@ def get_event_by_id(event_id: int, notification_channel_id: Optional[int] = None
     """
     return get_or_create_event(event_id, notification_channel_id, bot, force_reload)
 
-def get_event_by_uid(discord_id: str, notification_channel_id: Optional[int] = None, 
-                   bot=None) -> Optional[Union[Event, BoardGame]]:
+def find_event_id_by_uid(discord_id: str) -> Optional[int]:
     """
-    Get the event associated with a user's Discord ID
+    Find the active event of the groups a user is in
     
     Args:
         discord_id: Discord ID of the user
-        notification_channel_id: ID of the channel to send notifications to
-        bot: Discord bot instance
         
     Returns:
-        Event object if found, None otherwise
+        ID of the first active event found, None otherwise
     """
     try:
         # Get user
@@ -184,13 +429,7 @@ def get_event_by_uid(discord_id: str, notification_channel_id: Optional[int] = N
             if events:
                 event = events[0]  # Get the first active event
                 logger.info(f"Found active event {event.id} for user {discord_id} in group {group_id}")
-                
-                # Get the appropriate event object
-                return get_or_create_event(
-                    event_id=event.id, 
-                    notification_channel_id=notification_channel_id, 
-                    bot=bot
-                )
+                return event.id
             else:
                 logger.debug(f"No active event found for user in group: {group_id}")
         
@@ -204,14 +443,36 @@ def get_event_by_uid(discord_id: str, notification_channel_id: Optional[int] = N
         logger.error(traceback.format_exc())
         return None
 
+def get_event_by_uid(discord_id: str, notification_channel_id: Optional[int] = None, 
+                   bot=None) -> Optional[Union[Event, BoardGame]]:
+    """
+    Get the event associated with a user's Discord ID
+    
+    Args:
+        discord_id: Discord ID of the user
+        notification_channel_id: ID of the channel to send notifications to
+        bot: Discord bot instance
+        
+    Returns:
+        Event object if found, None otherwise
+    """
+    event_id = find_event_id_by_uid(discord_id)
+    if event_id is None:
+        return None
+    # Get the appropriate event object
+    return get_or_create_event(
+        event_id=event_id, 
+        notification_channel_id=notification_channel_id, 
+        bot=bot
+    )
+
 def clear_event_cache() -> None:
     """
     Clear the event cache
     
     This can be useful for testing or when you want to force reload of all events.
     """
-    global _event_cache
-    _event_cache = {}
+    _event_cache.clear()
     logger.info("Event cache cleared")
 
 def remove_event_from_cache(event_id: int) -> bool:
@@ -224,8 +485,7 @@ def remove_event_from_cache(event_id: int) -> bool:
     Returns:
         True if event was in cache and removed, False otherwise
     """
-    if event_id in _event_cache:
-        del _event_cache[event_id]
+    if _event_cache.remove(event_id):
         logger.debug(f"Removed event {event_id} from cache")
         return True
     return False 
\ No newline at end of file
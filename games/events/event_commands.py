@@ -5,7 +5,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from db.eventmodels import EventModel as EventModel, EventTeamModel, session, EventTask as TaskModel
 from games.events.BoardGame import BoardGame
 from games.events.utils.classes.base import EventType, Task as EventTask
-from games.events.EventFactory import get_event_by_id, get_event_by_uid
+from games.events.EventFactory import edit_event, edit_event_by_uid, get_event_by_id, get_event_by_uid
 from db.models import User, Group
 import logging
 
@@ -82,12 +82,9 @@ class EventCommands(Extension):
             session.add(team)
             session.commit()
             
-            # Get or create game instance
-            game = get_event_by_id(event_id)
-                
-            # Add team to game
-            game.create_team(name, team_id=team.id)
-            game.save_game_state()
+            # Add team to game, holding the event's lock; the state is saved when the edit ends
+            async with edit_event(event_id) as game:
+                game.create_team(name, team_id=team.id)
             
             # Send confirmation
             embed = Embed(
@@ -260,205 +257,209 @@ class EventCommands(Extension):
     ):
         """View and modify event configuration"""
         try:
-            # Get the event
-            event = get_event_by_uid(ctx.author.id)
-            if not event:
-                await ctx.send(":warning: You do not have permissions to use this command, or not part of any event.", ephemeral=True)
-                return
-            
-            # Get the config
-            config = event.config
-            
-            # Define mapping of user-friendly names to actual config attributes
-            config_mapping = {
-                "Public notifications": {
-                    "attr": "general_notification_channel_id",
-                    "type": "channel",
-                    "description": "Channel for public game notifications"
-                },
-                "Admin notifications": {
-                    "attr": "admin_notification_channel_id",
-                    "type": "channel",
-                    "description": "Channel for admin notifications"
-                },
-                "Shop channel": {
-                    "attr": "shop_channel_id",
-                    "type": "channel",
-                    "description": "Channel for the shop"
-                },
-                "Game board channel": {
-                    "attr": "game_board_channel_id",
-                    "type": "channel",
-                    "description": "Channel for the game board"
-                },
-                "Team category": {
-                    "attr": "team_category_id",
-                    "type": "category",
-                    "description": "Category for team channels"
-                },
-                "Team role (1)": {
-                    "attr": "team_role_id_1",
-                    "type": "role",
-                    "description": "Role for team 1 members"
-                },
-                "Team role (2)": {
-                    "attr": "team_role_id_2",
-                    "type": "role",
-                    "description": "Role for team 2 members"
-                },
-                "Team role (3)": {
-                    "attr": "team_role_id_3",
-                    "type": "role",
-                    "description": "Role for team 3 members"
-                },
-                "Team role (4)": {
-                    "attr": "team_role_id_4",
-                    "type": "role",
-                    "description": "Role for team 4 members"
-                },
-                "Die sides": {
-                    "attr": "die_sides",
-                    "type": "int",
-                    "description": "Number of sides on the dice"
-                },
-                "Number of dice": {
-                    "attr": "number_of_dice",
-                    "type": "int",
-                    "description": "Number of dice to roll"
-                },
-                "Items enabled": {
-                    "attr": "items_enabled",
-                    "type": "bool",
-                    "description": "Whether items are enabled"
-                },
-                "Shop enabled": {
-                    "attr": "shop_enabled",
-                    "type": "bool",
-                    "description": "Whether the shop is enabled"
-                },
-                "Starting gold": {
-                    "attr": "starting_gold",
-                    "type": "int",
-                    "description": "Starting gold for teams"
-                }
+            # Get the event, holding its lock until the new configuration is saved
+            async with edit_event_by_uid(ctx.author.id) as event:
+                await self._update_event_config(ctx, event, config_key, config_value)
+        except Exception as e:
+            logger.error(f"Error in event_config: {e}")
+            logger.error(traceback.format_exc())
+            await ctx.send(f":warning: An error occurred: {str(e)}", ephemeral=True)
+
+
+    async def _update_event_config(self, ctx: SlashContext, event, config_key: str, config_value: str):
+        """Apply a configuration change to an event whose edit lock is held"""
+        if not event:
+            await ctx.send(":warning: You do not have permissions to use this command, or not part of any event.", ephemeral=True)
+            return
+        
+        # Get the config
+        config = event.config
+        
+        # Define mapping of user-friendly names to actual config attributes
+        config_mapping = {
+            "Public notifications": {
+                "attr": "general_notification_channel_id",
+                "type": "channel",
+                "description": "Channel for public game notifications"
+            },
+            "Admin notifications": {
+                "attr": "admin_notification_channel_id",
+                "type": "channel",
+                "description": "Channel for admin notifications"
+            },
+            "Shop channel": {
+                "attr": "shop_channel_id",
+                "type": "channel",
+                "description": "Channel for the shop"
+            },
+            "Game board channel": {
+                "attr": "game_board_channel_id",
+                "type": "channel",
+                "description": "Channel for the game board"
+            },
+            "Team category": {
+                "attr": "team_category_id",
+                "type": "category",
+                "description": "Category for team channels"
+            },
+            "Team role (1)": {
+                "attr": "team_role_id_1",
+                "type": "role",
+                "description": "Role for team 1 members"
+            },
+            "Team role (2)": {
+                "attr": "team_role_id_2",
+                "type": "role",
+                "description": "Role for team 2 members"
+            },
+            "Team role (3)": {
+                "attr": "team_role_id_3",
+                "type": "role",
+                "description": "Role for team 3 members"
+            },
+            "Team role (4)": {
+                "attr": "team_role_id_4",
+                "type": "role",
+                "description": "Role for team 4 members"
+            },
+            "Die sides": {
+                "attr": "die_sides",
+                "type": "int",
+                "description": "Number of sides on the dice"
+            },
+            "Number of dice": {
+                "attr": "number_of_dice",
+                "type": "int",
+                "description": "Number of dice to roll"
+            },
+            "Items enabled": {
+                "attr": "items_enabled",
+                "type": "bool",
+                "description": "Whether items are enabled"
+            },
+            "Shop enabled": {
+                "attr": "shop_enabled",
+                "type": "bool",
+                "description": "Whether the shop is enabled"
+            },
+            "Starting gold": {
+                "attr": "starting_gold",
+                "type": "int",
+                "description": "Starting gold for teams"
             }
-            
-            # Check if the config key is valid
-            if config_key not in config_mapping:
-                await ctx.send(f":warning: Invalid configuration key: {config_key}", ephemeral=True)
-                return
-            
-            # Get the config attribute and type
-            config_attr = config_mapping[config_key]["attr"]
-            config_type = config_mapping[config_key]["type"]
-            
-            # Process the value based on type
-            processed_value = None
-            
-            if config_type == "channel" or config_type == "category":
-                # Extract channel ID from mention or ID
-                if config_value.startswith("<#") and config_value.endswith(">"):
-                    # It's a channel mention
-                    channel_id = config_value[2:-1]
-                    processed_value = int(channel_id)
-                else:
-                    try:
-                        # Try to convert to int
-                        processed_value = int(config_value)
-                        # Verify the channel exists
-                        try:
-                            channel = await ctx.bot.fetch_channel(processed_value)
-                            if not channel:
-                                await ctx.send(f":warning: Channel with ID {processed_value} not found", ephemeral=True)
-                                return
-                        except Exception as e:
-                            logger.warning(f"Error fetching channel {processed_value}: {e}")
-                            # Continue anyway, as the ID might be valid but not accessible
-                    except ValueError:
-                        await ctx.send(f":warning: Invalid channel ID or mention: {config_value}", ephemeral=True)
-                        return
-            
-            elif config_type == "role":
-                # Extract role ID from mention or ID
-                if config_value.startswith("<@&") and config_value.endswith(">"):
-                    # It's a role mention
-                    role_id = config_value[3:-1]
-                    processed_value = int(role_id)
-                else:
-                    try:
-                        # Try to convert to int
-                        processed_value = int(config_value)
-                        # We don't verify the role exists because it might be in a different guild
-                    except ValueError:
-                        # Get the guild ID for this event
-                        event_model = session.query(EventModel).filter(EventModel.id == event.event_id).first()
-                        if not event_model:
-                            await ctx.send(f":warning: Event not found in database", ephemeral=True)
-                            return
-                            
-                        group_id = event_model.group_id
-                        guild_id_result = session.query(Group.guild_id).filter(Group.id == group_id).first()
-                        if not guild_id_result:
-                            await ctx.send(f":warning: Group not found in database", ephemeral=True)
-                            return
-                            
-                        guild_id = guild_id_result[0]
-                        
-                        try:
-                            # Try to fetch the guild and role
-                            guild = await ctx.bot.fetch_guild(guild_id)
-                            roles = await guild.fetch_roles()
-                            
-                            # Find role by name
-                            role = next((r for r in roles if r.name.lower() == config_value.lower()), None)
-                            
-                            if role:
-                                processed_value = role.id
-                            else:
-                                await ctx.send(f":warning: Role '{config_value}' not found in guild", ephemeral=True)
-                                return
-                        except Exception as e:
-                            logger.error(f"Error fetching guild or roles: {e}")
-                            await ctx.send(f":warning: Error fetching guild or roles: {str(e)}", ephemeral=True)
-                            return
-            
-            elif config_type == "int":
+        }
+        
+        # Check if the config key is valid
+        if config_key not in config_mapping:
+            await ctx.send(f":warning: Invalid configuration key: {config_key}", ephemeral=True)
+            return
+        
+        # Get the config attribute and type
+        config_attr = config_mapping[config_key]["attr"]
+        config_type = config_mapping[config_key]["type"]
+        
+        # Process the value based on type
+        processed_value = None
+        
+        if config_type == "channel" or config_type == "category":
+            # Extract channel ID from mention or ID
+            if config_value.startswith("<#") and config_value.endswith(">"):
+                # It's a channel mention
+                channel_id = config_value[2:-1]
+                processed_value = int(channel_id)
+            else:
                 try:
+                    # Try to convert to int
                     processed_value = int(config_value)
+                    # Verify the channel exists
+                    try:
+                        channel = await ctx.bot.fetch_channel(processed_value)
+                        if not channel:
+                            await ctx.send(f":warning: Channel with ID {processed_value} not found", ephemeral=True)
+                            return
+                    except Exception as e:
+                        logger.warning(f"Error fetching channel {processed_value}: {e}")
+                        # Continue anyway, as the ID might be valid but not accessible
                 except ValueError:
-                    await ctx.send(f":warning: Invalid integer value: {config_value}", ephemeral=True)
+                    await ctx.send(f":warning: Invalid channel ID or mention: {config_value}", ephemeral=True)
                     return
-            
-            elif config_type == "bool":
-                if config_value.lower() in ["true", "yes", "y", "1", "on", "enable", "enabled"]:
-                    processed_value = True
-                elif config_value.lower() in ["false", "no", "n", "0", "off", "disable", "disabled"]:
-                    processed_value = False
-                else:
-                    await ctx.send(f":warning: Invalid boolean value: {config_value}. Use 'true' or 'false'.", ephemeral=True)
-                    return
-            
+        
+        elif config_type == "role":
+            # Extract role ID from mention or ID
+            if config_value.startswith("<@&") and config_value.endswith(">"):
+                # It's a role mention
+                role_id = config_value[3:-1]
+                processed_value = int(role_id)
             else:
-                # Default to string
-                processed_value = config_value
-            
-            # Update the config
-            setattr(config, config_attr, processed_value)
-            
-            # Save the config to the database
+                try:
+                    # Try to convert to int
+                    processed_value = int(config_value)
+                    # We don't verify the role exists because it might be in a different guild
+                except ValueError:
+                    # Get the guild ID for this event
+                    event_model = session.query(EventModel).filter(EventModel.id == event.event_id).first()
+                    if not event_model:
+                        await ctx.send(f":warning: Event not found in database", ephemeral=True)
+                        return
+                        
+                    group_id = event_model.group_id
+                    guild_id_result = session.query(Group.guild_id).filter(Group.id == group_id).first()
+                    if not guild_id_result:
+                        await ctx.send(f":warning: Group not found in database", ephemeral=True)
+                        return
+                        
+                    guild_id = guild_id_result[0]
+                    
+                    try:
+                        # Try to fetch the guild and role
+                        guild = await ctx.bot.fetch_guild(guild_id)
+                        roles = await guild.fetch_roles()
+                        
+                        # Find role by name
+                        role = next((r for r in roles if r.name.lower() == config_value.lower()), None)
+                        
+                        if role:
+                            processed_value = role.id
+                        else:
+                            await ctx.send(f":warning: Role '{config_value}' not found in guild", ephemeral=True)
+                            return
+                    except Exception as e:
+                        logger.error(f"Error fetching guild or roles: {e}")
+                        await ctx.send(f":warning: Error fetching guild or roles: {str(e)}", ephemeral=True)
+                        return
+        
+        elif config_type == "int":
             try:
-                success = event.save_game_state()
-                session.commit()
-                await ctx.send(f":white_check_mark: Successfully updated {config_key} to {config_value}", ephemeral=True)
-            except Exception as e:
-                session.rollback()
-                logger.error(f"Error saving configuration: {e}")
-                await ctx.send(f":warning: Failed to save configuration: {str(e)}", ephemeral=True)
+                processed_value = int(config_value)
+            except ValueError:
+                await ctx.send(f":warning: Invalid integer value: {config_value}", ephemeral=True)
+                return
         
+        elif config_type == "bool":
+            if config_value.lower() in ["true", "yes", "y", "1", "on", "enable", "enabled"]:
+                processed_value = True
+            elif config_value.lower() in ["false", "no", "n", "0", "off", "disable", "disabled"]:
+                processed_value = False
+            else:
+                await ctx.send(f":warning: Invalid boolean value: {config_value}. Use 'true' or 'false'.", ephemeral=True)
+                return
+        
+        else:
+            # Default to string
+            processed_value = config_value
+        
+        # Update the config
+        setattr(config, config_attr, processed_value)
+        
+        # Save the config to the database
+        try:
+            success = event.save_game_state()
+            session.commit()
+            await ctx.send(f":white_check_mark: Successfully updated {config_key} to {config_value}", ephemeral=True)
         except Exception as e:
-            logger.error(f"Error in event_config: {e}")
-            logger.error(traceback.format_exc())
-            await ctx.send(f":warning: An error occurred: {str(e)}", ephemeral=True)
+            session.rollback()
+            logger.error(f"Error saving configuration: {e}")
+            await ctx.send(f":warning: Failed to save configuration: {str(e)}", ephemeral=True)
 
 
     @event_config.autocomplete(
@@ -510,63 +511,69 @@ class EventCommands(Extension):
     ):
         """View the point awards for various point-related tasks in the Gielinor Race."""
         try:
+            # Read-only, so it doesn't wait for the event's edit lock
             game = get_event_by_uid(ctx.author.id)
-            if not game:
-                await ctx.send("You are not participating in any events.\n" + 
-                            "You are viewing the default point awards for this task.", ephemeral=True)
-                point_awards = game.get_default_point_awards(type)
-                print("Point awards: ", point_awards)
-            # Find active events the user is participating in
-            else:
-                point_awards = game.get_points_awards(type)
-                print("Point awards: ", point_awards)
-            if not point_awards:
-                await ctx.send("No point awards found for this task.", ephemeral=True)
-                return
-            if game:
-                for task in game.tasks:
-                    if task.name == type:
-                        task = task
-                        break
-            if not task:
-                task: EventTask = game.get_default_task_by_name(type)
-                task = TaskModel(
-                            event_id=game.event_id,
-                            type=task["type"],
-                            name=task["name"],
-                            description=task["description"],
-                            difficulty=task["difficulty"],
-                            points=task["points"],
-                            required_items=[event_item["name"] + "," for event_item in task["required_items"]],
-                            is_assembly=task["is_assembly"]
-                )
-                session.add(task)
-                session.commit()
-            embed = Embed(
-                title=f"{type}",
-                description=f"{task.description}",
-                color=0x00FF00
-            )
-            max_field_length = 1024
-            point_string = ""
-            for item_name, item_points in point_awards.items():
-                point_string += f"{item_name}: {item_points} points\n"
-                if len(point_string) >= max_field_length:
-                    embed.add_field(name="Points are awarded for the following drops:", value=point_string, inline=False)
-                    point_string = ""
-            if point_string:
-                embed.add_field(name="...", value=point_string,inline=False)
-            await ctx.send(embeds=[embed])
+            await self._send_point_awards(ctx, game, type)
         except Exception as e:
             logger.error(f"Error in points: {e}")
             logger.error(traceback.format_exc())
             await ctx.send(f"An error occurred: {str(e)}", ephemeral=True)
 
+    async def _send_point_awards(self, ctx: SlashContext, game, type: str):
+        """Send the point awards of a task"""
+        if not game:
+            await ctx.send("You are not participating in any events.\n" + 
+                        "You are viewing the default point awards for this task.", ephemeral=True)
+            point_awards = game.get_default_point_awards(type)
+            print("Point awards: ", point_awards)
+        # Find active events the user is participating in
+        else:
+            point_awards = game.get_points_awards(type)
+            print("Point awards: ", point_awards)
+        if not point_awards:
+            await ctx.send("No point awards found for this task.", ephemeral=True)
+            return
+        if game:
+            for task in game.tasks:
+                if task.name == type:
+                    task = task
+                    break
+        if not task:
+            task: EventTask = game.get_default_task_by_name(type)
+            task = TaskModel(
+                        event_id=game.event_id,
+                        type=task["type"],
+                        name=task["name"],
+                        description=task["description"],
+                        difficulty=task["difficulty"],
+                        points=task["points"],
+                        required_items=[event_item["name"] + "," for event_item in task["required_items"]],
+                        is_assembly=task["is_assembly"]
+            )
+            session.add(task)
+            session.commit()
+        embed = Embed(
+            title=f"{type}",
+            description=f"{task.description}",
+            color=0x00FF00
+        )
+        max_field_length = 1024
+        point_string = ""
+        for item_name, item_points in point_awards.items():
+            point_string += f"{item_name}: {item_points} points\n"
+            if len(point_string) >= max_field_length:
+                embed.add_field(name="Points are awarded for the following drops:", value=point_string, inline=False)
+                point_string = ""
+        if point_string:
+            embed.add_field(name="...", value=point_string,inline=False)
+        await ctx.send(embeds=[embed])
+
     @points.autocomplete(
         option_name="type"
     )
     async def points_autocomplete(self, ctx: AutocompleteContext):
         """Autocomplete for points"""
+        ## Runs on every keystroke and must answer within Discord's deadline, so it never takes the edit lock
         game = get_event_by_uid(ctx.author.id)
         if not game:
             raw_tasks = session.query(TaskModel).where(TaskModel.type == "point_collection").all()
@@ -22,6 +22,7 @@ class Tile:
 class TaskItem:
     name: str
     points: int
+    quantity: int = 1
 
 
 @dataclass
@@ -49,6 +50,7 @@ class Team:
     current_task_id: Optional[int] = None  # Add this field to store the task ID
     task_progress: int = 0
     gold: int = 0
+    inventory: List["ShopItem"] = field(default_factory=list)
     cooldowns: Dict[str, int] = field(default_factory=dict)
     active_effects: Dict[str, int] = field(default_factory=dict)
     mercy_rule: Optional[datetime] = None
@@ -0,0 +1,243 @@
+import copy
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from db.base import session as default_session
+from db.eventmodels import EventConfigModel, EventTask, EventTeamCooldown, EventTeamEffect, EventTeamModel
+
+logger = logging.getLogger("events")
+
+"""
+
+    Delta persistence for board game state.
+
+    The game-level state (tiles, shop items, turn) used to be written as a full new "game_state"
+    version row on every save. Now a full snapshot is only written every SNAPSHOT_EVERY versions;
+    the versions in between are "game_state_change" rows holding just the keys that changed.
+    Loading reads the latest snapshot and replays the changes after it. Writing a snapshot
+    compacts the log: older changes and all but the last SNAPSHOTS_KEPT snapshots are deleted.
+
+    Team rows are dirty-tracked against what was last loaded or saved, so a save only updates
+    the columns (and cooldowns/effects) of teams that actually changed, in a single transaction.
+
+"""
+
+SNAPSHOT_KEY = "game_state"
+CHANGE_KEY = "game_state_change"
+SNAPSHOT_EVERY = 25  # versions between full snapshots
+SNAPSHOTS_KEPT = 2
+TURN_LENGTH = timedelta(days=1)  # a turn's span in the expiry_date of cooldowns and effects, like mercy_rule's
+
+## EventTeamModel column -> how to read it off a Team
+TEAM_COLUMNS = {
+    "current_location": lambda team: team.position,
+    "points": lambda team: team.points,
+    "gold": lambda team: team.gold,
+    "task_progress": lambda team: team.task_progress,
+    "assembled_items": lambda team: team.assembled_items,
+    "mercy_rule": lambda team: team.mercy_rule,
+    "mercy_count": lambda team: team.mercy_count,
+}
+
+
+def turns_expiry(turns: int) -> datetime:
+    """When a cooldown or effect with `turns` turns left runs out, for its expiry_date"""
+    return datetime.now() + TURN_LENGTH * max(turns or 0, 0)
+
+
+class GameStateStore:
+    """Tracks what a game last persisted and writes only what changed since"""
+
+    def __init__(self, event_id: int, db_session=None):
+        self.event_id = event_id
+        self.session = db_session or default_session
+        self.version = 0
+        self.snapshot_version = 0
+        self.persisted_state: Optional[Dict[str, Any]] = None
+        self.persisted_teams: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"saves": 0, "skipped": 0, "snapshots": 0, "changes": 0, "team_updates": 0}
+
+    def _team_values(self, team) -> Dict[str, Any]:
+        values = {column: read(team) for column, read in TEAM_COLUMNS.items()}
+        values["current_task"] = team.current_task.name if team.current_task else None
+        values["cooldowns"] = dict(team.cooldowns or {})
+        values["active_effects"] = dict(team.active_effects or {})
+        return values
+
+    def mark_persisted(self, state: Dict[str, Any], teams: List) -> None:
+        """
+        Record the given state and teams as what's currently in the database
+
+        Args:
+            state: The game-level state dictionary
+            teams: The game's Team objects
+        """
+        self.persisted_state = copy.deepcopy(state)
+        self.persisted_teams = {team.name: self._team_values(team) for team in teams}
+
+    def load(self, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Rebuild the game-level state from the latest snapshot (at or before `version`) and the changes after it
+
+        Args:
+            version: Optional specific version to load, defaults to latest
+
+        Returns:
+            The state dictionary, or None if nothing has been saved (or the version was compacted away)
+        """
+        snapshot_query = self.session.query(EventConfigModel).filter(
+            EventConfigModel.event_id == self.event_id,
+            EventConfigModel.config_key == SNAPSHOT_KEY
+        )
+        if version is not None:
+            snapshot_query = snapshot_query.filter(EventConfigModel.update_number <= version)
+        snapshot = snapshot_query.order_by(EventConfigModel.update_number.desc()).first()
+        if not snapshot:
+            return None
+        state = json.loads(snapshot.long_value)
+        change_query = self.session.query(EventConfigModel).filter(
+            EventConfigModel.event_id == self.event_id,
+            EventConfigModel.config_key == CHANGE_KEY,
+            EventConfigModel.update_number > snapshot.update_number
+        )
+        if version is not None:
+            change_query = change_query.filter(EventConfigModel.update_number <= version)
+        loaded_version = snapshot.update_number
+        for change in change_query.order_by(EventConfigModel.update_number).all():
+            state.update(json.loads(change.long_value))
+            loaded_version = change.update_number
+        if version is not None and loaded_version != version:
+            return None
+        self.snapshot_version = snapshot.update_number
+        self.version = loaded_version
+        return state
+
+    def save(self, state: Dict[str, Any], teams: List) -> bool:
+        """
+        Persist whatever changed since the last load or save, in one transaction
+
+        Args:
+            state: The game-level state dictionary
+            teams: The game's Team objects
+
+        Returns:
+            True if anything was written
+        """
+        if self.persisted_state is None:
+            self.persisted_state = {}
+        changed_state = {key: value for key, value in state.items() if self.persisted_state.get(key) != value}
+        team_values = {team.name: self._team_values(team) for team in teams}
+        dirty_teams = {}
+        for name, values in team_values.items():
+            persisted = self.persisted_teams.get(name, {})
+            changed = {column: value for column, value in values.items() if persisted.get(column) != value}
+            if changed:
+                dirty_teams[name] = changed
+        if not changed_state and not dirty_teams:
+            self.stats["skipped"] += 1
+            return False
+
+        try:
+            if dirty_teams:
+                self._write_teams(dirty_teams)
+            if changed_state or not self.snapshot_version:
+                self._write_state(state, changed_state)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        self.stats["saves"] += 1
+        self.stats["team_updates"] += len(dirty_teams)
+        self.mark_persisted(state, teams)
+        logger.info(f"Saved game state version {self.version} for event {self.event_id} "
+                    f"({len(changed_state)} state keys, {len(dirty_teams)} teams changed)")
+        return True
+
+    def _write_teams(self, dirty_teams: Dict[str, Dict[str, Any]]) -> None:
+        db_teams = {db_team.name: db_team for db_team in self.session.query(EventTeamModel).filter(
+            EventTeamModel.event_id == self.event_id,
+            EventTeamModel.name.in_(list(dirty_teams))
+        ).all()}
+        task_names = {changes["current_task"] for changes in dirty_teams.values() if changes.get("current_task")}
+        task_ids = {}
+        if task_names:
+            ## Default tasks share their names across events
+            task_ids = {name: task_id for task_id, name in self.session.query(EventTask.id, EventTask.name).filter(
+                EventTask.event_id == self.event_id,
+                EventTask.name.in_(list(task_names))
+            ).all()}
+        replaced_extras = []
+        for name, changes in dirty_teams.items():
+            db_team = db_teams.get(name)
+            if not db_team:
+                logger.warning(f"Team {name} not found in database, skipping its save")
+                continue
+            for column, value in changes.items():
+                if column in TEAM_COLUMNS:
+                    setattr(db_team, column, value)
+            if "current_task" in changes and changes["current_task"] is None:
+                ## The task was completed or cleared
+                db_team.current_task = None
+            elif changes.get("current_task") in task_ids:
+                db_team.current_task = task_ids[changes["current_task"]]
+            if "cooldowns" in changes or "active_effects" in changes:
+                replaced_extras.append(db_team)
+        if not replaced_extras:
+            return
+        ## Cooldowns and effects are small; replace a changed team's whole set
+        team_ids = [db_team.id for db_team in replaced_extras]
+        self.session.query(EventTeamCooldown).filter(EventTeamCooldown.team_id.in_(team_ids)).delete(synchronize_session=False)
+        self.session.query(EventTeamEffect).filter(EventTeamEffect.team_id.in_(team_ids)).delete(synchronize_session=False)
+        for db_team in replaced_extras:
+            values = dirty_teams[db_team.name]
+            persisted = self.persisted_teams.get(db_team.name, {})
+            cooldowns = values.get("cooldowns", persisted.get("cooldowns", {}))
+            effects = values.get("active_effects", persisted.get("active_effects", {}))
+            for cooldown_name, turns in cooldowns.items():
+                self.session.add(EventTeamCooldown(team_id=db_team.id, cooldown_name=cooldown_name, remaining_turns=turns,
+                                                   expiry_date=turns_expiry(turns)))
+            for effect_name, turns in effects.items():
+                self.session.add(EventTeamEffect(team_id=db_team.id, effect_name=effect_name, remaining_turns=turns,
+                                                 expiry_date=turns_expiry(turns)))
+
+    def _write_state(self, state: Dict[str, Any], changed_state: Dict[str, Any]) -> None:
+        if not self.version:
+            latest = self.session.query(EventConfigModel.update_number).filter(
+                EventConfigModel.event_id == self.event_id,
+                EventConfigModel.config_key.in_([SNAPSHOT_KEY, CHANGE_KEY])
+            ).order_by(EventConfigModel.update_number.desc()).first()
+            self.version = latest[0] if latest else 0
+        self.version += 1
+        if not self.snapshot_version or self.version - self.snapshot_version >= SNAPSHOT_EVERY:
+            self.session.add(EventConfigModel(event_id=self.event_id, config_key=SNAPSHOT_KEY,
+                                              update_number=self.version, long_value=json.dumps(state)))
+            self.snapshot_version = self.version
+            self.stats["snapshots"] += 1
+            self._compact()
+        else:
+            self.session.add(EventConfigModel(event_id=self.event_id, config_key=CHANGE_KEY,
+                                              update_number=self.version, long_value=json.dumps(changed_state)))
+            self.stats["changes"] += 1
+
+    def _compact(self) -> None:
+        """Drop the changes covered by the new snapshot, and snapshots beyond the ones kept"""
+        self.session.query(EventConfigModel).filter(
+            EventConfigModel.event_id == self.event_id,
+            EventConfigModel.config_key == CHANGE_KEY,
+            EventConfigModel.update_number < self.version
+        ).delete(synchronize_session=False)
+        kept = [row[0] for row in self.session.query(EventConfigModel.update_number).filter(
+            EventConfigModel.event_id == self.event_id,
+            EventConfigModel.config_key == SNAPSHOT_KEY,
+            EventConfigModel.update_number < self.version
+        ).order_by(EventConfigModel.update_number.desc()).limit(SNAPSHOTS_KEPT - 1).all()]
+        old_snapshots = self.session.query(EventConfigModel).filter(
+            EventConfigModel.event_id == self.event_id,
+            EventConfigModel.config_key == SNAPSHOT_KEY,
+            EventConfigModel.update_number < self.version
+        )
+        if kept:
+            old_snapshots = old_snapshots.filter(EventConfigModel.update_number.notin_(kept))
+        old_snapshots.delete(synchronize_session=False)
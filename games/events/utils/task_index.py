@@ -0,0 +1,216 @@
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from games.events.utils.classes.base import Task, TaskItem
+
+logger = logging.getLogger("events")
+
+"""
+
+    Drop-driven task matching for board game events.
+
+    Instead of finding a drop's team by walking the teams and re-counting every submitted item
+    against the team's task, the matcher keeps:
+      - player_id -> team name, rebuilt when the teams are loaded and kept up to date on joins/leaves
+      - item name -> [(team name, requirement)], rebuilt for a team whenever it's assigned a task
+      - per-team progress towards its current task
+    so an incoming drop is a couple of dict lookups and an O(1) progress update, and completion
+    callbacks fire as soon as the last requirement is met.
+
+    Per-requirement counts only live here, so BoardGame saves them with the game state
+    (get_saved_progress) and hands them back to rebuild when the game is loaded again.
+
+"""
+
+
+def normalize_item_name(item_name: str) -> str:
+    return item_name.strip().lower()
+
+
+def get_requirements(task: Task) -> List[TaskItem]:
+    required_items = task.required_items
+    if isinstance(required_items, TaskItem):
+        return [required_items]
+    return list(required_items or [])
+
+
+class TaskProgress:
+    """A team's progress towards one task, updated one drop at a time"""
+
+    def __init__(self, task: Task, points: int = 0):
+        self.task = task
+        self.task_type = getattr(task, "type", "exact_item")
+        self.requirements = get_requirements(task)
+        self.counts: Dict[str, int] = {}
+        self.points = points or 0
+        self.satisfied = 0
+        self.completed = False
+
+    def _required_quantity(self, requirement: TaskItem) -> int:
+        if self.task_type == "assembly":
+            return 1
+        return max(getattr(requirement, "quantity", 1) or 1, 1)
+
+    def add(self, requirement: TaskItem, quantity: int = 1) -> bool:
+        """
+        Count a drop towards a requirement of this task
+
+        Args:
+            requirement: The requirement the drop matches
+            quantity: How many of the item were received
+
+        Returns:
+            True if this drop completed the task
+        """
+        if self.completed:
+            return False
+        key = normalize_item_name(requirement.name)
+        before = self.counts.get(key, 0)
+        self.counts[key] = before + quantity
+        if self.task_type == "point_collection":
+            self.points += quantity * (requirement.points or 1)
+            self.completed = self.points >= (self.task.points or 10)
+        else:
+            required = self._required_quantity(requirement)
+            if before < required <= self.counts[key]:
+                self.satisfied += 1
+            if self.task_type == "any_of":
+                self.completed = self.satisfied >= 1
+            else:
+                self.completed = self.satisfied >= len(self.requirements)
+        return self.completed
+
+    def restore(self, counts: Dict[str, int]) -> None:
+        """
+        Restore the per-requirement counts saved by an earlier instance of the game
+
+        Args:
+            counts: Normalized item name -> how many have been received
+        """
+        if self.task_type == "point_collection":
+            ## Point collection progress is kept in the team's task_progress column
+            return
+        wanted = {normalize_item_name(requirement.name): requirement for requirement in self.requirements}
+        self.counts = {key: count for key, count in counts.items() if key in wanted and count > 0}
+        self.satisfied = sum(1 for key, requirement in wanted.items()
+                             if self.counts.get(key, 0) >= self._required_quantity(requirement))
+        if self.task_type == "any_of":
+            self.completed = self.satisfied >= 1
+        else:
+            self.completed = bool(self.requirements) and self.satisfied >= len(self.requirements)
+
+
+class TaskMatcher:
+    """Routes drops to the teams whose current task needs them"""
+
+    def __init__(self):
+        self.player_teams: Dict[int, str] = {}
+        self.item_index: Dict[str, List[Tuple[str, TaskItem]]] = {}
+        self.progress: Dict[str, TaskProgress] = {}
+        self.on_complete: List[Callable[[str, Task], None]] = []
+
+    def rebuild(self, teams: List, player_teams: Optional[Dict[int, str]] = None,
+                saved_progress: Optional[Dict[str, Dict]] = None) -> None:
+        """
+        Rebuild the indexes from the game's teams
+
+        Args:
+            teams: The game's Team objects
+            player_teams: player_id -> team name, if it should be replaced too
+            saved_progress: What get_saved_progress returned before the game was saved
+        """
+        if player_teams is not None:
+            self.player_teams = dict(player_teams)
+        self.item_index = {}
+        self.progress = {}
+        saved_progress = saved_progress or {}
+        for team in teams:
+            if not team.current_task:
+                continue
+            self.assign(team.name, team.current_task, team.task_progress or 0)
+            saved = saved_progress.get(team.name)
+            ## Counts towards a task the team has since moved on from don't carry over
+            if saved and saved.get("task") == team.current_task.name:
+                self.progress[team.name].restore(saved.get("counts") or {})
+
+    def get_saved_progress(self) -> Dict[str, Dict]:
+        """
+        The per-requirement counts of every team's current task, to persist with the game state
+
+        Returns:
+            Team name -> {"task": task name, "counts": {normalized item name: count}}
+        """
+        return {team_name: {"task": progress.task.name, "counts": dict(progress.counts)}
+                for team_name, progress in self.progress.items()
+                if progress.counts and progress.task_type != "point_collection"}
+
+    def set_player_team(self, player_id: int, team_name: str) -> None:
+        self.player_teams[player_id] = team_name
+
+    def remove_player(self, player_id: int) -> None:
+        self.player_teams.pop(player_id, None)
+
+    def get_player_team(self, player_id: int) -> Optional[str]:
+        return self.player_teams.get(player_id)
+
+    def assign(self, team_name: str, task: Optional[Task], points: int = 0) -> None:
+        """
+        Index a team's newly assigned task, replacing its previous one
+
+        Args:
+            team_name: Name of the team
+            task: The team's current task, or None if it has none
+            points: Points already collected towards the task
+        """
+        self.clear(team_name)
+        if not task:
+            return
+        self.progress[team_name] = TaskProgress(task, points)
+        for requirement in get_requirements(task):
+            self.item_index.setdefault(normalize_item_name(requirement.name), []).append((team_name, requirement))
+
+    def clear(self, team_name: str) -> None:
+        progress = self.progress.pop(team_name, None)
+        if not progress:
+            return
+        for requirement in progress.requirements:
+            key = normalize_item_name(requirement.name)
+            entries = [entry for entry in self.item_index.get(key, []) if entry[0] != team_name]
+            if entries:
+                self.item_index[key] = entries
+            else:
+                self.item_index.pop(key, None)
+
+    def record_drop(self, player_id: int, item_name: str, quantity: int = 1) -> Optional[Tuple[str, Task]]:
+        """
+        Count a player's drop towards their team's current task
+
+        Args:
+            player_id: ID of the player who received the drop
+            item_name: Name of the item
+            quantity: How many were received
+
+        Returns:
+            (team name, task) if the drop completed the team's task, None otherwise
+        """
+        team_name = self.player_teams.get(player_id)
+        if not team_name:
+            return None
+        for entry_team, requirement in self.item_index.get(normalize_item_name(item_name), []):
+            if entry_team != team_name:
+                continue
+            progress = self.progress[team_name]
+            if progress.add(requirement, quantity):
+                self.clear(team_name)
+                for callback in self.on_complete:
+                    try:
+                        callback(team_name, progress.task)
+                    except Exception as e:
+                        logger.error(f"Error in task completion callback for team {team_name}: {e}")
+                return team_name, progress.task
+            break
+        return None
+
+    def get_points(self, team_name: str) -> int:
+        progress = self.progress.get(team_name)
+        return progress.points if progress else 0
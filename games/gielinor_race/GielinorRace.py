@@ -45,6 +45,9 @@ class Team:
     inventory: List[Item] = field(default_factory=list)
     cooldowns: Dict[str, int] = field(default_factory=dict)
     active_effects: Dict[str, int] = field(default_factory=dict)
+    current_task: Optional["Task"] = None
+    task_progress: int = 0
+    assembled_items: List[str] = field(default_factory=list)
 
 @dataclass
 class TaskItem:
@@ -129,16 +132,7 @@ class GielinorRace:
         self.group_id = group_id
         self.board_size = 100
         self.teams: List[Team] = []
-        self.tiles: List[Tile] = []
-        for i, tile_number in enumerate(range(self.board_size)):
-            if tile_number % 25 == 0:
-                self.tiles.append(Tile(TileType.AIR, tile_number))
-            elif tile_number % 50 == 0:
-                self.tiles.append(Tile(TileType.EARTH, tile_number))
-            elif tile_number % 75 == 0:
-                self.tiles.append(Tile(TileType.FIRE, tile_number))
-            else:
-                self.tiles.append(Tile(TileType.WATER, tile_number))
+        self.tiles: List[Tile] = self._generate_tiles()
 
         self.shop: Dict[str, Item] = {
             "teleport": Item("Teleport", 50, "Instantly re-roll your current task to one difficulty tier lower.", "🌀", ItemType.SPECIAL, 3),
@@ -156,26 +150,48 @@ class GielinorRace:
         self.shop_channel_id = shop_channel
 
 
+    def _generate_tiles(self) -> List[Tile]:
+        """
+        Lay out the board's tiles for the current board size.
+
+        :return: The list of tiles, one per position
+        """
+        tiles = []
+        for tile_number in range(self.board_size):
+            if tile_number % 25 == 0:
+                tiles.append(Tile(TileType.AIR, tile_number))
+            elif tile_number % 50 == 0:
+                tiles.append(Tile(TileType.EARTH, tile_number))
+            elif tile_number % 75 == 0:
+                tiles.append(Tile(TileType.FIRE, tile_number))
+            else:
+                tiles.append(Tile(TileType.WATER, tile_number))
+        return tiles
+
     def load_tasks(self):
         """
         Load tasks from a JSON file and populate the tasks list.
         """
         with open(self.task_file_path, 'r') as f:
             task_data = json.load(f)
+            ## The shared task store wraps the list in {"tasks": [...]} and names items with "item_name"
+            if isinstance(task_data, dict):
+                task_data = task_data.get('tasks', [])
             for task in task_data:
-                tile_type = TileType(task['difficulty'])
+                tile_type = TileType(task.get('difficulty', 'air'))
                 required_items = task.get('required_items', task['name'])
                 is_assembly = task.get('is_assembly', False)
                 
-                if isinstance(required_items, list) and not is_assembly:
-                    required_items = [TaskItem(item['name'], item.get('points', 0)) for item in required_items]
+                if isinstance(required_items, list):
+                    required_items = [TaskItem(item.get('item_name', item.get('name')), item.get('points', 0))
+                                      for item in required_items]
                 elif isinstance(required_items, str):
                     required_items = TaskItem(required_items)
                 
                 self.tasks[tile_type].append(Task(
                     task['name'],
                     tile_type,
-                    task['points'],
+                    task.get('points', 10),
                     required_items,
                     is_assembly
                 ))
@@ -335,6 +351,7 @@ class GielinorRace:
             team.cooldowns[item.name] = item.cooldown
             effect = self._apply_item_effect(team, item)
             self.save_game_state()
+            self.send_discord_message(f"{team_name} used {item_name}. Effect: {effect}")
             return True, effect, item
         return False, f"{team_name} can't use {item_name} at this time.", None
 
@@ -796,12 +813,6 @@ class GielinorRace:
 
         return False, 0, []
 
-    def use_item(self, team_name: str, item_name: str) -> Tuple[bool, str, Item]:
-        success, effect, item = super().use_item(team_name, item_name)
-        if success:
-            self.send_discord_message(f"{team_name} used {item_name}. Effect: {effect}")
-        return success, effect, item
-
     def apply_item_effects(self, team_name: str, event_type: str) -> None:
         team = self.get_team(team_name)
         for other_team in self.teams:
@@ -0,0 +1,370 @@
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+
+"""
+
+    Headless replay/simulation of the event games, as a benchmark and a regression check.
+
+    Plays N teams for M turns with seeded dice, without Discord:
+      - BoardGame against a scratch SQLite database (EVENTS_DB_URL is pointed at it before the
+        game modules are imported): roll_and_move, assign_task, drops fed through record_drop
+        until it completes the task, items bought from the shop with the teams' gold and used,
+        and a save after every team's turn, with a full save/load cycle every few turns whose
+        result is compared with the in-memory game
+      - GielinorRace, whose state lives in Redis, against an in-process key/value store
+
+    Reports the latency of every operation (median/p95/max), the SQL queries each one ran, and how
+    the persisted state grows. Any exception or save/load mismatch is a failure, and the exit code
+    is non-zero if there were any, so it can gate changes to the games.
+
+        python -m games.simulation board-game --teams 4 --turns 50 --seed 1
+        python -m games.simulation gielinor-race --teams 4 --turns 50
+        python -m games.simulation all --json report.json
+
+"""
+
+DEFAULT_DB_URL = "sqlite:///simulation.db"
+SIMULATION_GROUP_ID = 1
+PLAYERS_PER_TEAM = 3
+RELOAD_EVERY = 10  # turns between save/load consistency checks
+USE_ITEM_CHANCE = 0.2
+STARTING_GOLD = 100
+## (name, cost, item type, cooldown) of the items stocked in the board game's shop
+SHOP_ITEMS = [
+    ("Teleport", 20, "special", 3),
+    ("Protection", 15, "defensive", 2),
+    ("Boost", 10, "special", 2),
+]
+
+
+class SimulationReport:
+    def __init__(self, name: str):
+        self.name = name
+        self.timings = defaultdict(list)  # operation -> [ms]
+        self.queries = defaultdict(int)  # operation -> SQL statements run
+        self.state_sizes = []  # (turn, bytes of persisted state, persisted rows)
+        self.failures = []  # (operation, error)
+        self.query_count = 0
+
+    def count_queries(self, engine):
+        from sqlalchemy import event
+
+        def on_query(*args):
+            self.query_count += 1
+        event.listen(engine, "before_cursor_execute", on_query)
+
+    @contextmanager
+    def measure(self, operation: str):
+        queries_before = self.query_count
+        started_at = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.failures.append((operation, f"{type(e).__name__}: {e}"))
+            traceback.print_exc(limit=3)
+        finally:
+            self.timings[operation].append((time.perf_counter() - started_at) * 1000)
+            self.queries[operation] += self.query_count - queries_before
+
+    def fail(self, operation: str, error: str):
+        self.failures.append((operation, error))
+
+    def summary(self) -> dict:
+        operations = {}
+        for operation, timings in self.timings.items():
+            ordered = sorted(timings)
+            operations[operation] = {
+                "calls": len(ordered),
+                "median_ms": statistics.median(ordered),
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max_ms": ordered[-1],
+                "queries_per_call": self.queries[operation] / len(ordered),
+            }
+        return {
+            "game": self.name,
+            "operations": operations,
+            "state_sizes": self.state_sizes,
+            "failures": self.failures,
+        }
+
+    def print(self):
+        print(f"\n== {self.name} ==")
+        print(f"{'operation':<22} {'calls':>6} {'median ms':>10} {'p95 ms':>9} {'max ms':>9} {'queries/call':>13}")
+        for operation, stats in self.summary()["operations"].items():
+            print(f"{operation:<22} {stats['calls']:>6} {stats['median_ms']:>10.2f} {stats['p95_ms']:>9.2f} "
+                  f"{stats['max_ms']:>9.2f} {stats['queries_per_call']:>13.1f}")
+        if self.state_sizes:
+            first, last = self.state_sizes[0], self.state_sizes[-1]
+            print(f"state: {first[1]:,} bytes / {first[2]} rows at turn {first[0]} -> "
+                  f"{last[1]:,} bytes / {last[2]} rows at turn {last[0]}")
+        print(f"failures: {len(self.failures)}")
+        for operation, error in self.failures[:20]:
+            print(f"  {operation}: {error}")
+
+
+class MemoryStore:
+    """The get/set subset of RedisClient GielinorRace uses, kept in memory"""
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+
+def _board_game_snapshot(game) -> list:
+    return sorted((team.name, team.position, team.points, team.gold,
+                   team.current_task.name if team.current_task else None,
+                   sorted(item.name for item in team.inventory)) for team in game.teams)
+
+
+def _drops_needed(task, requirement) -> int:
+    """Drops of a requirement that complete it; point collection tasks count the drops' points instead"""
+    if task.type == "point_collection":
+        return math.ceil((task.points or 10) / (requirement.points or 1))
+    return max(getattr(requirement, "quantity", 1) or 1, 1)
+
+
+## MySQL-only server defaults in the models -> their SQLite equivalent, for the scratch database only
+SQLITE_SERVER_DEFAULTS = {
+    "CURRENT_TIMESTAMP + INTERVAL 1 DAY": "(datetime('now', '+1 day'))",
+    ## SQLite has no ON UPDATE; updated_at just keeps its insert time there
+    "CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP": "CURRENT_TIMESTAMP",
+}
+
+
+def _render_mysql_ddl_for_sqlite():
+    """The models use MySQL's TINYINT and MySQL-only server defaults, which SQLite can't take as they are"""
+    from sqlalchemy.dialects.mysql import TINYINT
+    from sqlalchemy.ext.compiler import compiles
+    from sqlalchemy.schema import CreateColumn
+
+    @compiles(TINYINT, "sqlite")
+    def compile_tinyint(type_, compiler, **kw):
+        return "SMALLINT"
+
+    @compiles(CreateColumn, "sqlite")
+    def compile_column(create, compiler, **kw):
+        ddl = compiler.visit_create_column(create, **kw)
+        for mysql_default, sqlite_default in SQLITE_SERVER_DEFAULTS.items():
+            ddl = ddl.replace(f"DEFAULT {mysql_default}", f"DEFAULT {sqlite_default}")
+        return ddl
+
+
+def _setup_board_game(report: SimulationReport, teams: int):
+    from db.base import Base, engine, session
+    _render_mysql_ddl_for_sqlite()
+    import db.models  # defines the groups/users/players tables the event tables reference
+    import db.eventmodels as eventmodels
+    from db.eventmodels import EventModel, EventParticipant, EventShopItem, EventTeamModel
+
+    ## Only the event tables and the tables their foreign keys point at, not the whole bot schema
+    event_tables = {mapper.local_table for mapper in Base.registry.mappers
+                    if mapper.class_.__module__ == eventmodels.__name__}
+    referenced = {fk.column.table for table in event_tables for fk in table.foreign_keys}
+    needed = event_tables | referenced
+    ## Create what the models allow; a table that can't be created is itself a failure to report
+    for table in Base.metadata.sorted_tables:
+        if table not in needed:
+            continue
+        with report.measure(f"schema:{table.name}"):
+            table.create(engine, checkfirst=True)
+    with report.measure("setup"):
+        event = EventModel(group_id=SIMULATION_GROUP_ID, author_id=1, event_type="BoardGame", status="active",
+                           title="Simulation", team_size=PLAYERS_PER_TEAM)
+        session.add(event)
+        session.flush()
+        event_id = event.event_id
+        for name, cost, item_type, cooldown in SHOP_ITEMS:
+            session.add(EventShopItem(event_id=event_id, name=name, cost=cost, item_type=item_type, cooldown=cooldown))
+        for team_number in range(teams):
+            team = EventTeamModel(event_id=event_id, name=f"Team {team_number + 1}", gold=STARTING_GOLD,
+                                  current_location="0")
+            session.add(team)
+            session.flush()
+            for player_number in range(PLAYERS_PER_TEAM):
+                player_id = team_number * PLAYERS_PER_TEAM + player_number + 1
+                session.add(EventParticipant(event_id=event_id, user_id=player_id, player_id=player_id, team_id=team.id))
+        session.commit()
+        return event_id
+    return None
+
+
+def _persisted_state(event_id) -> tuple:
+    from db.base import session
+    from db.eventmodels import EventConfigModel
+    rows = session.query(EventConfigModel.long_value).filter(EventConfigModel.event_id == event_id).all()
+    return sum(len(row[0] or "") for row in rows), len(rows)
+
+
+def simulate_board_game(teams: int, turns: int, seed: int) -> SimulationReport:
+    report = SimulationReport("BoardGame")
+    from db.base import engine
+    report.count_queries(engine)
+    event_id = _setup_board_game(report, teams)
+    if event_id is None:
+        return report
+
+    from games.events.BoardGame import BoardGame
+    from games.events.utils.task_index import get_requirements
+
+    random.seed(seed)
+    game = None
+    with report.measure("load"):
+        game = BoardGame(group_id=SIMULATION_GROUP_ID, id=event_id)
+        game.load_game_state()
+    if game is None:
+        return report
+    ## One player per team submits the drops, taken from the game's own player -> team map
+    players = {}
+    for player_id, team_name in game.task_matcher.player_teams.items():
+        players.setdefault(team_name, player_id)
+
+    for turn in range(1, turns + 1):
+        for team in list(game.teams):
+            if not team.current_task:
+                with report.measure("roll_and_move"):
+                    game.roll_and_move(team.name)
+            task = team.current_task
+            if task and team.name not in players:
+                report.fail("record_drop", f"turn {turn}: {team.name} has no players in the player -> team map")
+            elif task:
+                ## Feed the task's items through the drop stream; the drop meeting its last requirement completes it
+                points_before = team.points
+                completed = None
+                for requirement in get_requirements(task):
+                    for _ in range(_drops_needed(task, requirement)):
+                        with report.measure("record_drop"):
+                            completed = game.record_drop(players[team.name], requirement.name)
+                        if completed:
+                            break
+                    if completed:
+                        break
+                if not completed:
+                    report.fail("record_drop", f"turn {turn}: {team.name} fed every item of '{task.name}' without completing it")
+                elif team.current_task or team.points != points_before + (task.points or 0):
+                    report.fail("complete_task", f"turn {turn}: {team.name} completed '{task.name}' without being awarded it")
+            usable = [item for item in game.shop_items if item.cost <= team.gold and not team.cooldowns.get(item.name)]
+            if usable and random.random() < USE_ITEM_CHANCE:
+                item = random.choice(usable)
+                purchased = None
+                with report.measure("purchase_item"):
+                    purchased = game.purchase_item(team.name, item.name)
+                if purchased is False:
+                    report.fail("purchase_item", f"turn {turn}: {team.name} couldn't buy {item.name} with {team.gold} gold")
+                elif purchased:
+                    used = None
+                    with report.measure("use_item"):
+                        used, message, _ = game.use_item(team.name, item.name)
+                    if used is False:
+                        report.fail("use_item", f"turn {turn}: {team.name} couldn't use {item.name}: {message}")
+            with report.measure("next_turn"):
+                game.next_turn()
+            with report.measure("save"):
+                game.save_game_state()
+        report.state_sizes.append((turn, *_persisted_state(event_id)))
+        if turn % RELOAD_EVERY == 0:
+            with report.measure("reload"):
+                reloaded = BoardGame(group_id=SIMULATION_GROUP_ID, id=event_id)
+                reloaded.load_game_state()
+                if _board_game_snapshot(reloaded) != _board_game_snapshot(game):
+                    report.fail("reload", f"turn {turn}: reloaded state differs from the game in memory")
+    return report
+
+
+def simulate_gielinor_race(teams: int, turns: int, seed: int) -> SimulationReport:
+    report = SimulationReport("GielinorRace")
+    import games.gielinor_race.GielinorRace as race_module
+    store = MemoryStore()
+    race_module.redis_client = store
+
+    random.seed(seed)
+    game = None
+    with report.measure("setup"):
+        game = race_module.GielinorRace(bot=None, group_id=SIMULATION_GROUP_ID)
+        for team_number in range(teams):
+            ## The race's shop is paid for with points
+            game.teams.append(race_module.Team(f"Team {team_number + 1}", [], points=STARTING_GOLD))
+    if game is None:
+        return report
+
+    for turn in range(1, turns + 1):
+        for team in list(game.teams):
+            tile = None
+            with report.measure("roll_and_move"):
+                _, tile, _ = game.roll_and_move(team.name)
+            if tile is None:
+                continue
+            task = None
+            with report.measure("assign_task"):
+                task = game.assign_task(team.name, tile)
+            if task:
+                items = task.required_items if isinstance(task.required_items, list) else [task.required_items]
+                for item in items:
+                    with report.measure("check_task_completion"):
+                        game.check_task_completion(team.name, item.name if hasattr(item, "name") else str(item))
+            usable = [key for key, item in game.shop.items() if item.cost <= team.points and not team.cooldowns.get(item.name)]
+            if usable and random.random() < USE_ITEM_CHANCE:
+                item_key = random.choice(usable)
+                purchased = None
+                with report.measure("purchase_item"):
+                    purchased = game.purchase_item(team.name, item_key)
+                if purchased is False:
+                    report.fail("purchase_item", f"turn {turn}: {team.name} couldn't buy {item_key} with {team.points} points")
+                elif purchased:
+                    used = None
+                    with report.measure("use_item"):
+                        used, message, _ = game.use_item(team.name, game.shop[item_key].name)
+                    if used is False:
+                        report.fail("use_item", f"turn {turn}: {team.name} couldn't use {item_key}: {message}")
+            with report.measure("save"):
+                game.save_game_state()
+        state = store.get(f"gielinor_race:{SIMULATION_GROUP_ID}") or ""
+        report.state_sizes.append((turn, len(state), len(game.teams)))
+        if turn % RELOAD_EVERY == 0:
+            with report.measure("reload"):
+                reloaded = race_module.GielinorRace(bot=None, group_id=SIMULATION_GROUP_ID)
+                before = sorted((team.name, team.position, team.points) for team in game.teams)
+                after = sorted((team.name, team.position, team.points) for team in reloaded.teams)
+                if before != after:
+                    report.fail("reload", f"turn {turn}: reloaded state differs from the game in memory")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play the event games headlessly and report latency, queries and state growth")
+    parser.add_argument("game", choices=["board-game", "gielinor-race", "all"])
+    parser.add_argument("--teams", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", default=DEFAULT_DB_URL, help="scratch database for the board game (recreated)")
+    parser.add_argument("--json", help="also write the reports to this file")
+    args = parser.parse_args()
+
+    ## Must be set before anything imports db.base / db.eventmodels
+    if args.db.startswith("sqlite:///") and os.path.exists(args.db[len("sqlite:///"):]):
+        os.remove(args.db[len("sqlite:///"):])
+    os.environ["EVENTS_DB_URL"] = args.db
+
+    reports = []
+    if args.game in ("board-game", "all"):
+        reports.append(simulate_board_game(args.teams, args.turns, args.seed))
+    if args.game in ("gielinor-race", "all"):
+        reports.append(simulate_gielinor_race(args.teams, args.turns, args.seed))
+    for report in reports:
+        report.print()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([report.summary() for report in reports], f, indent=2, default=str)
+    sys.exit(1 if any(report.failures for report in reports) else 0)
@@ -13,6 +13,8 @@ import json
 import logging
 from typing import Dict, List
 from db.models import BackupWebhook, Webhook, NewWebhook, session, WebhookPendingDeletion
+from utils.webhook_pool import webhook_pool
+from utils.webhook_checks import check_webhooks
 import sqlalchemy
 from dotenv import load_dotenv
 load_dotenv()
@@ -172,125 +174,155 @@ async def load_initial_webhook_states():
                               activity=interactions.Activity(name=f" {len(webhook_states)}({int(len(webhook_states) / 3)}) webhooks", type=interactions.ActivityType.WATCHING))
     
 
-async def test_webhook(webhook, session):
-    """Test a single webhook and return its status"""
+def remove_dead_webhooks(results):
+    """Deletes the webhooks that no longer exist, with one statement per table"""
+    dead_ids = {Webhook: [], WebhookPendingDeletion: []}
+    for result in results:
+        if result['dead']:
+            model = type(result['webhook'])
+            if model in dead_ids:
+                dead_ids[model].append(result['webhook'].id)
     try:
-        if len(str(webhook.webhook_url)) < 5:
-            return {
-                'webhook_id': webhook.webhook_id if hasattr(webhook, 'webhook_id') else 'pending_deletion',
-                'url': webhook.webhook_url,
-                'status': 'Error',
-                'elapsed': 0,
-                'ok': False
-            }
-        start_time = time.time()
-        async with session.get(webhook.webhook_url, timeout=10) as response:
-            elapsed = time.time() - start_time
-            status = response.status
-            return {
-                'webhook_id': webhook.webhook_id if hasattr(webhook, 'webhook_id') else 'pending_deletion',
-                'url': webhook.webhook_url,
-                'status': status,
-                'elapsed': elapsed,
-                'ok': 200 <= status < 400
-            }
-    except aiohttp.ClientError as e:
-        return {
-            'webhook_id': webhook.webhook_id if hasattr(webhook, 'webhook_id') else 'pending_deletion',
-            'url': webhook.webhook_url,
-            'status': 'Error',
-            'error': str(e),
-            'ok': False
-        }
+        for model, ids in dead_ids.items():
+            if ids:
+                session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"Couldn't remove dead webhooks: {e}")
+        return 0
+    for result in results:
+        if result['dead'] and type(result['webhook']) in dead_ids:
+            forget_webhook_url(result['url'])
+    return sum(len(ids) for ids in dead_ids.values())
 
 
 @Task.create(IntervalTrigger(minutes=5))
 async def test_all_webhooks():
-    """Test all webhooks with a delay between requests"""
+    """Test all webhooks concurrently and post a summary of the results"""
     webhooks = session.query(Webhook).all()
     secondary = session.query(WebhookPendingDeletion).all()
     all_webhooks = secondary + webhooks
-    passed = 0
-    failed = 0
-    
-    notification_channel = await bot.fetch_channel(1369649855194202223)
-    await notification_channel.send(f"Performing a routine route check on {len(all_webhooks)} webhooks...")
-    results = []
+    started_at = time.time()
     async with aiohttp.ClientSession() as http_session:
-        for i, webhook in enumerate(all_webhooks):
-            print(f"Testing webhook {i+1}/{len(all_webhooks)}: {webhook.webhook_url}...")
-            result = await test_webhook(webhook, http_session)
-            results.append(result)
-            
-            # Print result immediately
-            if result['ok']:
-                print(f"✅ {result['url']} - Status: {result['status']} ({result['elapsed']:.2f}s)")
-                passed += 1
-            else:
-                await notification_channel.send(f"❌ {result['status']} - FAILED: {result['url']}")
-                failed += 1
-                ## Remove it from the database
-                session.delete(webhook)
-                session.commit()
-                print("Skipping creation for now...")
-                #await create_new_webhook(should_create=True)
-            # Add delay between requests (2 seconds)
-            if i < len(all_webhooks) - 1:  # Don't delay after the last request
-                await asyncio.sleep(1)
-    await notification_channel.send(f"Completed a routine route check on {len(all_webhooks)} webhooks. {passed}/{len(all_webhooks)} passed, {failed}/{len(all_webhooks)} failed.")
+        results = await check_webhooks(all_webhooks, http_session)
+    passed = sum(1 for result in results if result['ok'])
+    dead = [result for result in results if result['dead']]
+    transient = [result for result in results if not result['ok'] and not result['dead']]
+    webhook_pool.record_results(results)
+    removed = remove_dead_webhooks(results)
+
+    summary = (f"Completed a routine route check on {len(all_webhooks)} webhooks in {time.time() - started_at:.0f}s. " +
+               f"{passed}/{len(all_webhooks)} passed, {len(dead)} no longer exist ({removed} removed), " +
+               f"{len(transient)} failed temporarily.")
+    if transient:
+        statuses = {}
+        for result in transient:
+            statuses[str(result['status'])] = statuses.get(str(result['status']), 0) + 1
+        summary += "\nTemporary failures: " + ", ".join(f"`{status}` x{count}" for status, count in statuses.items())
+    print(summary)
+    try:
+        notification_channel = await bot.fetch_channel(1369649855194202223)
+        await notification_channel.send(summary)
+    except Exception as e:
+        print(f"Couldn't send the webhook check summary: {e}")
     return results
 
+WEBHOOK_SCAN_CONCURRENCY = 5  # channels having their webhooks fetched at once
+FULL_WEBHOOK_SCAN_INTERVAL = 6 * 3600  # seconds; a full rescan catches changes missed while disconnected
+
+## URLs of every webhook we already have stored; reloaded on every full scan, and kept up to date
+## in between as webhooks are added and removed
+known_webhook_urls = None
+## Channels that had a webhooks update event since the last reconciliation
+dirty_webhook_channels = set()
+last_full_webhook_scan = 0
+
+def load_known_webhook_urls():
+    global known_webhook_urls
+    urls = {url for (url,) in session.query(Webhook.webhook_url).all()}
+    urls.update(url for (url,) in session.query(WebhookPendingDeletion.webhook_url).all())
+    known_webhook_urls = urls
+
+def remember_webhook_url(webhook_url):
+    """Keeps webhooks we create ourselves from being picked up as missing"""
+    if known_webhook_urls is not None:
+        known_webhook_urls.add(webhook_url)
+
+def forget_webhook_url(webhook_url):
+    """Lets a webhook whose row was deleted be picked up again if it still exists in its channel"""
+    if known_webhook_urls is not None:
+        known_webhook_urls.discard(webhook_url)
+
+def get_tracked_channels():
+    """Text channels in our webhook categories, from the bot's cache"""
+    channels = {}
+    for guild in bot.guilds:
+        for channel in guild.channels:
+            if channel.type == interactions.ChannelType.GUILD_CATEGORY and channel.id in all_parent_ids and channel.channels:
+                for child in channel.channels:
+                    if isinstance(child, GuildText):
+                        channels[child.id] = child
+    return channels
+
+async def find_missing_webhooks(channel: GuildText, semaphore: asyncio.Semaphore):
+    """Returns the webhooks in `channel` that aren't stored yet"""
+    async with semaphore:
+        try:
+            webhooks = await channel.fetch_webhooks()
+        except Exception as e:
+            print(f"Couldn't fetch webhooks for channel {channel.id}: {e}")
+            ## Try again on the next run
+            dirty_webhook_channels.add(channel.id)
+            return []
+    return [(channel, webhook) for webhook in webhooks if webhook.url not in known_webhook_urls]
+
 @Task.create(IntervalTrigger(minutes=10))
 async def check_missing_webhooks():
-    existing_webhooks = session.query(Webhook).all()
-    existing_pending_deletions = session.query(WebhookPendingDeletion).all()
-    all_webhooks = existing_webhooks + existing_pending_deletions
+    """
+    Stores webhooks that exist in our channels but not in the database.
+    Only channels with a webhooks update since the last run are fetched,
+    apart from a periodic full scan.
+    """
+    global last_full_webhook_scan
+    tracked_channels = get_tracked_channels()
+    if time.time() - last_full_webhook_scan > FULL_WEBHOOK_SCAN_INTERVAL:
+        ## Rows can also be deleted by hand or by other processes; start every full scan from the database
+        load_known_webhook_urls()
+        channel_ids = set(tracked_channels.keys())
+        last_full_webhook_scan = time.time()
+    else:
+        if known_webhook_urls is None:
+            load_known_webhook_urls()
+        channel_ids = dirty_webhook_channels & set(tracked_channels.keys())
+    dirty_webhook_channels.difference_update(channel_ids)
+    if not channel_ids:
+        return
+    semaphore = asyncio.Semaphore(WEBHOOK_SCAN_CONCURRENCY)
+    results = await asyncio.gather(*(find_missing_webhooks(tracked_channels[channel_id], semaphore) for channel_id in channel_ids))
     total_added = 0
-    for guild in bot.guilds:
-        for channel in guild.channels:
-            if channel.type == interactions.ChannelType.GUILD_CATEGORY:
-                if channel.id in all_parent_ids:
-                    if channel.channels:
-                        for channel in channel.channels:
-                            if isinstance(channel, GuildText):
-                                webhooks = await channel.fetch_webhooks()
-                                if len(webhooks) > 0:
-                                    for webhook in webhooks:
-                                        existing_webhook = session.query(Webhook).filter_by(webhook_url=webhook.url).first()
-                                        existing_pending_deletion = session.query(WebhookPendingDeletion).filter_by(webhook_url=webhook.url).first()
-                                        if existing_webhook is None and existing_pending_deletion is None:
-                                            print(f"Missing webhook needs to be added to the database: {webhook.url}")
-                                            new_webhook = WebhookPendingDeletion(
-                                                webhook_id=webhook.id,
-                                                webhook_url=webhook.url,
-                                                channel_id=channel.id,
-                                                date_added=datetime.now(),
-                                                date_updated=datetime.now()
-                                            )
-                                            session.add(new_webhook)
-                                            total_added += 1
-    # for channel_id, webhooks_dict in webhook_states.items():
-    #     for webhook_id, webhook_data in webhooks_dict.items():
-    #         existing_webhook = session.query(Webhook).filter_by(webhook_url=webhook_data['url']).first()
-    #         if existing_webhook is None:
-    #             existing_pending_deletion = session.query(WebhookPendingDeletion).filter_by(webhook_url=webhook_data['url']).first()
-    #             if existing_pending_deletion is None:
-    #                 print(f"Missing webhook needs to be added to the database: {webhook_data['url']}")
-    #                 # Delete the webhook from the webhook_states
-    #                 new_webhook = WebhookPendingDeletion(
-    #                     webhook_id=webhook_id,
-    #                     webhook_url=webhook_data['url'],
-    #                     channel_id=channel_id,
-    #                     date_added=datetime.now(),
-    #                     date_updated=datetime.now()
-    #                 )
-    #                 session.add(new_webhook)
-    #                 total_added += 1
-    #         else:
-    #             print(f"Webhook with ID {existing_webhook.webhook_id} already exists in the database, skipping...")
-    # session.commit()
-    session.commit()
-    print(f"Added {total_added} missing webhooks to the database")
+    for channel, webhook in [missing for channel_missing in results for missing in channel_missing]:
+        if webhook.url in known_webhook_urls:
+            continue
+        print(f"Missing webhook needs to be added to the database: {webhook.url}")
+        session.add(WebhookPendingDeletion(
+            webhook_id=webhook.id,
+            webhook_url=webhook.url,
+            channel_id=channel.id,
+            date_added=datetime.now(),
+            date_updated=datetime.now()
+        ))
+        known_webhook_urls.add(webhook.url)
+        total_added += 1
+    try:
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        ## Reload from the database so that the failed additions are retried
+        load_known_webhook_urls()
+        print(f"Couldn't add missing webhooks to the database: {e}")
+        return
+    print(f"Checked {len(channel_ids)} channels; added {total_added} missing webhooks to the database")
 
 @Task.create(IntervalTrigger(seconds=10))
 async def heartbeat_loop():
@@ -370,6 +402,7 @@ async def run_channel_deletes():#
                                     session.add(db_webhook)
                                     session.commit()
                                     recently_created_webhook_ids.add(str(webhook.id))
+                                    remember_webhook_url(webhook.url)
                                     await notification_channel.send(f"Webhook replacement at url {webhook.url} created successfully in <#{channel.id}>")
                             except Exception as e:
                                 print(f"Error creating new webhook: {e}")
@@ -389,7 +422,7 @@ async def on_startup():
     # await run_new_webhook_loop()
     await load_initial_webhook_states()
     # #print("Checking for missing webhooks in the database based on the current webhook states...")
-    # check_missing_webhooks.start()
+    check_missing_webhooks.start()
     # await check_missing_webhooks()
     # test_all_webhooks.start()
     # await test_all_webhooks()
@@ -408,6 +441,7 @@ async def on_raw_webhooks_update(event):
         if hasattr(event, 'data'):
             event_data = event.data
             if 'guild_id' in event_data and 'channel_id' in event_data:
+                dirty_webhook_channels.add(int(event_data['channel_id']))
                 try:
                     channel = await bot.fetch_channel(event_data['channel_id'])
                     if channel:
@@ -492,6 +526,7 @@ async def check_webhook_changes(channel: interactions.BaseChannel):
                 print(f"Error deleting webhook from database: {e}")
             
             session.commit()
+            forget_webhook_url(webhook_data['url'])
             
             # Send notification after all operations
             await notification_channel.send(
@@ -532,6 +567,7 @@ async def check_webhook_changes(channel: interactions.BaseChannel):
                         session.add(db_webhook)
                         session.commit()
                         recently_created_webhook_ids.add(str(webhook.id))
+                        remember_webhook_url(webhook.url)
                         await notification_channel.send(f"Webhook replacement at url {webhook.url} created successfully in <#{channel.id}>")
                 except Exception as e:
                     print(f"Error creating new webhook: {e}")
@@ -610,6 +646,7 @@ async def create_new_webhook(should_create=True):
                 session.add(db_webhook)
                 session.commit()
                 recently_created_webhook_ids.add(str(webhook.id))
+                remember_webhook_url(webhook.url)
             except sqlalchemy.exc.IntegrityError as e:
                 session.rollback()  # <--- CRITICAL: reset session after error
                 print(f"IntegrityError: Webhook URL {webhook_url} already exists in database (race condition or autoflush). Skipping insert.")
@@ -648,7 +685,10 @@ async def pending_deletion_cleanup_loop():
         except Exception as e:
             print(f"Error deleting channel/webhook for {entry.webhook_id}: {e}")
         session.delete(entry)
+    deleted_urls = [entry.webhook_url for entry in pending]
     session.commit()  # Run every hour
+    for webhook_url in deleted_urls:
+        forget_webhook_url(webhook_url)
 
 if __name__ == "__main__":
     print("Starting bot...")
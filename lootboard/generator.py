@@ -14,8 +14,9 @@ import interactions
 from PIL import Image, ImageFont, ImageDraw
 
 from utils.redis import RedisClient
-from utils.wiseoldman import fetch_group_members
+from utils.wiseoldman import get_cached_group_members
 from db.ops import DatabaseOperations, associate_player_ids
+from lootboard.icon_store import icon_store
 
 from utils.format import format_number
 from utils.dynamic_handling import get_value_color, get_dynamic_color, get_coin_image_id
@@ -192,7 +193,7 @@ async def generate_server_board(group_id: int = 0, wom_group_id: int = 0, partit
             wom_group_id = group.wom_id
         elif wom_group_id != 0:
     # Fetch player WOM IDs and associated Player IDs
-            player_wom_ids = await fetch_group_members(wom_group_id, session_to_use=session)
+            player_wom_ids = await get_cached_group_members(wom_group_id, session_to_use=session)
         else:
             player_wom_ids = []
             raw_wom_ids = session.query(Player.wom_id).all() ## get all users if no wom_group_id is found
@@ -364,6 +365,23 @@ async def draw_leaderboard(bg_img, draw, player_totals, *, dynamic_colors, use_g
 
     return bg_img
 
+def get_warm_icon_id(item_id, coin_quantity):
+    """
+    The icon id to pre-load for an item, with the same fallbacks the draw loops use:
+    coins with an unreadable quantity get the single-coin icon, unreadable item ids are skipped.
+    """
+    try:
+        item_id = int(item_id)
+    except (TypeError, ValueError):
+        return None
+    if item_id != 995:
+        return item_id
+    try:
+        coin_quantity = int(coin_quantity)
+    except (TypeError, ValueError):
+        coin_quantity = 1
+    return get_coin_image_id(coin_quantity)
+
 async def draw_drops_on_image(bg_img, draw, group_items, group_id, *, dynamic_colors=False, use_gp=False):
     """
     Draws the items on the image based on the quantities provided in group_items.
@@ -387,6 +405,14 @@ async def draw_drops_on_image(bg_img, draw, group_items, group_id, *, dynamic_co
     # Sort items by value and limit to top 32
     sorted_items = sorted(group_items.items(), key=lambda x: int(x[1]) if isinstance(x[1], int) else int(x[1].split(',')[1]), reverse=True)[:32]
 
+    # Load every icon needed for this board up-front
+    icon_ids = []
+    for item_id, totals in sorted_items:
+        icon_id = get_warm_icon_id(item_id, totals.split(',')[0] if isinstance(totals, str) else totals)
+        if icon_id is not None:
+            icon_ids.append(icon_id)
+    await icon_store.warm(icon_ids)
+
     for i, (item_id, totals) in enumerate(sorted_items):
         try:
             quantity, total_value = map(int, totals.split(','))
@@ -461,6 +487,8 @@ async def draw_recent_drops(bg_img, draw, recent_drops, min_value, *, dynamic_co
     
     # Sort drops by date in descending order and limit to the most recent 12 drops
     sorted_recents = sorted(filtered_recents, key=lambda x: x['date_added'], reverse=True)[:12]
+    icon_ids = [get_warm_icon_id(data["item_id"], data.get("value")) for data in sorted_recents if "item_id" in data]
+    await icon_store.warm([icon_id for icon_id in icon_ids if icon_id is not None])
     
     small_font = ImageFont.truetype(rs_font_path, 18)
     recent_locations = {}
@@ -615,57 +643,11 @@ def save_image(image, server_id, partition):
 async def load_image_from_id(item_id):
     if item_id == "None" or item_id is None or not isinstance(item_id, int):
         return None
-    file_path = f"/store/droptracker/disc/static/assets/img/itemdb/{item_id}.png"
-    item = session.query(ItemList).filter(ItemList.item_id == item_id).first()
-    item_name = item.item_name
-    if item.stackable:
-        all_items = session.query(ItemList).filter(ItemList.item_name == item_name).all()
-        target_item_id = [max(item.stacked, item.item_id) for item in all_items]
-        item_id = target_item_id
-    if not os.path.exists(file_path):
-        try:
-            image_path = await load_rl_cache_img(item_id)
-            if image_path:
-                file_path = image_path
-        except Exception as e:
-            print(f"Error loading image for item ID {item_id}: {e}")
-    loop = asyncio.get_event_loop()
-    try:
-        # Run the blocking Image.open operation in a thread pool
-        image = await loop.run_in_executor(None, Image.open, file_path)
-        return image
-    except Exception as e:
-        print(f"The following file path: {file_path} produced an error: {e}")
-        return None
+    return await icon_store.get(item_id)
 
 
 async def load_rl_cache_img(item_id):
-    url = f"https://static.runelite.net/cache/item/icon/{item_id}.png"
-    print("Attempting to download a new image for item ID", item_id)
-    try:
-        ## save it here
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                # Ensure the request was successful
-                if response.status != 200:
-                    print(f"Failed to fetch image for item ID {item_id}. HTTP status: {response.status}")
-                    return None
-
-                # Read the response content
-                image_data = await response.read()
-
-                # Load the image data into a PIL Image object
-                image = Image.open(BytesIO(image_data))
-                file_path = f"/store/droptracker/disc/static/assets/img/itemdb/{item_id}.png"
-                # print("Saving")
-                image.save(file_path, "PNG")
-                print(f"Saved image to {file_path}")
-                return file_path
-
-    except Exception as e:
-        print("Unable to load the item.")
-    finally:
-        await aiohttp.ClientSession().close()
+    return await icon_store.fetch(item_id)
 
 
 def get_hourly_partitions_from_day(year, month, day):
@@ -765,7 +747,7 @@ async def generate_timeframe_board(bot: interactions.Client, group_id: int = 0,
             wom_group_id = group.wom_id
         
         if wom_group_id != 0:
-            player_wom_ids = await fetch_group_members(wom_group_id)
+            player_wom_ids = await get_cached_group_members(wom_group_id)
         else:
             player_wom_ids = [player[0] for player in session.query(Player.wom_id).all()]
     else:
@@ -0,0 +1,158 @@
+"""
+    Item icon cache used when rendering loot boards.
+
+    Icons are decoded once and kept in an LRU of PIL images; icons that can't be found
+    are negatively cached so a board render doesn't retry them for every item slot.
+    Missing icons can be prefetched in bulk, either from a local RuneLite cache dump
+    or from static.runelite.net over a single pooled HTTP session.
+
+"""
+import asyncio
+import os
+import shutil
+import sys
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import aiohttp
+from PIL import Image
+
+from db.models import ItemList, Session
+
+ITEMDB_DIR = "/store/droptracker/disc/static/assets/img/itemdb/"
+RL_ICON_URL = "https://static.runelite.net/cache/item/icon/{}.png"
+## Directory containing a RuneLite cache item icon dump ({item_id}.png), if one is available locally
+RL_CACHE_DUMP_DIR = os.getenv("RL_CACHE_DUMP_DIR", None)
+
+MAX_CACHED_ICONS = 2048
+MISSING_ICON_TTL = 6 * 3600  # seconds before retrying an icon that couldn't be found
+MAX_CONCURRENT_DOWNLOADS = 16
+
+
+def _decode_icon(file_path: str):
+    with Image.open(file_path) as img:
+        img.load()
+        return img.convert("RGBA") if img.mode != "RGBA" else img.copy()
+
+
+class IconStore:
+    def __init__(self, max_icons: int = MAX_CACHED_ICONS):
+        self.max_icons = max_icons
+        self.icons = OrderedDict()  # item_id -> decoded PIL image
+        self.missing = {}  # item_id -> time after which we try again
+        self.http_session: aiohttp.ClientSession = None
+        self.download_limiter = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, item_id: int):
+        """
+            Returns the decoded icon for item_id, or None if there isn't one.
+            The returned image is shared; callers must copy it before drawing on it.
+        """
+        if item_id is None or not isinstance(item_id, int):
+            return None
+        icon = self.icons.get(item_id)
+        if icon is not None:
+            self.icons.move_to_end(item_id)
+            self.hits += 1
+            return icon
+        if self.missing.get(item_id, 0) > time.time():
+            return None
+        self.misses += 1
+        file_path = os.path.join(ITEMDB_DIR, f"{item_id}.png")
+        if not os.path.exists(file_path):
+            file_path = await self.fetch(item_id)
+            if not file_path:
+                self.missing[item_id] = time.time() + MISSING_ICON_TTL
+                return None
+        try:
+            icon = await asyncio.to_thread(_decode_icon, file_path)
+        except Exception as e:
+            print(f"The following file path: {file_path} produced an error: {e}")
+            self.missing[item_id] = time.time() + MISSING_ICON_TTL
+            return None
+        self._store(item_id, icon)
+        return icon
+
+    async def warm(self, item_ids):
+        """Loads every icon in item_ids concurrently, so drawing a board only hits the LRU"""
+        await asyncio.gather(*(self.get(item_id) for item_id in set(item_ids)))
+
+    def _store(self, item_id: int, icon):
+        self.icons[item_id] = icon
+        self.icons.move_to_end(item_id)
+        while len(self.icons) > self.max_icons:
+            self.icons.popitem(last=False)
+
+    async def _get_http_session(self):
+        if self.http_session is None or self.http_session.closed:
+            self.http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15))
+        return self.http_session
+
+    async def fetch(self, item_id: int, dump_dir: str = RL_CACHE_DUMP_DIR):
+        """
+            Stores the icon for item_id in the itemdb directory,
+            copying it from the local cache dump when possible.
+            Returns the stored file path, or None if the icon doesn't exist.
+        """
+        file_path = os.path.join(ITEMDB_DIR, f"{item_id}.png")
+        if dump_dir:
+            dump_path = os.path.join(dump_dir, f"{item_id}.png")
+            if os.path.exists(dump_path):
+                await asyncio.to_thread(shutil.copyfile, dump_path, file_path)
+                return file_path
+        try:
+            http_session = await self._get_http_session()
+            async with self.download_limiter:
+                async with http_session.get(RL_ICON_URL.format(item_id)) as response:
+                    if response.status != 200:
+                        print(f"Failed to fetch image for item ID {item_id}. HTTP status: {response.status}")
+                        return None
+                    image_data = await response.read()
+            image = Image.open(BytesIO(image_data))
+            await asyncio.to_thread(image.save, file_path, "PNG")
+            print(f"Saved image to {file_path}")
+            return file_path
+        except Exception as e:
+            print(f"Unable to load the icon for item ID {item_id}: {e}")
+            return None
+
+    async def prefetch_all(self, dump_dir: str = RL_CACHE_DUMP_DIR):
+        """
+            Makes sure every item in the ItemList table has an icon stored on disk.
+            Returns (number fetched, number still missing)
+        """
+        session = Session()
+        try:
+            item_ids = [row.item_id for row in session.query(ItemList.item_id).all()]
+        finally:
+            session.close()
+        os.makedirs(ITEMDB_DIR, exist_ok=True)
+        existing = {name[:-4] for name in os.listdir(ITEMDB_DIR) if name.endswith(".png")}
+        to_fetch = [item_id for item_id in item_ids if str(item_id) not in existing]
+        print(f"Prefetching {len(to_fetch)} of {len(item_ids)} item icons...")
+        results = await asyncio.gather(*(self.fetch(item_id, dump_dir) for item_id in to_fetch))
+        fetched = sum(1 for result in results if result)
+        for item_id, result in zip(to_fetch, results):
+            if not result:
+                self.missing[item_id] = time.time() + MISSING_ICON_TTL
+        return fetched, len(to_fetch) - fetched
+
+    async def close(self):
+        if self.http_session is not None and not self.http_session.closed:
+            await self.http_session.close()
+
+
+icon_store = IconStore()
+
+
+if __name__ == "__main__":
+    ## python -m lootboard.icon_store [runelite cache dump directory]
+    async def run_prefetch():
+        dump_dir = sys.argv[1] if len(sys.argv) > 1 else RL_CACHE_DUMP_DIR
+        fetched, missing = await icon_store.prefetch_all(dump_dir)
+        print(f"Prefetched {fetched} icons, {missing} could not be found.")
+        await icon_store.close()
+    asyncio.run(run_prefetch())
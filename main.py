@@ -13,11 +13,13 @@ import multiprocessing
 
 from sqlalchemy import text
 from db.update_player_total import background_task, start_background_redis_tasks
+from db.drop_partitions import maintain_drop_partitions
+from db.drop_archive import archive_closed_partitions
 from services.notification_service import NotificationService
 from services.bot_state import BotState
 from services.lootboards import Lootboards
 from services.channel_names import ChannelNames
-from utils.ge_value import get_true_item_value
+from utils.ge_value import get_true_item_value, price_snapshot
 from utils.embeds import create_boss_pb_embed, update_boss_pb_embed
 from utils.logger import LoggerClient
 from db.app_logger import AppLogger
@@ -44,7 +46,7 @@ from pb.leaderboards import create_pb_embeds
 from lootboard.generator import generate_server_board, get_generated_board_path
 from utils.cloudflare_update import CloudflareIPUpdater
 from utils.msg_logger import HighThroughputLogger
-from utils.wiseoldman import fetch_group_members
+from utils.wiseoldman import get_cached_group_members
 from web.api import create_api
 from web.front import create_frontend
 from commands import UserCommands, ClanCommands
@@ -191,179 +193,208 @@ async def start_group_sync():
     #await logger.log("access", "update_group_members completed...", "start_group_sync")
 
 
-@Task.create(IntervalTrigger(minutes=10))
-async def lootboard_updates():
+@Task.create(IntervalTrigger(minutes=5))
+async def refresh_ge_prices():
+    ## Keeps the GE price snapshot used by get_true_item_value up to date
+    await price_snapshot.refresh()
+
+
+@Task.create(IntervalTrigger(hours=24))
+async def maintain_partitions():
+    ## Keeps monthly drops partitions ready ahead of time, and archives months once they've ended
     try:
-        print("Updating loot leaderboards...")
-        session = None
+        await asyncio.to_thread(maintain_drop_partitions)
+    except Exception as e:
+        app_logger.log(log_type="error", data=f"Couldn't maintain the drops partitions: {e}", app_name="main", description="maintain_partitions")
+    try:
+        await asyncio.to_thread(archive_closed_partitions)
+    except Exception as e:
+        app_logger.log(log_type="error", data=f"Couldn't archive the closed drops partitions: {e}", app_name="main", description="maintain_partitions")
+
+
+LOOTBOARD_CONFIG_KEYS = ('lootboard_channel_id', 'lootboard_message_id', 'loot_board_type')
+LOOTBOARD_CONCURRENCY = 8  # lootboard messages being edited at once
+LOOTBOARD_GROUP_TIMEOUT = 60  # seconds before a single group's update is abandoned
+## Discord rate-limits message edits per channel; boards sharing a channel are updated one at a time
+lootboard_channel_locks = {}
+
+
+def load_lootboard_configs(session):
+    """Loads every group's lootboard configuration in a single query"""
+    group_wom_ids = {group_id: wom_id for group_id, wom_id in session.query(Group.group_id, Group.wom_id).all()}
+    configs = {}
+    rows = session.query(GroupConfiguration.group_id, GroupConfiguration.config_key, GroupConfiguration.config_value).filter(
+        GroupConfiguration.config_key.in_(LOOTBOARD_CONFIG_KEYS)
+    ).all()
+    for group_id, config_key, config_value in rows:
+        configs.setdefault(group_id, {})[config_key] = config_value
+    groups_to_update = {}
+    for group_id, config in configs.items():
+        if group_id not in group_wom_ids or 'lootboard_message_id' not in config:
+            continue
+        if config.get('lootboard_channel_id'):
+            groups_to_update[group_id] = {"wom_id": group_wom_ids[group_id],
+                                          "channel": config['lootboard_channel_id'],
+                                          "message": config['lootboard_message_id'] or '',
+                                          "style": config.get('loot_board_type')}
+    return groups_to_update
+
+
+def prioritize_lootboards(group_ids):
+    """Orders groups by how many of their members have received loot today, most active first"""
+    group_ids = list(group_ids)
+    today = datetime.now().strftime('%Y%m%d')
+    try:
+        pipeline = redis_client.client.pipeline(transaction=False)
+        for group_id in group_ids:
+            pipeline.zcard(f"leaderboard:group:{group_id}:{today}")
+        activity = dict(zip(group_ids, pipeline.execute()))
+    except Exception as e:
+        print(f"Couldn't prioritize loot leaderboards by recent activity: {e}")
+        return group_ids
+    return sorted(group_ids, key=lambda group_id: activity.get(group_id, 0), reverse=True)
+
+
+def set_lootboard_message_id(session, group_id, message_id):
+    configured_message = session.query(GroupConfiguration).filter(GroupConfiguration.group_id == group_id,
+                                                                  GroupConfiguration.config_key == 'lootboard_message_id').first()
+    if configured_message and configured_message.config_value != str(message_id):
+        configured_message.config_value = str(message_id)
+        session.commit()
+
+
+async def get_lootboard_message(session, channel, group_id, group):
+    """Returns the message a group's lootboard is displayed in, sending a placeholder if there isn't one"""
+    if group['message'] != '':
         try:
-            session = Session()
-            all_groups = session.query(Group).all()
-            groups_to_update = {}
-            for group in all_groups:
-                group_id = group.group_id
-                configured_channel = session.query(GroupConfiguration).filter(GroupConfiguration.group_id == group_id,
-                                                                            GroupConfiguration.config_key == 'lootboard_channel_id').first()
-                configured_message = session.query(GroupConfiguration).filter(GroupConfiguration.group_id == group_id,
-                                                                            GroupConfiguration.config_key == 'lootboard_message_id').first()
-                if configured_channel and configured_message:
-                    if configured_channel.config_value:
-                        groups_to_update[group_id] = {"wom_id": group.wom_id,
-                                                    "channel": configured_channel.config_value,
-                                                    "message": configured_message.config_value}
-            
-            for group_id, group in groups_to_update.items():
+            return await channel.fetch_message(message_id=group['message'])
+        except Exception as e:
+            #print("Couldn't fetch the message for this lootboard...:", e)
+            return None
+    try:
+        messages = await channel.fetch_messages(limit=15)
+    except Exception as e:
+        # print("Unable to fetch message history from channel id ", group['channel'], "e:", e)
+        return None
+    message_to_update = None
+    for message in messages:
+        if message.author.id == bot.user.id and message.embeds:
+            if message_to_update is not None and message.id != message_to_update.id:
                 try:
-                    channel: interactions.Channel = await bot.fetch_channel(channel_id=group['channel'])
-                    message_to_update = None
-                    group_obj = session.query(Group).filter(Group.group_id == group_id).first()
-                    if group['message'] != '':
-                        try:
-                            message = await channel.fetch_message(message_id=group['message'])
-                        except Exception as e:
-                            #print("Couldn't fetch the message for this lootboard...:", e)
-                            continue
-                            
-                    else:
-                        try:
-                            messages = await channel.fetch_messages(limit=15)
-                        except Exception as e:
-                            # print("Unable to fetch message history from channel id ", group['channel'], "e:", e)
-                            continue
-                        message_to_update = None
-                        for message in messages:
-                            if message.author.id == bot.user.id and message.embeds:
-                                message_to_update = message
-                                if message_to_update is not None and message.id != message_to_update.id:
-                                    try:
-                                        await message.delete()
-                                    except Exception as e:
-                                        print(f"Couldn't delete an old message for group {group_id}: {e}")
-                        if not message_to_update:
-                            print(f"No message ID found for group {group_id} ({group_obj.group_name}). We would have sent a new one right now...")
-                            try:
-                                new_board = await channel.send(f"This loot leaderboard is being initialized.... Please wait a few moments.")
-                                new_board_msg_id = new_board.id
-                                configured_message = session.query(GroupConfiguration).filter(GroupConfiguration.group_id == group_id,
-                                                                                            GroupConfiguration.config_key == 'lootboard_message_id').first()
-                                configured_message.config_value = str(new_board_msg_id)
-                                session.commit()
-                            except Exception as e:
-                                print(f"Couldn't send a message to the channel: {e}")
-                                continue
-                            staffchat = await bot.fetch_channel(channel_id=1210765308239945729)
-
-                            group_obj = session.query(Group).filter(Group.group_id == group_id).first()
-                            configured_message = session.query(GroupConfiguration).filter(GroupConfiguration.group_id == group_id,
-                                                                                    GroupConfiguration.config_key == 'lootboard_message_id').first()
-                            
-                        else: ## found previous message from the bot
-                            message = message_to_update
-                            configured_message = session.query(GroupConfiguration).filter(GroupConfiguration.group_id == group_id,
-                                                                                            GroupConfiguration.config_key == 'lootboard_message_id').first()
-                            if configured_message.config_value != str(message.id):  
-                                configured_message.config_value = str(message.id)
-                                session.commit()
-                            if not message:
-                                message = await channel.send(f"<a:loading:1180923500836421715> Please wait while we initialize this Loot Leaderboard....")
-                                print(f"No message ID found for group {group_id} ({group_obj.group_name}). Creating a new one...")
-                                try:
-                                    configured_message = session.query(GroupConfiguration).filter(GroupConfiguration.group_id == group_id,
-                                                                                            GroupConfiguration.config_key == 'lootboard_message_id').first()
-                                    configured_message.config_value = str(message.id)
-                                    session.commit()
-                                except Exception as e:
-                                    print(f"Couldn't update the lootboard message ID with a new one... e: {e}")
-                    if not message:
-                        print(f"Couldn't get the message to update the loot leaderboard with...")
-                        try:
-                            message = await channel.send(f"<a:loading:1180923500836421715> Please wait while we initialize this Loot Leaderboard....")
-                            configured_message = session.query(GroupConfiguration).filter(GroupConfiguration.group_id == group_id,
-                                                                                        GroupConfiguration.config_key == 'lootboard_message_id').first()
-                            configured_message.config_value = str(message.id)
-                            session.commit()
-                        except Exception as e:
-                            print(f"Couldn't send a new message to the channel: {e}")
-                        continue
-                    
-                    wom_id = group['wom_id']
-                    if not wom_id:
-                        wom_id = 0
-                        # Use the direct URL and call the updates in our external process.
-                    image_path = f"/store/droptracker/disc/static/assets/img/clans/{group_id}/lb/lootboard.png"
-                    if not os.path.exists(image_path):
-                        print(f"Lootboard image not found for group {group_id} ({group_obj.group_name}).")
-                        continue
-                    
-                    try:
-                        embed_template = await db.get_group_embed('lb', group_id)
-                    except Exception as e:
-                        print("Unable to obtain embed_template for group", group_obj.group_name, "e:", e)
-                        continue
-                    if group_id != 2:
-                        player_wom_ids = await fetch_group_members(wom_id)
-                        player_ids = await associate_player_ids(player_wom_ids)
-                        total_tracked = len(player_ids)
-                    else:
-                        total_tracked = session.query(Player.wom_id).count()
-                    next_update = datetime.now() + timedelta(minutes=10)
-                    future_timestamp = int(time.mktime(next_update.timetuple()))
-                    value_dict = {
-                        "{next_refresh}": f"<t:{future_timestamp}:R>",
-                        "{tracked_members}": total_tracked
-                    }
-                    try:
-                        embed = replace_placeholders(embed_template, value_dict)
-                    except Exception as e:
-                        print("Unable to replace placeholders for group", group_obj.group_name, "e:", e)
-                        continue
-                    try:
-                        message.attachments.clear()
-                        lootboard = interactions.File(image_path)
-                        await message.edit(content="",embed=embed,files=lootboard)
-                        print("Updated the loot leaderboard for group", group_obj.group_name)
-                    except Exception as e:
-                        print("Unable to edit the message for group", group_obj.group_name, "e:", e)
-                        continue
+                    await message.delete()
                 except Exception as e:
-                    configured_style = None
-                    try:
-                        configured_style = session.query(GroupConfiguration).filter(GroupConfiguration.group_id == group_id,
-                                                                            GroupConfiguration.config_key == 'loot_board_type').first()
-                    except:
-                        pass
-                        
-                    if configured_style:
-                        # app_logger.log(log_type="error", data=f"Loot leaderboards -- Couldn't create/send {group_obj.group_name} (#{group_id})'s embed: {e}\n" + 
-                        #                  "Board style is:" + configured_style.config_value, app_name="core", description="update_loot_leaderboards")
-                        print("Exception occurred while updating the loot leaderboard for group", group_obj.group_name, "e:", e, "type:", type(e))
-                    else:
-                        print("Exception occurred while updating the loot leaderboard for group", group_obj.group_name, "e:", e, "type:", type(e))
-                # Wait 1 second before processing the next group
-                await asyncio.sleep(1)
+                    print(f"Couldn't delete an old message for group {group_id}: {e}")
+                continue
+            message_to_update = message
+    if message_to_update:
+        ## found previous message from the bot
+        set_lootboard_message_id(session, group_id, message_to_update.id)
+        return message_to_update
+    print(f"No message ID found for group {group_id}. Creating a new one...")
+    try:
+        new_board = await channel.send(f"<a:loading:1180923500836421715> Please wait while we initialize this Loot Leaderboard....")
+        set_lootboard_message_id(session, group_id, new_board.id)
+    except Exception as e:
+        print(f"Couldn't send a new message to the channel: {e}")
+    ## The board is filled in on the next cycle
+    return None
+
+
+async def update_group_lootboard(group_id, group, semaphore: asyncio.Semaphore):
+    """Updates a group's lootboard once a slot (and its channel) is free; returns False if it timed out"""
+    channel_lock = lootboard_channel_locks.setdefault(str(group['channel']), asyncio.Lock())
+    async with channel_lock, semaphore:
+        try:
+            await asyncio.wait_for(refresh_group_lootboard(group_id, group), timeout=LOOTBOARD_GROUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Timed out updating the loot leaderboard for group {group_id}")
+            return False
+    return True
+
+
+async def refresh_group_lootboard(group_id, group):
+    session = Session()
+    group_name = group_id
+    try:
+        group_obj = session.query(Group).filter(Group.group_id == group_id).first()
+        group_name = group_obj.group_name if group_obj else group_id
+        image_path = f"/store/droptracker/disc/static/assets/img/clans/{group_id}/lb/lootboard.png"
+        if not os.path.exists(image_path):
+            print(f"Lootboard image not found for group {group_id} ({group_name}).")
+            return
+        channel: interactions.Channel = await bot.fetch_channel(channel_id=group['channel'])
+        message = await get_lootboard_message(session, channel, group_id, group)
+        if not message:
+            return
+        
+        wom_id = group['wom_id']
+        if not wom_id:
+            wom_id = 0
+        try:
+            embed_template = await db.get_group_embed('lb', group_id)
         except Exception as e:
-            print(f"Major error in loot leaderboard update: {e}")
-            if session:
-                try:
-                    session.rollback()
-                except:
-                    pass
+            print("Unable to obtain embed_template for group", group_name, "e:", e)
+            return
+        if group_id != 2:
+            player_wom_ids = await get_cached_group_members(wom_id)
+            player_ids = await associate_player_ids(player_wom_ids)
+            total_tracked = len(player_ids)
+        else:
+            total_tracked = session.query(Player.wom_id).count()
+        next_update = datetime.now() + timedelta(minutes=10)
+        future_timestamp = int(time.mktime(next_update.timetuple()))
+        value_dict = {
+            "{next_refresh}": f"<t:{future_timestamp}:R>",
+            "{tracked_members}": total_tracked
+        }
+        try:
+            embed = replace_placeholders(embed_template, value_dict)
+        except Exception as e:
+            print("Unable to replace placeholders for group", group_name, "e:", e)
+            return
+        try:
+            message.attachments.clear()
+            lootboard = interactions.File(image_path)
+            await message.edit(content="",embed=embed,files=lootboard)
+            print("Updated the loot leaderboard for group", group_name)
+        except Exception as e:
+            print("Unable to edit the message for group", group_name, "e:", e)
+    except Exception as e:
+        session.rollback()
+        print("Exception occurred while updating the loot leaderboard for group", group_name,
+              "(style:", group.get('style'), ") e:", e, "type:", type(e))
+    finally:
+        session.close()
+
+
+@Task.create(IntervalTrigger(minutes=10))
+async def lootboard_updates():
+    try:
+        print("Updating loot leaderboards...")
+        started_at = time.time()
+        session = Session()
+        try:
+            groups_to_update = load_lootboard_configs(session)
         finally:
-            if session:
-                try:
-                    session.close()
-                except:
-                    pass
-        
-        print("Completed loot leaderboard update. Waiting 5 minutes before the next update.")
+            session.close()
+        semaphore = asyncio.Semaphore(LOOTBOARD_CONCURRENCY)
+        updates = [update_group_lootboard(group_id, groups_to_update[group_id], semaphore)
+                   for group_id in prioritize_lootboards(groups_to_update.keys())]
+        results = await asyncio.gather(*updates, return_exceptions=True)
+        timed_out = sum(1 for result in results if result is False)
+        print(f"Completed loot leaderboard update for {len(groups_to_update)} groups in {time.time() - started_at:.1f}s" +
+              (f" ({timed_out} timed out)" if timed_out else ""))
     except Exception as e:
         print(f"Critical error in loot leaderboard update loop: {e}")
-    
-    # Wait 5 minutes before the next update
-    await asyncio.sleep(300)
 
 async def create_tasks():    
     notification_sync.start()
+    ## Serve prices from the saved snapshot straight away; the first refresh runs in the background
+    price_snapshot.load()
+    asyncio.create_task(refresh_ge_prices())
+    refresh_ge_prices.start()
+    asyncio.create_task(maintain_partitions())
+    maintain_partitions.start()
     print("Starting lootboards")
     await lootboard_updates()
     lootboard_updates.start()
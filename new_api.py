@@ -13,6 +13,7 @@ import time
 from collections import defaultdict, deque
 import threading
 import asyncio
+import json
 import pymysql
 
 ## Core package dependencies
@@ -24,6 +25,8 @@ from db.models import Session, session, Player, Group, CollectionLogEntry, Perso
 
 ## API Packages
 from api.services.metrics import MetricsTracker
+from api.services.rate_limiter import SubmissionLimiter
+from api.services.multipart import get_boundary, parse_multipart_stream
 
 from utils.download import download_image, download_player_image
 
@@ -64,9 +67,32 @@ def reset_db_connections():
 # Initialize metrics tracker
 metrics = MetricsTracker()
 
+# Shared (cross-worker) limiter for the submission endpoints
+submission_limiter = SubmissionLimiter()
+
+def get_client_ip():
+    """
+    Get the originating IP of a request, accounting for the NGINX proxy.
+    Only trusts what the proxy itself set: X-Real-IP, or the last (proxy-appended)
+    X-Forwarded-For hop -- earlier hops are whatever the client sent.
+    """
+    real_ip = request.headers.get("X-Real-IP", "").strip()
+    if real_ip:
+        return real_ip
+    forwarded_for = request.headers.get("X-Forwarded-For", "")
+    if forwarded_for:
+        last_hop = forwarded_for.split(",")[-1].strip()
+        if last_hop:
+            return last_hop
+    return request.remote_addr
+
+def rate_limited_response(retry_after):
+    response = jsonify({"error": "Rate limit exceeded"})
+    response.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+    return response, 429
+
 
 @app.route("/submit", methods=["POST"])
-@rate_limit(limit=10,period=timedelta(seconds=1))
 async def submit_data():
     return await webhook_data()
     
@@ -104,7 +130,6 @@ async def get_latest_news():
     return "You have the api enabled & we've connected properly."
 
 @app.route("/webhook", methods=["POST"])
-@rate_limit(limit=10,period=timedelta(seconds=1))
 async def webhook_data():
     """
     Handle Discord webhook-style messages and convert them to the standard format
@@ -113,6 +138,11 @@ async def webhook_data():
     success = False
     request_type = "webhook"
     
+    allowed, retry_after = submission_limiter.check_ip(get_client_ip())
+    if not allowed:
+        metrics.record_request(request_type, success)
+        return rate_limited_response(retry_after)
+    
     try:
         # Debug the raw request to see what's coming in
         content_type = request.headers.get('Content-Type', '')
@@ -120,37 +150,21 @@ async def webhook_data():
         
         # Check if this is a multipart request
         if 'multipart/form-data' in content_type:
+            uploads = {}
             try:
-                # Get the boundary from the content type
-                boundary = None
-                for part in content_type.split(';'):
-                    part = part.strip()
-                    if part.startswith('boundary='):
-                        boundary = part[9:].strip('"')
-                        break
-                
-                print(f"Found boundary: {boundary}")
-                
-                # Get the raw request data
-                body = await request.body
-                body_str = body.decode('latin1')  # Use latin1 to handle binary data
+                boundary = get_boundary(content_type)
+                if not boundary:
+                    return jsonify({"error": "No boundary found in multipart request"}), 400
                 
-                # Print the first 200 chars to see the structure
-                print(f"Request body preview: {body_str[:200]}...")
-                
-                # Look for the file part in the raw body
-                file_header = f'Content-Disposition: form-data; name="file"; filename="image.jpeg"'
-                
-                # Process the form data normally
-                form = await request.form
-                print(f"Form keys: {list(form.keys())}")
+                # Stream the body: payload_json stays in memory, attachments go straight to disk
+                form, uploads = await parse_multipart_stream(request.body, boundary)
+                print(f"Form keys: {list(form.keys())}, files: {list(uploads.values())}")
                 
                 payload_json = form.get('payload_json')
                 if not payload_json:
                     return jsonify({"error": "No payload_json found in form data"}), 400
                 
                 # Parse the JSON payload
-                import json
                 webhook_data = json.loads(payload_json)
                 
                 if webhook_data is None:
@@ -158,14 +172,9 @@ async def webhook_data():
                 
                 print("Parsed webhook data:", webhook_data)
                 
-                # Try to get the file directly from the request files
-                files = await request.files
-                print(f"Request files: {files}")
-                
                 # Handle image file if present
-                image_file = None
-                if 'file' in files:
-                    image_file = files['file']
+                image_file = uploads.get('file', None)
+                if image_file:
                     print(f"Received image file: {image_file.filename}, "
                           f"content_type: {image_file.content_type}")
                 
@@ -175,53 +184,82 @@ async def webhook_data():
                 if not processed_data:
                     return jsonify({"error": "Could not process webhook data"}), 400
                 
-                # Add image data to processed_data if available
-                submission_type = processed_data.get("type")
-                processed_data["downloaded"] = False
+                account_hash = processed_data.get("acc_hash", None)
+                if account_hash:
+                    allowed, retry_after = submission_limiter.check_account(str(account_hash))
+                    if not allowed:
+                        return rate_limited_response(retry_after)
                 
-                if image_file:
-                    print("Got image file in form data")
-                    processed_data["has_image"] = True
-                    with Session() as session:
-                        player = session.query(Player).filter(Player.player_name == processed_data.get("player", None)).first()
-                        if player:
-                            file_path = await download_image(submission_type, player, image_file, processed_data)
-                            processed_data["image_url"] = file_path
-                            processed_data["downloaded"] = True
+                # Collapse retries of a submission we've already accepted. Header/id-only: the
+                # RuneLite plugin doesn't send an id today, so its submissions are never deduplicated
+                # (identical payloads can be two real drops)
+                claimed, idempotency_key = submission_limiter.claim_submission(
+                    processed_data, request.headers.get("Idempotency-Key"))
+                if not claimed:
+                    print(f"Ignoring duplicate submission ({idempotency_key})")
+                    success = True
+                    return jsonify({"message": "Duplicate submission ignored"}), 200
                 
-                # Create a fresh database connection for each request
-                session = get_db_session()
+                # Anything failing from here on must not leave the id claimed, or the client's retry
+                # would be discarded as a duplicate and the submission lost
                 try:
-                    match (submission_type):
-                        case "drop" | "other"| "npc":
-                            print("Sent to drop processor")
-                            await submissions.drop_processor(processed_data, external_session=session)
-                        case "collection_log":
-                            print("Sent to clog processor")
-                            await submissions.clog_processor(processed_data, external_session=session)
-                        case "personal_best":
-                            print("Sent to pb processor")
-                            await submissions.pb_processor(processed_data, external_session=session)
-                        case "combat_achievement":
-                            print("Sent to ca processor")
-                            await submissions.ca_processor(processed_data, external_session=session)
-                        case _:
-                            return jsonify({"error": f"Unknown submission type: {submission_type}"}), 400
-                except Exception as processor_error:
-                    print(f"Processor error: {processor_error}")
-                    # Roll back on error
-                    session.rollback()
-                    return jsonify({"error": f"Error processing data: {str(processor_error)}"}), 500
-                finally:
-                    # Always close the session
-                    reset_db_connections()
+                    # Add image data to processed_data if available
+                    submission_type = processed_data.get("type")
+                    processed_data["downloaded"] = False
+                
+                    if image_file:
+                        print("Got image file in form data")
+                        processed_data["has_image"] = True
+                        with Session() as session:
+                            player = session.query(Player).filter(Player.player_name == processed_data.get("player", None)).first()
+                            if player:
+                                file_path = await download_image(submission_type, player, image_file, processed_data)
+                                processed_data["image_url"] = file_path
+                                processed_data["downloaded"] = True
+                
+                    # Create a fresh database connection for each request
+                    session = get_db_session()
+                    try:
+                        match (submission_type):
+                            case "drop" | "other"| "npc":
+                                print("Sent to drop processor")
+                                await submissions.drop_processor(processed_data, external_session=session)
+                            case "collection_log":
+                                print("Sent to clog processor")
+                                await submissions.clog_processor(processed_data, external_session=session)
+                            case "personal_best":
+                                print("Sent to pb processor")
+                                await submissions.pb_processor(processed_data, external_session=session)
+                            case "combat_achievement":
+                                print("Sent to ca processor")
+                                await submissions.ca_processor(processed_data, external_session=session)
+                            case _:
+                                submission_limiter.release_submission(idempotency_key)
+                                return jsonify({"error": f"Unknown submission type: {submission_type}"}), 400
+                    except Exception as processor_error:
+                        print(f"Processor error: {processor_error}")
+                        # Allow the plugin's retry to be processed
+                        submission_limiter.release_submission(idempotency_key)
+                        # Roll back on error
+                        session.rollback()
+                        return jsonify({"error": f"Error processing data: {str(processor_error)}"}), 500
+                    finally:
+                        # Always close the session
+                        reset_db_connections()
                 
-                success = True
-                return jsonify({"message": "Webhook data processed successfully"}), 200
+                    success = True
+                    return jsonify({"message": "Webhook data processed successfully"}), 200
+                except Exception:
+                    submission_limiter.release_submission(idempotency_key)
+                    raise
                 
             except Exception as e:
                 print(f"Error processing multipart request: {e}")
                 return jsonify({"error": f"Error processing request: {str(e)}"}), 400
+            finally:
+                # Clean up any attachment that wasn't moved into place
+                for upload in uploads.values():
+                    upload.discard()
         else:
             # Handle non-multipart requests (e.g., JSON)
             try:
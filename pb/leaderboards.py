@@ -1,12 +1,137 @@
+import heapq
 import os
-from db.models import session, Group, NpcList, User, Player, user_group_association, PersonalBestEntry
+import sys
+from collections import namedtuple
+from db.models import Session, session, Group, NpcList, User, Player, user_group_association, PersonalBestEntry
 from sqlalchemy import select, func
 from sqlalchemy.orm import aliased
 from interactions import Embed
 
 from utils.format import convert_from_ms, get_npc_image_url
+from utils.redis import redis_client
 
-async def get_group_pbs(boss_name, group_id):
+"""
+    Personal best leaderboards are kept in Redis, as one zset per (npc, team size, group) scored by the
+    kill time in ms, so that the top entries can be read without touching the personal_best table.
+    Group 2 is the global leaderboard and holds every player's PBs.
+
+    pb_processor updates them as PBs come in and update_group_members as members join or leave a group;
+    `python -m pb.leaderboards rebuild` recreates them from the database.
+"""
+
+PB_LEADERBOARD_KEY = "pb_leaderboard:{}:{}:{}"  # npc_id, team_size, group_id
+PB_TEAM_SIZES_KEY = "pb_leaderboard:{}:team_sizes"  # npc_id -> the team sizes with a leaderboard
+GLOBAL_GROUP_ID = 2
+REBUILD_CHUNK_SIZE = 5000
+
+PbEntry = namedtuple("PbEntry", ["player_id", "personal_best"])
+
+
+def update_pb_leaderboards(player_id: int, npc_id: int, team_size, personal_best: int, group_ids, pipeline=None):
+    """
+        Stores a player's PB on the global leaderboard and on those of their groups.
+        :param: pipeline: add the commands to this pipeline instead of executing them
+    """
+    execute = pipeline is None
+    if execute:
+        pipeline = redis_client.client.pipeline(transaction=False)
+    for group_id in set(group_ids) | {GLOBAL_GROUP_ID}:
+        pipeline.zadd(PB_LEADERBOARD_KEY.format(npc_id, team_size, group_id), {player_id: personal_best})
+    pipeline.sadd(PB_TEAM_SIZES_KEY.format(npc_id), str(team_size))
+    if execute:
+        pipeline.execute()
+
+
+def get_top_pbs(npc_id: int, team_size, group_id: int, count: int = 5):
+    """Returns the `count` fastest PbEntry for an npc, team size and group"""
+    key = PB_LEADERBOARD_KEY.format(npc_id, team_size, group_id)
+    end = count - 1 if count else -1
+    return [PbEntry(int(player_id), int(score))
+            for player_id, score in redis_client.client.zrange(key, 0, end, withscores=True)]
+
+
+def get_pb_count(npc_id: int, team_size, group_id: int) -> int:
+    return redis_client.client.zcard(PB_LEADERBOARD_KEY.format(npc_id, team_size, group_id))
+
+
+def get_pb_team_sizes(npc_id: int):
+    return [team_size.decode('utf-8') for team_size in redis_client.client.smembers(PB_TEAM_SIZES_KEY.format(npc_id))]
+
+
+def apply_membership_changes(added, removed, session_to_use=None):
+    """
+        Adds the PBs of new group members to their group's leaderboards, and removes those of members that left.
+        :param: added, removed: lists of (group_id, player_id)
+    """
+    if not added and not removed:
+        return
+    pipeline = redis_client.client.pipeline(transaction=False)
+    if removed:
+        removed_by_player = {}
+        for group_id, player_id in removed:
+            removed_by_player.setdefault(player_id, set()).add(group_id)
+        rows = _get_pb_rows(removed_by_player.keys(), session_to_use)
+        for player_id, npc_id, team_size, _ in rows:
+            for group_id in removed_by_player[player_id] - {GLOBAL_GROUP_ID}:
+                pipeline.zrem(PB_LEADERBOARD_KEY.format(npc_id, team_size, group_id), player_id)
+    if added:
+        added_by_player = {}
+        for group_id, player_id in added:
+            added_by_player.setdefault(player_id, set()).add(group_id)
+        rows = _get_pb_rows(added_by_player.keys(), session_to_use)
+        for player_id, npc_id, team_size, personal_best in rows:
+            update_pb_leaderboards(player_id, npc_id, team_size, personal_best, added_by_player[player_id], pipeline=pipeline)
+    pipeline.execute()
+
+
+def _get_pb_rows(player_ids, session_to_use=None):
+    sesh = session_to_use if session_to_use is not None else session
+    player_ids = list(player_ids)
+    rows = []
+    for i in range(0, len(player_ids), REBUILD_CHUNK_SIZE):
+        rows.extend(sesh.query(
+            PersonalBestEntry.player_id, PersonalBestEntry.npc_id,
+            PersonalBestEntry.team_size, PersonalBestEntry.personal_best
+        ).filter(PersonalBestEntry.player_id.in_(player_ids[i:i + REBUILD_CHUNK_SIZE])).all())
+    return rows
+
+
+def rebuild_pb_leaderboards():
+    """Recreates every PB leaderboard from the personal_best table. Returns the number of PBs stored"""
+    sesh = Session()
+    try:
+        player_groups = {}
+        for player_id, group_id in sesh.query(user_group_association.c.player_id, user_group_association.c.group_id).filter(
+                user_group_association.c.player_id.isnot(None), user_group_association.c.group_id.isnot(None)).all():
+            player_groups.setdefault(player_id, set()).add(group_id)
+
+        stale_keys = list(redis_client.client.scan_iter(match="pb_leaderboard:*", count=1000))
+        for i in range(0, len(stale_keys), REBUILD_CHUNK_SIZE):
+            redis_client.client.delete(*stale_keys[i:i + REBUILD_CHUNK_SIZE])
+
+        stored = 0
+        last_id = 0
+        while True:
+            rows = sesh.query(
+                PersonalBestEntry.id, PersonalBestEntry.player_id, PersonalBestEntry.npc_id,
+                PersonalBestEntry.team_size, PersonalBestEntry.personal_best
+            ).filter(PersonalBestEntry.id > last_id).order_by(PersonalBestEntry.id).limit(REBUILD_CHUNK_SIZE).all()
+            if not rows:
+                break
+            pipeline = redis_client.client.pipeline(transaction=False)
+            for _, player_id, npc_id, team_size, personal_best in rows:
+                if player_id is None or npc_id is None:
+                    continue
+                update_pb_leaderboards(player_id, npc_id, team_size, personal_best,
+                                       player_groups.get(player_id, ()), pipeline=pipeline)
+                stored += 1
+            pipeline.execute()
+            last_id = rows[-1].id
+        return stored
+    finally:
+        sesh.close()
+
+async def get_group_pbs(boss_name, group_id, limit: int = None):
     # Validate the inputs
     if not group_id or not boss_name:
         return {"error": "A group ID and boss name must be provided."}
@@ -22,62 +147,28 @@ async def get_group_pbs(boss_name, group_id):
                 thumb_url = f"https://www.droptracker.io/img/npcdb/{npcid}.png"
     if not thumb_url:
         thumb_url = "https://www.droptracker.io/img/droptracker-small.gif"
-    # Step 2: Conditional query logic based on group_id
-    if group_id == 2:
-        # Global ranking: query PersonalBestEntry objects for the specified npc_id list, ignoring group filtering
-        pbs_query = (
-            session.query(
-                PersonalBestEntry.player_id,
-                PersonalBestEntry.npc_id,
-                PersonalBestEntry.personal_best.label('best_time_seconds'),  # Use `personal_best` for ranking
-                Player.player_name,
-                User.username
-            )
-            .join(Player, PersonalBestEntry.player_id == Player.player_id)
-            .outerjoin(User, User.user_id == Player.user_id)
-            .filter(PersonalBestEntry.npc_id.in_(npc_id_list))
-            .order_by(PersonalBestEntry.personal_best.asc())
-        )
-    else:
-        # Group-specific ranking: query only PersonalBestEntry objects for players in the specified group
-        # Step 2a: Get player IDs in the specified group
-        query = select(Player.player_id, Player.player_name, User.username) \
-            .select_from(user_group_association) \
-            .join(Player, Player.player_id == user_group_association.c.player_id) \
-            .outerjoin(User, User.user_id == Player.user_id) \
-            .where(user_group_association.c.group_id == group_id)
-
-        players_result = session.execute(query)
-        players = players_result.fetchall()
-        player_ids = [player.player_id for player in players]
-
-        # Step 2b: Query PersonalBestEntry objects for the specified npc_id list and group player IDs
-        pbs_query = (
-            session.query(
-                PersonalBestEntry.player_id,
-                PersonalBestEntry.npc_id,
-                PersonalBestEntry.personal_best.label('best_time_seconds'),  # Use `personal_best` for ranking
-                Player.player_name,
-                User.username
-            )
-            .join(Player, PersonalBestEntry.player_id == Player.player_id)
-            .outerjoin(User, User.user_id == Player.user_id)
-            .filter(
-                PersonalBestEntry.player_id.in_(player_ids),
-                PersonalBestEntry.npc_id.in_(npc_id_list)
-            )
-            .order_by(PersonalBestEntry.personal_best.asc())
-        )
 
-    # Step 3: Execute the query and build structured output with rankings
-    pbs_results = pbs_query.all()
+    # Step 2: Read the fastest entries from each team size's leaderboard and merge them
+    leaderboards = []
+    for npc_id in npc_id_list:
+        for team_size in get_pb_team_sizes(npc_id):
+            leaderboards.append(get_top_pbs(npc_id, team_size, group_id, count=limit))
+    top_pbs = list(heapq.merge(*leaderboards, key=lambda entry: entry.personal_best))
+    if limit:
+        top_pbs = top_pbs[:limit]
+
+    # Step 3: Build structured output with rankings
+    player_names = {}
+    if top_pbs:
+        player_names = dict(session.query(Player.player_id, Player.player_name).filter(
+            Player.player_id.in_({pb.player_id for pb in top_pbs})).all())
     ranked_pbs = []
-    for rank, pb in enumerate(pbs_results, start=1):
+    for rank, pb in enumerate(top_pbs, start=1):
         ranked_pbs.append({
             "rank": rank,
             "player_id": pb.player_id,
-            "player_name": pb.player_name,
-            "personal_best_seconds": convert_from_ms(pb.best_time_seconds)
+            "player_name": player_names.get(pb.player_id, "Unknown"),
+            "personal_best_seconds": convert_from_ms(pb.personal_best)
         })
 
     # Step 4: Return the structured result
@@ -113,7 +204,7 @@ async def create_pb_embeds(group_id, included_list, max_entries=5):
             ## Entry validation logic
             continue
         # Get the group's personal bests for the current NPC
-        group_pbs_response = await get_group_pbs(npc, group_id)
+        group_pbs_response = await get_group_pbs(npc, group_id, limit=max_entries)
         
         if "error" in group_pbs_response:
             continue  # Skip if there's an error in the response
@@ -145,3 +236,11 @@ async def create_pb_embeds(group_id, included_list, max_entries=5):
         embeds.append(embed)
     
     return embeds
+
+
+if __name__ == "__main__":
+    ## python -m pb.leaderboards rebuild
+    if sys.argv[1:] == ["rebuild"]:
+        print(f"Rebuilt the PB leaderboards with {rebuild_pb_leaderboards()} personal bests")
+    else:
+        print("Usage: python -m pb.leaderboards rebuild")
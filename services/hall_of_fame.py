@@ -12,6 +12,8 @@ from db.ops import get_formatted_name
 from utils.format import convert_from_ms, format_number, get_npc_image_url
 import asyncio
 from utils.redis import redis_client
+from pb.leaderboards import get_pb_count, get_pb_team_sizes, get_top_pbs
+from utils.embed_refresh import PRIORITY_PERIODIC, PRIORITY_SUBMISSION, embed_refresh, payload_fingerprint
 
 class HallOfFame(Extension):
     def __init__(self, bot: interactions.Client):
@@ -34,10 +36,10 @@ class HallOfFame(Extension):
             groups_to_update = session.query(GroupConfiguration.group_id).filter(GroupConfiguration.config_key == "create_pb_embeds",
                                                                                  GroupConfiguration.config_value == "1").all()
             for group in groups_to_update:
-                await self._update_group_hof(group)
+                await self._update_group_hof(group, priority=PRIORITY_PERIODIC)
             await asyncio.sleep(360)
 
-    async def _update_group_hof(self, group: Group):
+    async def _update_group_hof(self, group: Group, priority: int = PRIORITY_SUBMISSION, force: bool = False):
         if self._is_in_development() and group.group_id != 2:
             return
         group_bosses = []
@@ -59,8 +61,9 @@ class HallOfFame(Extension):
             boss = boss.replace('"', '')
             npc = session.query(NpcList).filter(NpcList.npc_name == boss).first()
             if npc:
-                components = await self._finalize_boss_components(npc, group)
-                await self._send_boss_components(group.group_id, npc, components)
+                if force:
+                    embed_refresh.forget("hall_of_fame", group.group_id, npc.npc_id)
+                self._request_boss_refresh(group.group_id, npc, priority)
             else:
                 print(f"NPC not found for {boss}")
 
@@ -80,6 +83,20 @@ class HallOfFame(Extension):
                 return True
         return False
     
+    def _request_boss_refresh(self, group_id: int, npc: NpcList, priority: int = PRIORITY_SUBMISSION):
+        ## Components are rebuilt when the refresh runs, so a burst of PBs is sent once with the latest data
+        async def refresh():
+            group = session.query(Group).filter(Group.group_id == group_id).first()
+            if group:
+                components = await self._finalize_boss_components(npc, group)
+                await self._send_boss_components(group_id, npc, components)
+        embed_refresh.request("hall_of_fame", group_id, npc.npc_id, refresh, priority=priority)
+
+    async def update_boss_component(self, group_id: int, npc_id: int):
+        npc = session.query(NpcList).filter(NpcList.npc_id == npc_id).first()
+        if npc and await self._should_send_hof(group_id, npc):
+            self._request_boss_refresh(group_id, npc)
+
     async def _update_boss_component(self, group_id: int, npc: NpcList):
         if await self._should_send_hof(group_id, npc):
             group = session.query(Group).filter(Group.group_id == group_id).first()
@@ -90,6 +107,9 @@ class HallOfFame(Extension):
 
     async def _send_boss_components(self, group_id: int, npc: NpcList, components: List[BaseComponent]):
         group = session.query(Group).filter(Group.group_id == group_id).first()
+        fingerprint = payload_fingerprint(components=components)
+        if embed_refresh.is_unchanged("hall_of_fame", group_id, npc.npc_id, fingerprint):
+            return True
         if group:
             channel_cfg = session.query(GroupConfiguration).filter(GroupConfiguration.group_id == group_id, GroupConfiguration.config_key == "channel_id_to_send_pb_embeds").first()
             existing_message = session.query(GroupPersonalBestMessage).filter(GroupPersonalBestMessage.group_id == group_id,
@@ -103,9 +123,9 @@ class HallOfFame(Extension):
                         if channel:
                             message = await channel.fetch_message(message_id)
                             await message.edit(components=components)
+                            embed_refresh.mark_sent("hall_of_fame", group_id, npc.npc_id, fingerprint)
                             existing_message.date_updated = datetime.datetime.now()
                             print(f"Message edited for {npc.npc_name}")
-                            await asyncio.sleep(5)
                             return True
                         else:
                             print(f"Channel not found for {channel_id}")
@@ -121,8 +141,8 @@ class HallOfFame(Extension):
                     channel = await self.bot.fetch_channel(channel_id)
                     if channel:
                         message = await channel.send(components=components)
+                        embed_refresh.mark_sent("hall_of_fame", group_id, npc.npc_id, fingerprint)
                         print(f"Message sent to channel for {npc.npc_name}")
-                        await asyncio.sleep(5)
                         session.add(GroupPersonalBestMessage(group_id=group_id, message_id=message.id, channel_id=channel_id, boss_name=npc.npc_name))
                         session.commit()
                         return True
@@ -200,17 +220,15 @@ class HallOfFame(Extension):
         """
         Create the personal best components for a given group and npc
         """
-        pbs = self._get_pbs(group_id, npc.npc_name)
+        pbs, total_pbs = self._get_pbs(group_id, npc.npc_name)
         components = []
         fastest_kill = None
         #print(f"Got PBs: {pbs}")
         fastest_kill_part = ""
-        total_pbs = 0
         for team_size, entries in pbs.items():
             #print(f"Team size: {team_size}")
-            for pb in entries:
+            for pb in entries[:1]:
                 #print(f"PB: {pb}")
-                total_pbs += 1
                 if fastest_kill is None or pb.personal_best < fastest_kill[0]:
                     fastest_kill = [pb.personal_best, team_size, pb.player_id, None]
         #print(f"Fastest kill: {fastest_kill}")
@@ -289,6 +307,8 @@ class HallOfFame(Extension):
         team_size_order = ["Solo", "1", "2", "3", "4", "5", "6+", "7", "8", "9", "10"]
         pbs = {k: v for k, v in sorted(pbs.items(), key=lambda item: team_size_order.index(str(item[0])) if str(item[0]) in team_size_order else len(team_size_order))}
 
+        player_ids = {pb.player_id for entries in pbs.values() for pb in entries}
+        player_names = dict(session.query(Player.player_id, Player.player_name).filter(Player.player_id.in_(player_ids)).all()) if player_ids else {}
         for team_size, entries in pbs.items():
             team_size_string = self._get_team_size_string(team_size)
             team_size_component = TextDisplayComponent(content=f"-# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n" + 
@@ -299,8 +319,7 @@ class HallOfFame(Extension):
             for i, pb in enumerate(entries):
                 if i >= 5:
                     break
-                pb: PersonalBestEntry = pb
-                pb_text += f"-# {i + 1} - `{convert_from_ms(pb.personal_best)}` - {get_formatted_name(pb.player.player_name, group_id, session)}\n"
+                pb_text += f"-# {i + 1} - `{convert_from_ms(pb.personal_best)}` - {get_formatted_name(player_names.get(pb.player_id, 'Unknown'), group_id, session)}\n"
             pb_component = TextDisplayComponent(content=pb_text)
             components.append(pb_component)
         #print(f"Final components list: {components}")
@@ -318,36 +337,29 @@ class HallOfFame(Extension):
             case _:
                 return f"{team_size} players"
 
-    def _get_pbs(self, group_id: int, npc_name: str):
+    def _get_pbs(self, group_id: int, npc_name: str, count: int = 5):
         """
-        Get the personal bests for a given group and npc name
+        Get the fastest personal bests for a given group and npc name from the PB leaderboards
+        Returns ({team_size: [PbEntry, ...]}, total number of PBs tracked)
         """
         npc_ids = session.query(NpcList.npc_id).filter(NpcList.npc_name == npc_name).all()
         npc_ids = [npc_id[0] for npc_id in npc_ids]
-        player_ids = session.query(text("player_id FROM user_group_association WHERE group_id = :group_id")).params(group_id=group_id).all()
-        player_ids = [player_id[0] for player_id in player_ids]
-        ## Remove duplicates
-        player_ids = list(set(player_ids))
-        pbs = session.query(PersonalBestEntry).filter(PersonalBestEntry.player_id.in_(player_ids), PersonalBestEntry.npc_id.in_(npc_ids)).all()
         personal_bests = {}
-        print(f"Got {len(pbs)} pbs")
-        unique_team_sizes = set()
-        for pb in pbs:
-            if pb.team_size not in unique_team_sizes:
-                unique_team_sizes.add(pb.team_size)
-        print(f"Unique team sizes: {unique_team_sizes}")
-        if len(unique_team_sizes) > 5:
-            ## Remove the largest team sizes if there are more than 5
-            pbs = [pb for pb in pbs if pb.team_size in ["Solo", "2", 2, "3", 3, "4", 4, "5", 5]]
-        for pb in pbs:
-            if pb.team_size not in personal_bests:
-                print(f"Adding team size: {pb.team_size}")
-                personal_bests[pb.team_size] = []
-            personal_bests[pb.team_size].append(pb)
-        for team_size in personal_bests:
-            ## Sort the entries by the lowest personal best
-            personal_bests[team_size].sort(key=lambda x: x.personal_best)
-        return personal_bests
+        total_pbs = 0
+        for npc_id in npc_ids:
+            team_sizes = get_pb_team_sizes(npc_id)
+            if len(team_sizes) > 5:
+                ## Remove the largest team sizes if there are more than 5
+                team_sizes = [team_size for team_size in team_sizes if team_size in ["Solo", "2", "3", "4", "5"]]
+            for team_size in team_sizes:
+                entries = get_top_pbs(npc_id, team_size, group_id, count)
+                if not entries:
+                    continue
+                total_pbs += get_pb_count(npc_id, team_size, group_id)
+                personal_bests[team_size] = sorted(personal_bests.get(team_size, []) + entries,
+                                                   key=lambda x: x.personal_best)[:count]
+        print(f"Got {total_pbs} pbs")
+        return personal_bests, total_pbs
 
     def _get_linked_name(self, npc: NpcList):
         return f"[{npc.npc_name}]({self._get_npc_url(npc)})"
@@ -0,0 +1,290 @@
+"""
+    Background processing of submission screenshots.
+
+    The submission processors only enqueue a job (and leave the entry's image_url blank);
+    a bounded pool of download workers fetches the attachment, de-duplicates it by content
+    hash, re-encodes it to WebP + a thumbnail in a process pool, and then fills in the
+    entry's image_url. Failed jobs are retried with backoff from a Redis retry queue.
+
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import aiofiles
+import aiohttp
+
+from db.app_logger import AppLogger
+from db.models import CollectionLogEntry, CombatAchievementEntry, Drop, PersonalBestEntry, Session, Player
+from utils.format import get_extension_from_content_type
+from utils.redis import redis_client
+
+app_logger = AppLogger()
+
+BASE_DIR = "/store/droptracker/disc/static/assets/img/user-upload/"
+BASE_URL = "https://www.droptracker.io/img/user-upload/"
+TMP_DIR = os.path.join(BASE_DIR, ".incoming")
+
+DOWNLOAD_WORKERS = int(os.getenv("IMAGE_DOWNLOAD_WORKERS", 4))
+ENCODE_PROCESSES = int(os.getenv("IMAGE_ENCODE_PROCESSES", 2))
+QUEUE_SIZE = 500
+MAX_IMAGE_SIZE = 25 * 1024 * 1024
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30  # seconds; doubled on each attempt
+THUMBNAIL_SIZE = (320, 320)
+STALE_JOB_AGE = 600  # seconds before a pending job is assumed abandoned
+
+## Redis keys
+PENDING_KEY = "image_pipeline:pending"  # hash of image_ref -> job
+RETRY_KEY = "image_pipeline:retry"  # zset of job -> time the job is due
+HASHES_KEY = "image_pipeline:hashes"  # hash of content sha256 -> stored {path, url}
+RESULT_KEY = "image_pipeline:result:{}"  # stored value for a finished image_ref
+RESULT_TTL = 3600
+
+## submission_type -> (model, primary key column)
+ENTRY_MODELS = {
+    "drop": (Drop, Drop.drop_id),
+    "clog": (CollectionLogEntry, CollectionLogEntry.log_id),
+    "ca": (CombatAchievementEntry, CombatAchievementEntry.id),
+    "pb": (PersonalBestEntry, PersonalBestEntry.id),
+}
+
+
+def reencode_image(path: str):
+    """
+        Runs in the encoder process pool.
+        Re-encodes the image at `path` to WebP and creates a thumbnail next to it.
+        Returns the path of the re-encoded image (or the original, if it couldn't be re-encoded)
+    """
+    from PIL import Image
+    base_path, _ = os.path.splitext(path)
+    webp_path = f"{base_path}.webp"
+    thumb_path = f"{base_path}_thumb.webp"
+    try:
+        with Image.open(path) as img:
+            img.load()
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+            img.save(webp_path, "WEBP", quality=85, method=4)
+            img.thumbnail(THUMBNAIL_SIZE)
+            img.save(thumb_path, "WEBP", quality=75, method=4)
+    except Exception as e:
+        print(f"Couldn't re-encode {path}: {e}")
+        return path
+    if webp_path != path:
+        os.remove(path)
+    return webp_path
+
+
+class ImagePipeline:
+    def __init__(self):
+        self.queue: asyncio.Queue = None
+        self.http_session: aiohttp.ClientSession = None
+        self.encoder: ProcessPoolExecutor = None
+        self.tasks = []
+
+    @staticmethod
+    def ref(submission_type: str, entry_id) -> str:
+        """The pending reference stored for an entry's image"""
+        return f"{submission_type}:{entry_id}"
+
+    def enqueue(self, submission_type: str, entry_id, player: Player, attachment_url: str,
+                attachment_type: str = None, entry_name: str = "", npc_name: str = "", store_as: str = "path"):
+        """
+        Queues an attachment to be downloaded for a submission entry.
+        :param: submission_type: "drop", "clog", "ca" or "pb"
+        :param: entry_id: primary key of the entry whose image_url is filled in
+        :param: store_as: "url" stores the external URL on the entry, "path" the local file path
+            Returns the image_ref for the entry
+        """
+        image_ref = self.ref(submission_type, entry_id)
+        job = {
+            "ref": image_ref,
+            "submission_type": submission_type,
+            "entry_id": entry_id,
+            "wom_id": player.wom_id,
+            "attachment_url": str(attachment_url),
+            "file_extension": get_extension_from_content_type(attachment_type),
+            "entry_name": str(entry_name),
+            "npc_name": str(npc_name) if npc_name else "",
+            "store_as": store_as,
+            "queued_at": time.time(),
+            "attempts": 0
+        }
+        self._ensure_started()
+        try:
+            redis_client.client.hset(PENDING_KEY, image_ref, json.dumps(job))
+        except Exception as e:
+            print(f"Couldn't record pending image {image_ref}: {e}")
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._schedule_retry(job, delay=5, count_attempt=False)
+        return image_ref
+
+    def is_pending(self, image_ref: str) -> bool:
+        try:
+            return bool(redis_client.client.hexists(PENDING_KEY, image_ref))
+        except Exception:
+            return False
+
+    def get_result(self, image_ref: str):
+        """Returns the stored image_url for a finished image_ref, if it finished recently"""
+        return redis_client.get(RESULT_KEY.format(image_ref))
+
+    def _ensure_started(self):
+        if self.tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.encoder = ProcessPoolExecutor(max_workers=ENCODE_PROCESSES)
+        for _ in range(DOWNLOAD_WORKERS):
+            self.tasks.append(asyncio.create_task(self._worker()))
+        self.tasks.append(asyncio.create_task(self._retry_loop()))
+        ## Pick up anything left pending by a process that stopped before finishing it;
+        ## recent jobs are skipped as they may still be running in another worker process
+        try:
+            for raw_job in redis_client.client.hvals(PENDING_KEY):
+                job = json.loads(raw_job)
+                if job.get("queued_at", 0) < time.time() - STALE_JOB_AGE:
+                    self._schedule_retry(job, delay=0, count_attempt=False)
+        except Exception as e:
+            print(f"Couldn't restore pending image jobs: {e}")
+
+    async def _get_http_session(self):
+        if self.http_session is None or self.http_session.closed:
+            self.http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+        return self.http_session
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                app_logger.log(log_type="error", data=f"Couldn't process image {job['ref']} (attempt {job['attempts'] + 1}): {e}",
+                               app_name="core", description="image_pipeline")
+                self._schedule_retry(job)
+            finally:
+                self.queue.task_done()
+
+    async def _retry_loop(self):
+        while True:
+            await asyncio.sleep(5)
+            try:
+                due_jobs = redis_client.client.zrangebyscore(RETRY_KEY, "-inf", time.time())
+                for raw_job in due_jobs:
+                    if self.queue.full():
+                        break
+                    ## Only the process that removes the entry gets to run the job
+                    if redis_client.client.zrem(RETRY_KEY, raw_job):
+                        self.queue.put_nowait(json.loads(raw_job))
+            except Exception as e:
+                print(f"Error checking the image retry queue: {e}")
+
+    def _schedule_retry(self, job: dict, delay: float = None, count_attempt: bool = True):
+        if count_attempt:
+            job["attempts"] += 1
+            if job["attempts"] >= MAX_ATTEMPTS:
+                app_logger.log(log_type="error", data=f"Giving up on image {job['ref']} after {job['attempts']} attempts",
+                               app_name="core", description="image_pipeline")
+                redis_client.client.hdel(PENDING_KEY, job["ref"])
+                return
+        if delay is None:
+            delay = RETRY_BASE_DELAY * (2 ** (job["attempts"] - 1))
+        try:
+            redis_client.client.zadd(RETRY_KEY, {json.dumps(job): time.time() + delay})
+        except Exception as e:
+            print(f"Couldn't schedule retry for image {job['ref']}: {e}")
+
+    async def _download(self, url: str):
+        """Downloads `url` to a temporary file, returning (temp path, sha256 of the content)"""
+        os.makedirs(TMP_DIR, exist_ok=True)
+        temp_path = os.path.join(TMP_DIR, f"{uuid.uuid4()}.part")
+        digest = hashlib.sha256()
+        size = 0
+        http_session = await self._get_http_session()
+        try:
+            async with http_session.get(url) as response:
+                if response.status != 200:
+                    raise Exception(f"Download returned status {response.status}")
+                async with aiofiles.open(temp_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        size += len(chunk)
+                        if size > MAX_IMAGE_SIZE:
+                            raise Exception("Attachment is too large")
+                        digest.update(chunk)
+                        await f.write(chunk)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return temp_path, digest.hexdigest()
+
+    async def _process(self, job: dict):
+        temp_path, content_hash = await self._download(job["attachment_url"])
+        stored = redis_client.client.hget(HASHES_KEY, content_hash)
+        stored = json.loads(stored) if stored else None
+        if stored and os.path.exists(stored["path"]):
+            ## Identical image already stored (e.g. the same screenshot sent for multiple items)
+            os.remove(temp_path)
+            local_path, external_url = stored["path"], stored["url"]
+        else:
+            directory_path, url_path = self._get_directory(job)
+            await asyncio.to_thread(os.makedirs, directory_path, exist_ok=True)
+            file_base = self._get_unique_base(directory_path, f"{job['entry_name']}_{job['entry_id']}", job["file_extension"])
+            final_path = os.path.join(directory_path, f"{file_base}.{job['file_extension']}")
+            await asyncio.to_thread(shutil.move, temp_path, final_path)
+            loop = asyncio.get_running_loop()
+            local_path = await loop.run_in_executor(self.encoder, reencode_image, final_path)
+            external_url = f"{BASE_URL}{url_path}{os.path.basename(local_path)}"
+            redis_client.client.hset(HASHES_KEY, content_hash, json.dumps({"path": local_path, "url": external_url}))
+        stored_value = external_url if job["store_as"] == "url" else local_path
+        await asyncio.to_thread(self._store_result, job, stored_value)
+
+    def _store_result(self, job: dict, stored_value: str):
+        model, primary_key = ENTRY_MODELS[job["submission_type"]]
+        session = Session()
+        try:
+            session.query(model).filter(primary_key == job["entry_id"]).update(
+                {model.image_url: stored_value}, synchronize_session=False
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        pipeline = redis_client.client.pipeline(transaction=False)
+        pipeline.set(RESULT_KEY.format(job["ref"]), stored_value, ex=RESULT_TTL)
+        pipeline.hdel(PENDING_KEY, job["ref"])
+        pipeline.execute()
+
+    @staticmethod
+    def _get_directory(job: dict):
+        """
+            Mirrors utils.download.download_player_image:
+            {BASE_DIR}/{wom_id}/{submission_type}/{npc_name (optional)}/
+        """
+        parts = [str(job["wom_id"]), job["submission_type"]]
+        if job["npc_name"]:
+            parts.append(job["npc_name"])
+        return os.path.join(BASE_DIR, *parts), "/".join(parts) + "/"
+
+    @staticmethod
+    def _get_unique_base(directory: str, base_name: str, ext: str):
+        """A file name base that is free for both the original and re-encoded extension"""
+        candidate = base_name
+        counter = 1
+        while (os.path.exists(os.path.join(directory, f"{candidate}.{ext}")) or
+               os.path.exists(os.path.join(directory, f"{candidate}.webp"))):
+            candidate = f"{base_name}_{counter}"
+            counter += 1
+        return candidate
+
+
+image_pipeline = ImagePipeline()
@@ -60,7 +60,7 @@ class MessageHandler(Extension):
                         group = session.query(Group).filter(Group.group_id == group_id).first()
                         if not group:
                             return await message.channel.send("Group not found.")
-                        await hall_of_fame._update_group_hof(group) 
+                        await hall_of_fame._update_group_hof(group, force=True)
                     except Exception as e:
                         print(f"Error updating boss component: {e}")
                         pass
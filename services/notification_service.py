@@ -12,12 +12,15 @@ from utils.embeds import update_boss_pb_embed
 from utils.messages import confirm_new_npc, confirm_new_item, name_change_message, new_player_message
 from utils.format import format_number, replace_placeholders, convert_from_ms
 from utils.download import download_player_image
+from services.image_pipeline import image_pipeline
 from db.app_logger import AppLogger
 from utils.semantic_check import get_ca_tier_progress, get_current_ca_tier
 
 app_logger = AppLogger()
 global_footer = os.getenv('DISCORD_MESSAGE_FOOTER')
 db = DatabaseOperations()
+## How long a notification may wait on its screenshot being processed before it is sent without one
+MAX_IMAGE_WAIT = timedelta(minutes=2)
 
 class NotificationService:
     def __init__(self, bot: interactions.Client, db_ops: DatabaseOperations):
@@ -62,6 +65,8 @@ class NotificationService:
         if og_length > 0:
             print(f"Processing {og_length} pending notifications...")
         for notification in notifications:
+            if self.is_waiting_on_image(notification):
+                continue
             try:
                 # Mark as processing
                 notification.status = 'processing'
@@ -77,11 +82,24 @@ class NotificationService:
         if og_length > 0:
             print("Finished processing pending notification data.")
 
+    def is_waiting_on_image(self, notification: NotificationQueue):
+        """True if the notification's screenshot is still being processed by the image pipeline"""
+        if notification.status != 'pending' or notification.created_at < datetime.now() - MAX_IMAGE_WAIT:
+            return False
+        try:
+            image_ref = json.loads(notification.data).get('image_ref', None)
+        except Exception:
+            return False
+        return bool(image_ref) and image_pipeline.is_pending(image_ref)
+
     async def process_notification(self, notification):
         """Process a single notification based on its type"""
         try:
             data = json.loads(notification.data)
             notification_type = notification.notification_type
+            if data.get('image_ref', None) and not data.get('image_url', None):
+                ## Fill in the screenshot stored by the image pipeline after this notification was queued
+                data['image_url'] = image_pipeline.get_result(data['image_ref'])
             
             if notification_type == 'drop':
                 await self.send_drop_notification(notification, data)
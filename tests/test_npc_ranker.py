@@ -0,0 +1,97 @@
+import unittest
+from unittest import mock
+
+from db.models import get_current_partition
+from utils.keys import determine_key
+from utils.ranking import npc_ranker
+from utils.ranking.npc_ranker import NPCRankChecker, TotalsRanks
+
+"""
+
+    Checks NPCRankChecker.simulate_npc_drop_rank_change against in-memory stand-ins for the
+    leaderboard zsets, including drops that the zsets already hold (already_counted).
+
+        python -m unittest tests.test_npc_ranker
+
+"""
+
+NPC_ID = 1
+GROUP_ID = 7
+PLAYER_ID = 100
+OTHER_PLAYER_ID = 200
+
+
+class FakeZsets:
+    """The zscore/zcount/zcard/hget subset of a redis client the ranker uses"""
+    def __init__(self, zsets, hashes):
+        self.zsets = zsets
+        self.hashes = hashes
+
+    def zscore(self, key, member):
+        return self.zsets.get(key, {}).get(member)
+
+    def zcount(self, key, low, high):
+        ## The ranker only asks for scores strictly above a value: "(value" .. "+inf"
+        value = float(str(low).lstrip("("))
+        return sum(1 for score in self.zsets.get(key, {}).values() if score > value)
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def hget(self, key, field):
+        value = self.hashes.get(key, {}).get(field)
+        return str(value).encode("utf-8") if value is not None else None
+
+
+class SimulateNpcDropRankChangeTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        partition = get_current_partition()
+        ## The player's 50 drop is already in every total: 850 -> 900, behind the other player's 1000
+        zsets = {
+            determine_key(npc_id=NPC_ID, partition=partition): {PLAYER_ID: 900, OTHER_PLAYER_ID: 1000},
+            determine_key(npc_id=NPC_ID, partition=partition, group_id=GROUP_ID): {PLAYER_ID: 900, OTHER_PLAYER_ID: 1000},
+        }
+        hashes = {f"player:{PLAYER_ID}:{partition}:npc_totals": {str(NPC_ID): 900}}
+        patches = [
+            mock.patch.object(npc_ranker.redis_client, "client", FakeZsets(zsets, hashes)),
+            mock.patch.object(npc_ranker.group_npc_totals, "get",
+                              return_value=TotalsRanks({GROUP_ID: 900, GROUP_ID + 1: 1000})),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.checker = NPCRankChecker()
+
+    async def test_already_counted_drop_does_not_rank_against_itself(self):
+        result = await self.checker.simulate_npc_drop_rank_change(PLAYER_ID, NPC_ID, 50, group_id=GROUP_ID,
+                                                                  already_counted=True)
+        player_global = result["player_global"]
+        self.assertEqual((player_global["original_total"], player_global["new_total"]), (850, 900))
+        self.assertEqual((player_global["original_rank"], player_global["new_rank"]), (2, 2))
+        self.assertFalse(player_global["improved"])
+        player_in_group = result["player_in_group"][GROUP_ID]
+        self.assertEqual((player_in_group["original_rank"], player_in_group["new_rank"]), (2, 2))
+        self.assertFalse(player_in_group["improved"])
+
+    async def test_already_counted_drop_is_not_added_to_the_group_total_again(self):
+        result = await self.checker.simulate_npc_drop_rank_change(PLAYER_ID, NPC_ID, 50, group_id=GROUP_ID,
+                                                                  already_counted=True)
+        group = result["group"][GROUP_ID]
+        self.assertEqual((group["original_total"], group["new_total"]), (850, 900))
+        self.assertEqual((group["original_rank"], group["new_rank"]), (2, 2))
+        self.assertFalse(group["improved"])
+
+    async def test_new_drop_passing_the_leader_improves_the_rank(self):
+        ## Not yet counted: the zsets hold 900, and a 150 drop takes the player past 1000
+        result = await self.checker.simulate_npc_drop_rank_change(PLAYER_ID, NPC_ID, 150, group_id=GROUP_ID)
+        player_global = result["player_global"]
+        self.assertEqual((player_global["original_total"], player_global["new_total"]), (900, 1050))
+        self.assertEqual((player_global["original_rank"], player_global["new_rank"]), (2, 1))
+        self.assertTrue(player_global["improved"])
+        group = result["group"][GROUP_ID]
+        self.assertEqual((group["original_total"], group["new_total"]), (900, 1050))
+        self.assertEqual((group["original_rank"], group["new_rank"]), (2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
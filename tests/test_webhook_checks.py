@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+import aiohttp
+from aiohttp import web
+
+from utils.webhook_checks import check_webhooks
+
+"""
+
+    Runs the heartbeat's webhook checks against a local aiohttp stand-in for Discord,
+    and checks which responses are classified as alive, dead or transient failures.
+
+        python -m unittest tests.test_webhook_checks
+
+"""
+
+TIMEOUT = 0.5
+
+
+def make_webhook(webhook_id, url):
+    return SimpleNamespace(webhook_id=webhook_id, webhook_url=url)
+
+
+class WebhookCheckTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async def respond(request):
+            return web.Response(status=int(request.match_info["status"]))
+
+        async def hang(request):
+            await asyncio.sleep(TIMEOUT * 4)
+            return web.Response(status=200)
+
+        app = web.Application()
+        app.router.add_get("/status/{status}", respond)
+        app.router.add_get("/hang", hang)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.http_session = aiohttp.ClientSession()
+
+    async def asyncTearDown(self):
+        await self.http_session.close()
+        await self.runner.cleanup()
+
+    async def check(self, webhooks):
+        return await check_webhooks(webhooks, self.http_session, jitter=0, timeout=TIMEOUT)
+
+    async def test_classifies_responses(self):
+        cases = {
+            200: (True, False),
+            204: (True, False),
+            401: (False, True),
+            403: (False, True),
+            404: (False, True),
+            429: (False, False),
+            500: (False, False),
+            503: (False, False),
+        }
+        webhooks = [make_webhook(status, f"{self.base_url}/status/{status}") for status in cases]
+        results = await self.check(webhooks)
+        for webhook, result in zip(webhooks, results):
+            with self.subTest(status=webhook.webhook_id):
+                self.assertIs(result["webhook"], webhook)
+                self.assertEqual(result["status"], webhook.webhook_id)
+                self.assertEqual((result["ok"], result["dead"]), cases[webhook.webhook_id])
+
+    async def test_timeout_is_transient(self):
+        result, = await self.check([make_webhook(1, f"{self.base_url}/hang")])
+        self.assertFalse(result["ok"])
+        self.assertFalse(result["dead"])
+        self.assertIn("error", result)
+
+    async def test_connection_error_is_transient(self):
+        ## Nothing listens on port 1
+        result, = await self.check([make_webhook(1, "http://127.0.0.1:1/webhook")])
+        self.assertFalse(result["ok"])
+        self.assertFalse(result["dead"])
+
+    async def test_missing_url_is_dead(self):
+        result, = await self.check([make_webhook(1, "")])
+        self.assertTrue(result["dead"])
+
+    async def test_results_keep_input_order(self):
+        statuses = [404, 200, 500, 200, 401] * 5
+        webhooks = [make_webhook(i, f"{self.base_url}/status/{status}") for i, status in enumerate(statuses)]
+        results = await check_webhooks(webhooks, self.http_session, concurrency=3, jitter=0.05, timeout=TIMEOUT)
+        self.assertEqual([result["webhook_id"] for result in results], list(range(len(statuses))))
+        self.assertEqual([result["status"] for result in results], statuses)
+
+
+if __name__ == "__main__":
+    unittest.main()
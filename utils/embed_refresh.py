@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import json
+import time
+
+from db.app_logger import AppLogger
+
+"""
+
+    Debounced, coalesced refreshes of the Discord messages we keep editing in place
+    (boss PB embeds and Hall of Fame components).
+
+    Asking for a refresh doesn't touch Discord: it only marks (kind, group, npc) as pending. Repeat
+    requests for the same message within DEBOUNCE_WINDOW collapse into one refresh, which runs at
+    most MAX_DELAY after the first request. Pending refreshes run in priority order (submissions
+    before periodic sweeps), paced by a token bucket per group's channel and a global one.
+
+    The refresh itself rebuilds the message with the latest data and compares a fingerprint of it
+    against the last one sent, so unchanged messages are never edited.
+
+"""
+
+app_logger = AppLogger()
+
+DEBOUNCE_WINDOW = 15  # seconds a refresh waits for more requests for the same message
+MAX_DELAY = 60  # seconds a refresh can be pushed back by repeat requests
+PRIORITY_SUBMISSION = 0
+PRIORITY_PERIODIC = 1
+GROUP_BUCKET = (5, 5.0)  # edits per channel: capacity, seconds to refill completely
+GLOBAL_BUCKET = (30, 1.0)
+## Fields whose value changes on every send without the content changing
+REFRESH_FIELDS = ("Last updated:",)
+
+
+def _embed_dict(embed, ignore_fields=REFRESH_FIELDS):
+    data = embed.to_dict() if hasattr(embed, "to_dict") else dict(embed)
+    data["fields"] = [field for field in data.get("fields") or [] if field.get("name") not in ignore_fields]
+    data.pop("timestamp", None)
+    return data
+
+
+def payload_fingerprint(embeds=None, components=None, ignore_fields=REFRESH_FIELDS) -> str:
+    """A stable hash of a message's content, ignoring the parts that change on every send"""
+    payload = {
+        "embeds": [_embed_dict(embed, ignore_fields) for embed in embeds or []],
+        "components": [component.to_dict() if hasattr(component, "to_dict") else component
+                       for component in components or []],
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class TokenBucket:
+    def __init__(self, capacity: int, refill_seconds: float):
+        self.capacity = capacity
+        self.rate = capacity / refill_seconds
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class PendingRefresh:
+    def __init__(self, refresh, priority: int, now: float):
+        self.refresh = refresh
+        self.priority = priority
+        self.first_requested = now
+        self.due_at = now + DEBOUNCE_WINDOW
+        self.requests = 1
+
+
+class EmbedRefreshScheduler:
+    def __init__(self):
+        self.pending = {}  # (kind, group_id, npc_id) -> PendingRefresh
+        self.last_sent = {}  # (kind, group_id, npc_id) -> fingerprint of the last content sent
+        self.group_buckets = {}
+        self.global_bucket = TokenBucket(*GLOBAL_BUCKET)
+        self.wakeup = None
+        self.worker = None
+        self.stats = {"requested": 0, "coalesced": 0, "refreshed": 0, "sent": 0, "unchanged": 0, "failed": 0}
+
+    def request(self, kind: str, group_id: int, npc_id: int, refresh, priority: int = PRIORITY_SUBMISSION):
+        """
+            Schedules a refresh of one message.
+            :param: refresh: a coroutine function rebuilding and sending the message; called once
+                for every burst of requests, with the latest one's function
+        """
+        key = (kind, group_id, npc_id)
+        now = time.monotonic()
+        self.stats["requested"] += 1
+        pending = self.pending.get(key)
+        if pending:
+            pending.refresh = refresh
+            pending.priority = min(pending.priority, priority)
+            pending.due_at = min(pending.first_requested + MAX_DELAY, now + DEBOUNCE_WINDOW)
+            pending.requests += 1
+            self.stats["coalesced"] += 1
+        else:
+            self.pending[key] = PendingRefresh(refresh, priority, now)
+        self._ensure_worker()
+        self.wakeup.set()
+
+    def is_unchanged(self, kind: str, group_id: int, npc_id: int, fingerprint: str) -> bool:
+        if self.last_sent.get((kind, group_id, npc_id)) == fingerprint:
+            self.stats["unchanged"] += 1
+            return True
+        return False
+
+    def mark_sent(self, kind: str, group_id: int, npc_id: int, fingerprint: str):
+        self.last_sent[(kind, group_id, npc_id)] = fingerprint
+        self.stats["sent"] += 1
+
+    def forget(self, kind: str, group_id: int, npc_id: int):
+        """Makes the next refresh of a message send it even if its content hasn't changed"""
+        self.last_sent.pop((kind, group_id, npc_id), None)
+
+    def _ensure_worker(self):
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+
+    def _group_bucket(self, group_id) -> TokenBucket:
+        return self.group_buckets.setdefault(group_id, TokenBucket(*GROUP_BUCKET))
+
+    def _next_ready(self):
+        """
+            The highest-priority due refresh whose group's channel can be edited now.
+                Returns (key, None), or (None, seconds until one could be ready or None if nothing is pending)
+        """
+        now = time.monotonic()
+        due = sorted((pending.priority, pending.due_at, key) for key, pending in self.pending.items() if pending.due_at <= now)
+        waits = [pending.due_at - now for pending in self.pending.values() if pending.due_at > now]
+        for _, _, key in due:
+            ## A rate-limited channel only holds back its own group's refreshes
+            wait = self._group_bucket(key[1]).wait_time()
+            if wait <= 0:
+                return key, None
+            waits.append(wait)
+        return None, min(waits, default=None)
+
+    async def _run(self):
+        while True:
+            key, timeout = self._next_ready()
+            if key is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            wait = self.global_bucket.wait_time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            group_id = key[1]
+            bucket = self._group_bucket(group_id)
+            bucket.take()
+            self.global_bucket.take()
+            pending = self.pending.pop(key)
+            try:
+                await pending.refresh()
+                self.stats["refreshed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                app_logger.log(log_type="error", data=f"Couldn't refresh {key[0]} for group {group_id}, npc {key[2]}: {e}",
+                               app_name="core", description="EmbedRefreshScheduler")
+
+
+embed_refresh = EmbedRefreshScheduler()
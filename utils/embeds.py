@@ -7,6 +7,8 @@ from sqlalchemy import text
 from db.models import Group, GroupConfiguration, GroupPersonalBestMessage, NpcList, PersonalBestEntry, Player, session
 from utils.redis import redis_client, calculate_global_overall_rank, calculate_rank_amongst_groups
 from utils.format import convert_from_ms, format_number
+from utils.ranking.npc_leaders import DEFAULT_MAX_AGE, npc_leaders
+from utils.embed_refresh import REFRESH_FIELDS, embed_refresh, payload_fingerprint
 import interactions
 from interactions import Embed
 from dotenv import load_dotenv
@@ -52,7 +54,7 @@ async def get_global_drop_embed(item_name, item_id, player_id, quantity, value,
     embed.set_footer(global_footer)
     return embed
 
-async def create_boss_pb_embed(group_id, boss_name, max_entries):
+async def create_boss_pb_embed(group_id, boss_name, max_entries, leader_max_age: float = 0):
     npc_id = session.query(NpcList.npc_id).filter(NpcList.npc_name == boss_name).first()
     npc_id = npc_id[0] if npc_id else None
     embed = Embed(
@@ -134,7 +136,7 @@ async def create_boss_pb_embed(group_id, boss_name, max_entries):
             team_size_text = f"{int(team_size_display)}-man"
         except:
             team_size_text = team_size_display
-    most_looted_player_id, most_looted_total = await get_current_top_rank_at_npc(npc_id, group_id)
+    most_looted_player_id, most_looted_total = await get_current_top_rank_at_npc(npc_id, group_id, leader_max_age)
     most_looted_player = session.query(Player).filter(Player.player_id == most_looted_player_id).first()
     if most_looted_player:
         if most_looted_player.user and group_id != 2:
@@ -282,32 +284,12 @@ def sort_team_sizes(team_sizes):
     
     return result
 
-async def get_current_top_rank_at_npc(npc_id, group_id):
-    npc = session.query(NpcList).filter(NpcList.npc_id == npc_id).first()
-    npc_name = npc.npc_name if npc else f"Unknown NPC ({npc_id})"
-    group = session.query(Group).filter(Group.group_id == group_id).first()
-    query = """SELECT player_id FROM user_group_association WHERE group_id = :group_id"""
-    player_ids_result = session.execute(text(query), {"group_id": group_id}).fetchall()
-    player_ids = [pid[0] for pid in player_ids_result]
-    player_totals = {}
-    partition = datetime.now().year * 100 + datetime.now().month
-    
-    for player_id in player_ids:
-        # Use hget instead of get to retrieve the specific NPC total from the hash
-        player_total = redis_client.client.hget(f"player:{player_id}:{partition}:npc_totals", str(npc_id))
-        if player_total:
-            player_totals[player_id] = int(player_total.decode('utf-8'))
-        else:
-            player_totals[player_id] = 0
-    
-    # Handle case where no players have totals
-    if not player_totals:
+async def get_current_top_rank_at_npc(npc_id, group_id, max_age: float = 0):
+    ## The group's top looter at this NPC this month, from the group's NPC leaderboard
+    leader = npc_leaders.get_leader(npc_id, group_id, max_age=max_age)
+    if not leader:
         return None, 0
-        
-    sorted_totals = sorted(player_totals.items(), key=lambda x: x[1], reverse=True)
-    top_player = sorted_totals[0][0]
-    top_player_total = sorted_totals[0][1]
-    return top_player, top_player_total
+    return leader.player_id, leader.total
 
 async def update_boss_pb_embed(bot: interactions.Client, group_id, npc_id, from_submission: bool = False):
     ## Returns a tuple of two booleans:
@@ -327,22 +309,28 @@ async def update_boss_pb_embed(bot: interactions.Client, group_id, npc_id, from_
     
     max_entries = int(max_entries.config_value) if max_entries else 3
     if existing_message:
-        ## More delays :)
-        await asyncio.sleep(3)
+        ## Pacing is left to the refresh scheduler's rate-limit buckets
         try:
+            ## Skip the Discord round trips entirely when nothing changed since our last edit
+            ## Periodic rebuilds may reuse a recent leader; a submission's rebuild has to show its own effect
+            leader_max_age = 0 if from_submission else DEFAULT_MAX_AGE
+            pb_embed: Embed = await create_boss_pb_embed(group.group_id, npc_name, max_entries, leader_max_age)
+            fingerprint = payload_fingerprint(embeds=[pb_embed])
+            if embed_refresh.is_unchanged("pb_embed", group_id, npc_id, fingerprint):
+                return True, False
             existing_message_id = existing_message.message_id
             channel_id = existing_message.channel_id
             channel = await bot.fetch_channel(channel_id=int(channel_id), force=True)
             existing_message_obj = await channel.fetch_message(existing_message_id)
             
             if existing_message_obj:
-                pb_embed: Embed = await create_boss_pb_embed(group.group_id, npc_name, max_entries)
                 existing_embed = existing_message_obj.embeds[0]
                 has_refresh = False
                 for field in existing_embed.fields:
                     if field.name == "Last updated:":
                         has_refresh = True
                 if embeds_are_equal(pb_embed, existing_embed) and has_refresh:
+                    embed_refresh.mark_sent("pb_embed", group_id, npc_id, fingerprint)
                     return True, False
                 next_update = datetime.now() + timedelta(minutes=30)
                 future_timestamp = int(time.mktime(next_update.timetuple()))
@@ -359,6 +347,7 @@ async def update_boss_pb_embed(bot: interactions.Client, group_id, npc_id, from_
                     if refresh_value:
                         pb_embed.add_field(name="Last updated:", value=refresh_value, inline=False)
                 await existing_message_obj.edit(embed=pb_embed)
+                embed_refresh.mark_sent("pb_embed", group_id, npc_id, fingerprint)
                 existing_message.date_updated = datetime.now()
                 session.commit()
                 
@@ -374,17 +363,7 @@ async def update_boss_pb_embed(bot: interactions.Client, group_id, npc_id, from_
         return False, False
     
 
-def embeds_are_equal(embed1: Embed, embed2: Embed):
-    if embed1.title != embed2.title or embed1.description != embed2.description or embed1.color != embed2.color:
-        return False
-    
-    # Compare fields (excluding the "Next refresh" field which will always be different)
-    if len(embed1.fields) != len(embed2.fields):
-        return False
-    
-    for i in range(len(embed1.fields) - 1):  # Skip the last field (refresh time)
-        field1 = embed1.fields[i]
-        field2 = embed2.fields[i]
-        if field1.name != field2.name or field1.value != field2.value or field1.inline != field2.inline:
-            return False
-    return True
\ No newline at end of file
+def embeds_are_equal(embed1: Embed, embed2: Embed, ignore_fields=REFRESH_FIELDS):
+    ## Compares everything but the fields that change on every send (like "Last updated:")
+    return payload_fingerprint(embeds=[embed1], ignore_fields=ignore_fields) == \
+        payload_fingerprint(embeds=[embed2], ignore_fields=ignore_fields)
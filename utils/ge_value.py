@@ -1,5 +1,8 @@
 import aiohttp
 import asyncio
+import json
+import os
+import time
 from datetime import datetime
 import sys
 
@@ -7,6 +10,10 @@ import sys
 PRICES_API_BASE = "https://prices.runescape.wiki/api/v1/osrs"
 WIKI_API_BASE = "https://oldschool.runescape.wiki/api.php"
 
+## Local copy of the mapping + latest prices, so that startup doesn't wait on the prices API
+SNAPSHOT_PATH = os.getenv("GE_SNAPSHOT_PATH", "data/ge-snapshot.json")
+MAPPING_REFRESH_INTERVAL = 6 * 3600  # seconds; the mapping only changes when items are added
+
 # Create a single aiohttp session for reuse
 prices_session = None
 wiki_session = None
@@ -72,20 +79,18 @@ async def get_mapping():
             return None
         return await resp.json()
 
-async def find_item_id_by_name(name):
-    """Find an item ID by name using the mapping data"""
-    mapping_data = await get_mapping()
-    if not mapping_data:
-        return None
-    
-    name_lower = name.lower()
-    for item in mapping_data:
-        if item.get('name', '').lower() == name_lower:
-            return item['id']
-    return None
+async def get_all_latest_prices():
+    """Fetch the latest prices for every item in a single request"""
+    endpoint = f"{PRICES_API_BASE}/latest"
+    session = await get_prices_session()
+    async with session.get(endpoint) as resp:
+        if resp.status != 200:
+            return None
+        data = await resp.json()
+        return data.get('data')
 
 async def get_latest_price_data(item_id):
-    """Fetch the latest price data from the real-time prices API"""
+    """Fetch the latest price data for a single item from the real-time prices API"""
     endpoint = f"{PRICES_API_BASE}/latest"
     params = {'id': item_id}
     session = await get_prices_session()
@@ -103,6 +108,95 @@ async def get_latest_price_data(item_id):
         
         return item_data
 
+
+class PriceSnapshot:
+    """
+        In-memory copy of the prices API's /mapping and /latest documents,
+        indexed by item id and lowercase item name.
+        Refreshed on a schedule (see refresh_ge_prices in main.py); lookups never hit the network.
+    """
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self.ids_by_name = {}  # lowercase item name -> item id
+        self.mapping = {}  # item id -> mapping entry
+        self.latest = {}  # item id -> latest price data
+        self.mapping_updated = 0
+        self.latest_updated = 0
+        self.loaded = False
+        self.refresh_lock = asyncio.Lock()
+
+    def _set_mapping(self, mapping_data):
+        mapping = {}
+        ids_by_name = {}
+        for item in mapping_data:
+            item_id = int(item['id'])
+            mapping[item_id] = item
+            ids_by_name.setdefault(item.get('name', '').lower(), item_id)
+        self.mapping = mapping
+        self.ids_by_name = ids_by_name
+
+    def load(self):
+        """Load the last snapshot saved to disk; only done once per process"""
+        if self.loaded:
+            return
+        self.loaded = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                snapshot = json.load(f)
+            self._set_mapping(snapshot.get('mapping', []))
+            self.latest = {int(item_id): data for item_id, data in snapshot.get('latest', {}).items()}
+            self.mapping_updated = snapshot.get('mapping_updated', 0)
+            self.latest_updated = snapshot.get('latest_updated', 0)
+        except Exception as e:
+            print(f"Couldn't load the GE price snapshot from {self.path}: {e}")
+
+    def save(self):
+        snapshot = {
+            'mapping': list(self.mapping.values()),
+            'latest': {str(item_id): data for item_id, data in self.latest.items()},
+            'mapping_updated': self.mapping_updated,
+            'latest_updated': self.latest_updated
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, self.path)
+
+    async def refresh(self):
+        """Pull the latest prices (and the mapping, when it's due) and save the snapshot to disk"""
+        async with self.refresh_lock:
+            self.load()
+            try:
+                if time.time() - self.mapping_updated > MAPPING_REFRESH_INTERVAL or not self.mapping:
+                    mapping_data = await get_mapping()
+                    if mapping_data:
+                        self._set_mapping(mapping_data)
+                        self.mapping_updated = time.time()
+                latest_data = await get_all_latest_prices()
+                if latest_data:
+                    self.latest = {int(item_id): data for item_id, data in latest_data.items()}
+                    self.latest_updated = time.time()
+                await asyncio.to_thread(self.save)
+            except Exception as e:
+                print(f"Error refreshing GE prices: {e}")
+
+    def get_item_id(self, name):
+        self.load()
+        return self.ids_by_name.get(name.lower()) if name else None
+
+    def get_price_data(self, item_id):
+        self.load()
+        return self.latest.get(int(item_id))
+
+
+price_snapshot = PriceSnapshot()
+
+async def find_item_id_by_name(name):
+    """Find an item ID by name using the mapping snapshot"""
+    return price_snapshot.get_item_id(name)
+
 async def get_most_recent_price_by_id(item_id):
     """
     Get the most recent price for an item by ID
@@ -111,7 +205,7 @@ async def get_most_recent_price_by_id(item_id):
     if not item_id:
         return None
     
-    price_data = await get_latest_price_data(item_id)
+    price_data = price_snapshot.get_price_data(item_id)
     if not price_data:
         return None
     
@@ -1,4 +1,5 @@
 import asyncio
+import hashlib
 import os
 import aiohttp
 import github
@@ -11,6 +12,7 @@ from interactions import IntervalTrigger, Task
 import json
 from utils.encrypter import encrypt_webhook, decrypt_webhook
 from utils.logger import LoggerClient
+from utils.webhook_pool import webhook_pool
 from datetime import datetime, timedelta
 from db.app_logger import AppLogger
 load_dotenv()
@@ -35,6 +37,7 @@ class GithubPagesUpdater:
         repo_name = "droptracker-io/droptracker-io.github.io"  # GitHub repository name
         self.new_file = "content/core.json"
         self.branch = "main"
+        self.selected_webhook_ids = []  # row ids of the webhooks in the last fetched list
         # Initialize GitHub API
         self.github = Github(self.github_token)
         self.repo = self.github.get_repo(repo_name)
@@ -44,7 +47,7 @@ class GithubPagesUpdater:
 
     def fetch_webhooks_from_database(self, limit=80):
         """
-        Fetch the webhook URLs from the database and format them as a list of URLs.
+        Fetch the webhooks picked by the webhook pool and format them as a list of encrypted URLs.
         
         Args:
             limit: Maximum number of webhooks to fetch
@@ -53,18 +56,21 @@ class GithubPagesUpdater:
             list of encrypted webhooks
         """
         try:
-            webhooks = db_sesh.query(Webhook).limit(limit).all()  # Grab limited number of webhooks
+            webhooks = webhook_pool.select(db_sesh, limit)  # Weighted, rotated subset of healthy webhooks
             
-            main_urls = [w.webhook_url for w in webhooks if w.webhook_url]
             main_encrypted = []
+            self.selected_webhook_ids = []
             
             # Try to encrypt each webhook, skipping any that fail
-            for url in main_urls:
+            for webhook in webhooks:
+                if not webhook.webhook_url:
+                    continue
                 try:
-                    encrypted = encrypt_webhook(url)
+                    encrypted = encrypt_webhook(webhook.webhook_url)
                     main_encrypted.append(encrypted)
+                    self.selected_webhook_ids.append(webhook.id)
                 except Exception as e:
-                    print(f"Failed to encrypt webhook {url}: {e}")
+                    print(f"Failed to encrypt webhook {webhook.webhook_url}: {e}")
             
             if not main_encrypted:
                 raise ValueError("No webhooks could be encrypted. Check encryption key configuration.")
@@ -206,55 +212,11 @@ class GithubPagesUpdater:
         for i in range(0, len(encrypted_webhooks), chunk_size):
             webhook_chunks.append(encrypted_webhooks[i:i + chunk_size])
         
-        file_exists = False  # If it doesn't exist we need to initially create it
-
-        # Update core.json file with first chunk
+        # Update core.json file with the first chunk, if its webhooks have changed
         if webhook_chunks:
-            core_json_content = json.dumps(webhook_chunks[0], indent=4)
-            
-            for file_path in self.find_files_by_name(file_name=self.new_file):
-                file_exists = True
-                try:
-                    file = self.repo.get_contents(file_path, ref=self.branch)
-                    old_content = file.decoded_content.decode('utf-8')
-                    if "{" in old_content:
-                        old_json = json.loads(old_content)
-                    else:
-                        old_json = []
-                        
-                    # Check if content has changed
-                    changes_detected = len(old_json) != len(webhook_chunks[0])
-                    if not changes_detected:
-                        github_webhooks_set = set()
-                        db_webhooks_set = set()
-                        for webhook in old_json:
-                            try:
-                                decrypted_webhook = decrypt_webhook(webhook)
-                                github_webhooks_set.add(decrypted_webhook)
-                            except Exception as e:
-                                print(f"Error decrypting webhook from GitHub: {e}")
-                        for encrypted_webhook in webhook_chunks[0]:
-                            try:
-                                decrypted_webhook = decrypt_webhook(encrypted_webhook)
-                                db_webhooks_set.add(decrypted_webhook)
-                            except Exception as e:
-                                print(f"Error decrypting webhook from database: {e}")
-                        changes_detected = github_webhooks_set != db_webhooks_set
-                        
-                    if changes_detected:
-                        files_to_update.append((file_path, core_json_content))
-                        added = len(webhook_chunks[0]) - len(old_json)
-                        print(f"Webhook changes detected. Updating with {added} new webhooks.")
-                    else:
-                        print(f"No GitHub webhook changes detected. Skipping update.")
-                except github.GithubException as e:
-                    print(f"Failed to update GitHub Pages for {file_path}: {e}")
-                except Exception as e:
-                    print(f"Unexpected error: {e}")
-                    raise e
-            
-            if not file_exists:
-                files_to_update.append((self.new_file, core_json_content))
+            core_file = self._prepare_webhook_file_update(self.new_file, webhook_chunks[0])
+            if core_file:
+                files_to_update.append(core_file)
 
         # Store encrypted webhooks in the database
         db_sesh.query(NewWebhook).delete()
@@ -265,15 +227,9 @@ class GithubPagesUpdater:
         # Also create a date-based backup file with second chunk if available
         if len(webhook_chunks) > 1:
             date_str = datetime.now().strftime("%Y%m%d")
-            backup_file_name = f"content/{date_str}.json"
-            backup_file_paths = self.find_files_by_name(file_name=f"{date_str}.json")
-            
-            backup_json_content = json.dumps(webhook_chunks[1], indent=4)
-            
-            if backup_file_paths:
-                files_to_update.append((backup_file_paths[0], backup_json_content))
-            else:
-                files_to_update.append((backup_file_name, backup_json_content))
+            backup_file = self._prepare_webhook_file_update(f"content/{date_str}.json", webhook_chunks[1])
+            if backup_file:
+                files_to_update.append(backup_file)
 
         # Only perform the commit if there are files to update
         if files_to_update:
@@ -282,6 +238,45 @@ class GithubPagesUpdater:
                 commit_message="Updating files based on changes in the database.",
                 branch=self.branch
             )
+        # The list is live now (either just committed, or unchanged from what's already published)
+        webhook_pool.mark_published(self.selected_webhook_ids)
+
+    def _webhook_list_hash(self, encrypted_webhooks):
+        """
+        Hash of the webhook URLs in a published list, independent of their order.
+        The encryption isn't deterministic, so the URLs are decrypted before hashing.
+        """
+        urls = set()
+        for encrypted_webhook in encrypted_webhooks:
+            try:
+                urls.add(decrypt_webhook(encrypted_webhook))
+            except Exception as e:
+                print(f"Error decrypting webhook: {e}")
+        return hashlib.sha256("\n".join(sorted(urls)).encode('utf-8')).hexdigest()
+
+    def _prepare_webhook_file_update(self, file_path, encrypted_webhooks):
+        """
+        Prepare a webhook list file update but don't commit it yet.
+        Returns a tuple of (file_path, content) if the published webhooks differ, None otherwise.
+        """
+        new_content = json.dumps(encrypted_webhooks, indent=4)
+        try:
+            file = self.repo.get_contents(file_path, ref=self.branch)
+            old_content = file.decoded_content.decode('utf-8')
+            old_json = json.loads(old_content) if "[" in old_content else []
+        except github.GithubException as e:
+            if e.status == 404:
+                print(f"Webhook file doesn't exist. Creating {file_path}")
+                return (file_path, new_content)
+            print(f"Error checking webhook file {file_path}: {e}")
+            return None
+        except ValueError:
+            old_json = []
+        if self._webhook_list_hash(old_json) == self._webhook_list_hash(encrypted_webhooks):
+            print(f"No webhook changes for {file_path}. Skipping update.")
+            return None
+        print(f"Webhook changes detected for {file_path}. Updating with {len(encrypted_webhooks)} webhooks.")
+        return (file_path, new_content)
 
     def _prepare_news_update(self):
         """
@@ -497,6 +492,7 @@ async def test_webhook(webhook, session):
             return {
                 'webhook_id': webhook.webhook_id if hasattr(webhook, 'webhook_id') else 'pending_deletion',
                 'url': webhook.webhook_url,
+                'webhook': webhook,
                 'status': 'Error',
                 'elapsed': 0,
                 'ok': False
@@ -507,6 +503,7 @@ async def test_webhook(webhook, session):
             return {
                 'webhook_id': webhook.webhook_id if hasattr(webhook, 'webhook_id') else 'pending_deletion',
                 'url': webhook.webhook_url,
+                'webhook': webhook,
                 'status': status,
                 'elapsed': elapsed,
                 'ok': 200 <= status < 400
@@ -515,6 +512,7 @@ async def test_webhook(webhook, session):
         return {
             'webhook_id': webhook.webhook_id if hasattr(webhook, 'webhook_id') else 'pending_deletion',
             'url': webhook.webhook_url,
+            'webhook': webhook,
             'status': 'Error',
             'error': str(e),
             'ok': False
@@ -556,8 +554,9 @@ async def test_all_webhooks():
 
 async def check_limited_webhooks(limit=80):
     """
-    Check only a limited number of webhooks to ensure they're working before updating GitHub Pages.
-    This removes non-working webhooks from the database.
+    Check the webhooks the webhook pool would publish, to ensure they're working before updating GitHub Pages.
+    The results feed the pool's health scores; non-working webhooks are removed from the database,
+    while rate limited ones are only kept out of the pool's selection for a while.
     
     Args:
         limit: Maximum number of webhooks to check
@@ -565,7 +564,7 @@ async def check_limited_webhooks(limit=80):
     print(f"Checking up to {limit} webhooks before GitHub update...")
     try:
         with Session() as session:
-            webhooks = session.query(Webhook).limit(limit).all()
+            webhooks = webhook_pool.select(session, limit)
             
             print(f"Testing {len(webhooks)} webhooks...")
             
@@ -574,25 +573,26 @@ async def check_limited_webhooks(limit=80):
             failed = 0
             async with aiohttp.ClientSession() as http_session:
                 for i, webhook in enumerate(webhooks):
-                    print(f"Testing webhook {i+1}/{len(webhooks)}: {webhook.webhook_url}...")
                     result = await test_webhook(webhook, http_session)
                     results.append(result)
                     
-                    # Print result immediatelyif i % 10 == 0:
-                    print(f"Checked {i+1}/{len(webhooks)} webhooks: so far, {passed} passed, {failed} failed")
+                    if i % 10 == 0:
+                        print(f"Checked {i+1}/{len(webhooks)} webhooks: so far, {passed} passed, {failed} failed")
                         
                     if result['ok']:
                         passed += 1
                     else:
                         failed += 1
-                        ## Remove it from the database
-                        session.delete(webhook)
-                        session.commit()
+                        if result['status'] != 429:
+                            ## Remove it from the database
+                            session.delete(webhook)
+                            session.commit()
                     
                     # Add delay between requests
                     if i < len(webhooks) - 1:  # Don't delay after the last request
                         await asyncio.sleep(0.25)
             
+            webhook_pool.record_results(results)
             print(f"Checked {len(webhooks)} webhooks: {passed} passed, {failed} failed")
         print("Limited webhook check completed")
     except Exception as e:
@@ -0,0 +1,178 @@
+"""
+    Cached NPC name -> id resolution.
+
+    Known NPCs are seeded from the NpcList table and looked up in memory by a normalized key
+    (case, spacing and underscores don't matter). Names that aren't known are resolved against
+    the OSRS Wiki's NPC IDs page, which is fetched once and shared through Redis, and concurrent
+    lookups of the same name (e.g. a burst of submissions from a newly released boss) share a
+    single in-flight lookup.
+
+"""
+import asyncio
+import json
+import time
+
+from db.models import NpcList, Session
+from utils.format import get_true_boss_name, normalize_npc_name
+from utils.redis import redis_client
+from utils.semantic_check import fetch_wiki_npc_ids
+
+## Special cases that the wiki's NPC IDs page doesn't list under our stored name
+NPC_ALIASES = {
+    "Corrupted Gauntlet": 9035,
+}
+
+WIKI_IDS_KEY = "npc_resolver:wiki_ids"  # cached copy of the parsed NPC IDs page
+WIKI_IDS_TTL = 3600
+UNKNOWN_NPC_TTL = 600  # seconds before an unresolved name is looked up again
+RELOAD_INTERVAL = 300  # seconds between re-reading the NpcList table
+
+
+def npc_key(npc_name: str) -> str:
+    return normalize_npc_name(str(npc_name)).lower()
+
+
+class NpcResolver:
+    def __init__(self):
+        self.ids = {}  # normalized name -> npc_id
+        self.names = {}  # normalized name -> stored npc_name
+        self.unknown = {}  # normalized name -> time after which we try again
+        self.in_flight = {}  # normalized name -> asyncio.Future shared by concurrent lookups
+        self.wiki_ids = None
+        self.wiki_lock = asyncio.Lock()
+        self.loaded_at = 0
+
+    def load(self):
+        """(Re)loads the known NPCs from the NpcList table"""
+        session = Session()
+        try:
+            rows = session.query(NpcList.npc_id, NpcList.npc_name).all()
+        finally:
+            session.close()
+        ids = {}
+        names = {}
+        for npc_id, npc_name in rows:
+            key = npc_key(npc_name)
+            if key not in ids:
+                ids[key] = npc_id
+                names[key] = npc_name
+        for npc_name, npc_id in NPC_ALIASES.items():
+            ids.setdefault(npc_key(npc_name), npc_id)
+        self.ids = ids
+        self.names = names
+        self.loaded_at = time.time()
+
+    def get_cached(self, npc_name: str):
+        """Returns the npc_id for a known NPC without any I/O beyond a periodic table reload"""
+        if not npc_name:
+            return None
+        if time.time() - self.loaded_at > RELOAD_INTERVAL:
+            self.load()
+        return self.ids.get(npc_key(npc_name))
+
+    def get_stored_name(self, npc_name: str):
+        """Returns the name we store for an NPC, e.g. for a differently-cased name from a message"""
+        self.get_cached(npc_name)
+        return self.names.get(npc_key(npc_name))
+
+    async def resolve(self, npc_name: str, create: bool = False, fuzzy: bool = False):
+        """
+            Resolves an NPC name to its id.
+            :param: create: store NPCs found on the wiki in the NpcList table
+            :param: fuzzy: fall back to get_true_boss_name's partial matching of stored names
+                Returns the npc_id, or None if the NPC couldn't be found
+        """
+        if not npc_name:
+            return None
+        npc_id = self.get_cached(npc_name)
+        if npc_id is not None:
+            return npc_id
+        key = npc_key(npc_name)
+        if fuzzy:
+            stored_name, npc_id = await asyncio.to_thread(get_true_boss_name, npc_name)
+            if npc_id is not None:
+                self.ids[key] = npc_id
+                self.names[key] = stored_name
+                return npc_id
+        if self.unknown.get(key, 0) > time.time():
+            return None
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.in_flight[key] = future
+            try:
+                npc_id = await self._lookup(npc_name, create)
+                future.set_result(npc_id)
+            except Exception as e:
+                future.set_exception(e)
+                ## Nobody else may be waiting on this future; don't leave the exception unretrieved
+                future.exception()
+                raise
+            finally:
+                self.in_flight.pop(key, None)
+            return npc_id
+        return await asyncio.shield(future)
+
+    async def resolve_many(self, npc_names, create: bool = False, fuzzy: bool = False) -> dict:
+        """
+            Resolves a batch of NPC names; unknown names share a single fetch of the wiki's NPC IDs page.
+                Returns a dict of npc_name -> npc_id (or None)
+        """
+        unique_names = {npc_name for npc_name in npc_names if npc_name}
+        results = await asyncio.gather(*(self.resolve(npc_name, create, fuzzy) for npc_name in unique_names))
+        return dict(zip(unique_names, results))
+
+    async def _lookup(self, npc_name: str, create: bool):
+        key = npc_key(npc_name)
+        wiki_ids = await self._get_wiki_ids()
+        npc_id = wiki_ids.get(key)
+        if npc_id is None:
+            self.unknown[key] = time.time() + UNKNOWN_NPC_TTL
+            print(f"No NPC ID found for {npc_name}")
+            return None
+        self.unknown.pop(key, None)
+        if create:
+            await asyncio.to_thread(self._store_npc, npc_id, npc_name)
+        self.ids[key] = npc_id
+        self.names[key] = npc_name
+        return npc_id
+
+    def _store_npc(self, npc_id: int, npc_name: str):
+        session = Session()
+        try:
+            if not session.query(NpcList.npc_id).filter(NpcList.npc_name == npc_name).first():
+                session.add(NpcList(npc_id=npc_id, npc_name=npc_name))
+                session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Couldn't store NPC {npc_name} ({npc_id}): {e}")
+        finally:
+            session.close()
+
+    async def _get_wiki_ids(self) -> dict:
+        """The wiki's NPC IDs page, keyed by normalized name; fetched at most once at a time"""
+        if self.wiki_ids is not None and self.wiki_ids[0] > time.time():
+            return self.wiki_ids[1]
+        async with self.wiki_lock:
+            if self.wiki_ids is not None and self.wiki_ids[0] > time.time():
+                return self.wiki_ids[1]
+            cached = redis_client.get(WIKI_IDS_KEY)
+            if cached:
+                wiki_ids = json.loads(cached)
+            else:
+                fetched = await fetch_wiki_npc_ids()
+                if fetched is None:
+                    ## Don't cache a failed fetch; the unknown-name TTL limits how often we retry
+                    return {}
+                wiki_ids = {}
+                for npc_name, npc_id in fetched.items():
+                    wiki_ids.setdefault(npc_key(npc_name), npc_id)
+                try:
+                    redis_client.client.set(WIKI_IDS_KEY, json.dumps(wiki_ids), ex=WIKI_IDS_TTL)
+                except Exception as e:
+                    print(f"Couldn't cache the wiki NPC IDs: {e}")
+            self.wiki_ids = (time.time() + WIKI_IDS_TTL, wiki_ids)
+            return wiki_ids
+
+
+npc_resolver = NpcResolver()
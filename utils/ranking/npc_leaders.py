@@ -0,0 +1,98 @@
+import time
+from collections import namedtuple
+
+from db.models import Session, get_current_partition, user_group_association
+from utils.keys import determine_key
+from utils.redis import RedisClient
+
+"""
+
+    Top-K loot leaders for an NPC, read from the per-NPC leaderboard zsets that update_player_in_redis
+    maintains (globally and per group, per month and all-time).
+
+    A lookup is one ZREVRANGE of the first K members, plus a single membership check of those
+    candidates for group boards (the zsets keep players who have since left the group), so it
+    doesn't depend on how large the group is. Callers that rebuild an embed several times in a row
+    can opt in to reusing a result for a few seconds with max_age; by default nothing is cached.
+
+"""
+
+redis_client = RedisClient()
+
+NpcLeader = namedtuple("NpcLeader", ["player_id", "total"])
+
+DEFAULT_MAX_AGE = 10  # seconds a cached top-K is reused by the callers that opt in to caching
+
+
+class NpcLeaders:
+    def __init__(self):
+        self.cache = {}  # (npc_id, group_id, partition, limit) -> (fetched_at, expires_at, [NpcLeader])
+
+    def _filter_members(self, group_id, player_ids):
+        session = Session()
+        try:
+            return {player_id for (player_id,) in session.query(user_group_association.c.player_id).filter(
+                user_group_association.c.group_id == group_id,
+                user_group_association.c.player_id.in_(player_ids)
+            ).all()}
+        finally:
+            session.close()
+
+    def get_top(self, npc_id: int, group_id: int = None, partition=None, limit: int = 1, max_age: float = 0):
+        """
+            The `limit` players with the most loot from an NPC, highest first.
+            :param: group_id: only the group's current members; None for everyone
+            :param: partition: a month (YYYYMM), "all_time", or None for the current month
+            :param: max_age: reuse a result fetched up to this many seconds ago
+                Returns [NpcLeader(player_id, total)]
+        """
+        if partition is None:
+            partition = get_current_partition()
+        cache_key = (npc_id, group_id, partition, limit)
+        if max_age:
+            cached = self.cache.get(cache_key)
+            if cached and time.time() - cached[0] <= max_age:
+                return cached[2]
+        key = determine_key(npc_id=npc_id, group_id=group_id,
+                            partition=None if partition == "all_time" else partition)
+        leaders = []
+        start = 0
+        page_size = max(limit * 2, 10)
+        while len(leaders) < limit:
+            page = redis_client.client.zrevrange(key, start, start + page_size - 1, withscores=True)
+            if not page:
+                break
+            candidates = [(int(player_id), int(score)) for player_id, score in page if score > 0]
+            if group_id is not None and candidates:
+                members = self._filter_members(group_id, [player_id for player_id, _ in candidates])
+                candidates = [candidate for candidate in candidates if candidate[0] in members]
+            leaders.extend(NpcLeader(player_id, total) for player_id, total in candidates)
+            if len(page) < page_size or page[-1][1] <= 0:
+                break
+            start += page_size
+        leaders = leaders[:limit]
+        if max_age:
+            now = time.time()
+            self._prune(now)
+            self.cache[cache_key] = (now, now + max_age, leaders)
+        return leaders
+
+    def _prune(self, now: float):
+        ## Drop what no caller will reuse any more, so the cache only holds recently rebuilt NPCs
+        for cache_key in [cache_key for cache_key, cached in self.cache.items() if cached[1] < now]:
+            del self.cache[cache_key]
+
+    def get_leader(self, npc_id: int, group_id: int = None, partition=None, max_age: float = 0):
+        """The single top player for an NPC, or None if nobody has loot from it"""
+        leaders = self.get_top(npc_id, group_id, partition, limit=1, max_age=max_age)
+        return leaders[0] if leaders else None
+
+    def invalidate(self, npc_id: int = None):
+        if npc_id is None:
+            self.cache.clear()
+            return
+        for cache_key in [cache_key for cache_key in self.cache if cache_key[0] == npc_id]:
+            del self.cache[cache_key]
+
+
+npc_leaders = NpcLeaders()
@@ -1,7 +1,11 @@
-from db.models import Drop, Player, Group, session
+import bisect
+import time
+from db.models import Drop, Player, Group, get_current_partition, session
 from utils.redis import RedisClient
 from datetime import datetime, timedelta
 from sqlalchemy.sql import text
+from utils.ranking.range_totals import range_totals
+from utils.keys import determine_key
 
 redis_client = RedisClient()
 class NPCRankChecker:
@@ -10,7 +14,7 @@ class NPCRankChecker:
         self.session = session
     
     async def get_player_npc_totals(self, player_id, npc_id, start_time=None, end_time=None):
-        """Get a player's total loot value for a specific NPC within a timeframe"""
+        """Get a player's total loot value for a specific NPC within a timeframe ([start_time, end_time))"""
         if start_time is None:
             # Default to current month instead of all-time
             current_date = datetime.now()
@@ -22,71 +26,31 @@ class NPCRankChecker:
                 return int(npc_value.decode('utf-8'))
             return 0
         
-        # Generate time partitions based on start and end time
-        time_diff = end_time - start_time
-        
-        if time_diff.days > 30:
-            granularity = "monthly"
-        elif time_diff.days > 1:
-            granularity = "daily"
-        elif time_diff.seconds > 3600:
-            granularity = "hourly"
-        else:
-            granularity = "minute"
-        
-        time_partitions = generate_time_partitions(start_time, end_time, granularity)
-        
-        # Determine Redis key prefix based on granularity
-        if granularity == "monthly":
-            prefix = ""  # Monthly has no prefix
-        elif granularity == "daily":
-            prefix = "daily"
-        elif granularity == "hourly":
-            prefix = "hourly"
-        else:
-            prefix = "minute"
-        
-        total_value = 0
-        
-        for partition in time_partitions:
-            if prefix:
-                npc_key = f"player:{player_id}:{prefix}:{partition}:npcs"
-            else:
-                npc_key = f"player:{player_id}:{partition}:npc_totals"
-            
-            npc_value = self.redis_client.client.hget(npc_key, str(npc_id))
-            if npc_value:
-                total_value += int(npc_value.decode('utf-8'))
-        
-        return total_value
+        return range_totals.get_player_total(player_id, npc_id, start_time, end_time or datetime.now())
     
     async def get_all_players_npc_totals(self, npc_id, start_time=None, end_time=None):
         """Get all players' total loot values for a specific NPC within a timeframe"""
-        all_players = self.session.query(Player).all()
-        player_totals = {}
-        
-        for player in all_players:
-            player_total = await self.get_player_npc_totals(player.player_id, npc_id, start_time, end_time)
-            if player_total > 0:
-                player_totals[player.player_id] = player_total
-        
-        return player_totals
+        if start_time is None:
+            return range_totals.get_month_totals(npc_id, get_current_partition())
+        return range_totals.get_all_totals(npc_id, start_time, end_time or datetime.now())
     
     async def get_group_players_npc_totals(self, group_id, npc_id, start_time=None, end_time=None):
         """Get all players' total loot values for a specific NPC within a group"""
-        group = self.session.query(Group).filter(Group.group_id == group_id).first()
-        if not group:
+        if start_time is None:
+            return range_totals.get_month_totals(npc_id, get_current_partition(), group_id=group_id)
+        member_query = """SELECT player_id FROM user_group_association WHERE group_id = :group_id"""
+        member_ids = [m[0] for m in self.session.execute(text(member_query), {"group_id": group_id}).fetchall()]
+        if not member_ids:
             return {}
-        
-        player_totals = {}
-        
-        for player in group.players:
-            player_total = await self.get_player_npc_totals(player.player_id, npc_id, start_time, end_time)
-            if player_total > 0:
-                player_totals[player.player_id] = player_total
-        
-        return player_totals
+        return range_totals.get_all_totals(npc_id, start_time, end_time or datetime.now(),
+                                           group_id=group_id, player_ids=member_ids)
     
+    def _get_rank_source(self, npc_id, start_time=None, end_time=None, group_id=None, totals=None):
+        """Ranks for the current month come from the maintained zsets; other timeframes from a snapshot of totals"""
+        if start_time is None:
+            return ZsetRanks(determine_key(npc_id=npc_id, partition=get_current_partition(), group_id=group_id))
+        return TotalsRanks(totals or {})
+
     async def get_player_npc_rank(self, player_id, npc_id, start_time=None, end_time=None, group_id=None):
         """
         Get a player's rank for a specific NPC, both globally and within their group
@@ -98,44 +62,34 @@ class NPCRankChecker:
         if player_total == 0:
             return (None, 0, None, 0, 0)
         
-        # Get global rankings
-        if group_id:
-            all_totals = await self.get_group_players_npc_totals(group_id, npc_id, start_time, end_time)
-        else:
-            all_totals = await self.get_all_players_npc_totals(npc_id, start_time, end_time)
-        
-        # Sort players by total value
-        sorted_players = sorted(all_totals.items(), key=lambda x: x[1], reverse=True)
-        
-        # Find player's global rank
-        global_rank = None
-        for i, (pid, total) in enumerate(sorted_players):
-            if pid == player_id:
-                global_rank = i + 1
-                break
-        
-        total_players = len(sorted_players)
+        global_totals = None
+        if start_time is not None:
+            global_totals = await self.get_all_players_npc_totals(npc_id, start_time, end_time)
+        global_ranks = self._get_rank_source(npc_id, start_time, end_time, totals=global_totals)
+        global_rank = global_ranks.rank_of(player_total)
+        total_players = global_ranks.size()
         
         # Get group rankings if player is in a group
         group_rank = None
         total_group_players = 0
         
         if group_id:
-            group_totals = await self.get_group_players_npc_totals(group_id, npc_id, start_time, end_time)
-            sorted_group = sorted(group_totals.items(), key=lambda x: x[1], reverse=True)
-            
-            for i, (pid, total) in enumerate(sorted_group):
-                if pid == player_id:
-                    group_rank = i + 1
-                    break
-            
-            total_group_players = len(sorted_group)
+            group_totals = None
+            if start_time is not None:
+                group_totals = await self.get_group_players_npc_totals(group_id, npc_id, start_time, end_time)
+            group_ranks = self._get_rank_source(npc_id, start_time, end_time, group_id=group_id, totals=group_totals)
+            group_rank = group_ranks.rank_of(player_total)
+            total_group_players = group_ranks.size()
         
         return (global_rank, total_players, group_rank, total_group_players, player_total)
     
-    async def simulate_npc_drop_rank_change(self, player_id, npc_id, drop_value, start_time=None, end_time=None, group_id=None):
+    async def simulate_npc_drop_rank_change(self, player_id, npc_id, drop_value, start_time=None, end_time=None, group_id=None,
+                                            already_counted=False):
         """
-        Simulate how a new drop would affect a player's rank for a specific NPC
+        Simulate how a new drop would affect a player's rank for a specific NPC.
+        For the current month, each rank is a ZSCORE plus a ZCOUNT of the players above a score on the
+        NPC's leaderboard zset, so the cost doesn't grow with the number of players.
+        :param: already_counted: the drop has already been added to the player's totals
         
         Returns a dictionary with structured information about rank changes
         """
@@ -145,25 +99,24 @@ class NPCRankChecker:
             "group": {}
         }
         
-        # Get current ranks
-        current_ranks = await self.get_player_npc_rank(player_id, npc_id, start_time, end_time, group_id)
-        original_global_rank, total_players, original_group_rank, total_group_players, original_total = current_ranks
-        
-        # Calculate new total with the simulated drop
-        new_total = original_total + drop_value
-        
-        # Get all player totals
-        all_totals = await self.get_all_players_npc_totals(npc_id, start_time, end_time)
-        
-        # Create a copy with the simulated new total
-        simulated_totals = all_totals.copy()
-        simulated_totals[player_id] = new_total
-        
-        # Sort players by total value
-        sorted_players = sorted(simulated_totals.items(), key=lambda x: x[1], reverse=True)
+        if start_time is None:
+            original_total = await self.get_player_npc_totals(player_id, npc_id)
+            global_ranks = self._get_rank_source(npc_id)
+        else:
+            all_totals = await self.get_all_players_npc_totals(npc_id, start_time, end_time)
+            original_total = all_totals.get(player_id, 0)
+            global_ranks = self._get_rank_source(npc_id, start_time, end_time, totals=all_totals)
+        if already_counted:
+            new_total = original_total
+            original_total = max(original_total - drop_value, 0)
+        else:
+            new_total = original_total + drop_value
+        ## The score the player holds on the leaderboards right now, which mustn't count as someone above them
+        held_total = new_total if already_counted else original_total
+        held_exclude = held_total if held_total > 0 else None
         
-        # Find player's new global rank
-        new_global_rank = next((i+1 for i, (pid, _) in enumerate(sorted_players) if pid == player_id), 0)
+        original_global_rank = global_ranks.rank_of(original_total, exclude=held_exclude) if original_total > 0 else None
+        new_global_rank = global_ranks.rank_of(new_total, exclude=held_exclude)
         
         # Calculate global rank change
         global_rank_change = 0
@@ -191,25 +144,16 @@ class NPCRankChecker:
         
         # Process each group the player is in
         for g_id in player_group_ids:
-            # Get group players' totals for this NPC
-            group_totals = await self.get_group_players_npc_totals(g_id, npc_id, start_time, end_time)
-            
-            if not group_totals:
-                continue
-            
-            # Get player's current rank in this group
-            group_sorted = sorted(group_totals.items(), key=lambda x: x[1], reverse=True)
-            current_group_rank = next((i+1 for i, (pid, _) in enumerate(group_sorted) if pid == player_id), 0)
+            group_totals = None
+            if start_time is not None:
+                group_totals = await self.get_group_players_npc_totals(g_id, npc_id, start_time, end_time)
+                if not group_totals and original_total == 0:
+                    continue
+            group_ranks = self._get_rank_source(npc_id, start_time, end_time, group_id=g_id, totals=group_totals)
             
-            # Create a copy with the simulated new total
-            simulated_group_totals = group_totals.copy()
-            simulated_group_totals[player_id] = new_total
-            
-            # Sort players in group by total value
-            sorted_group_players = sorted(simulated_group_totals.items(), key=lambda x: x[1], reverse=True)
-            
-            # Find player's new rank in group
-            new_group_rank = next((i+1 for i, (pid, _) in enumerate(sorted_group_players) if pid == player_id), 0)
+            # Get player's current and new rank in this group
+            current_group_rank = group_ranks.rank_of(original_total, exclude=held_exclude) if original_total > 0 else 0
+            new_group_rank = group_ranks.rank_of(new_total, exclude=held_exclude)
             
             # Calculate group rank change
             group_rank_change = 0
@@ -224,34 +168,21 @@ class NPCRankChecker:
                 "improved": group_rank_change > 0
             }
             
-            # Now handle group-to-group comparison
-            # Get all groups' totals for this NPC
-            all_groups_query = """SELECT DISTINCT group_id FROM user_group_association WHERE group_id != 2"""
-            all_group_ids = [g[0] for g in self.session.execute(text(all_groups_query)).fetchall()]
-            
-            all_group_totals = {}
-            for group_id in all_group_ids:
-                group_players = await self.get_group_players_npc_totals(group_id, npc_id, start_time, end_time)
-                if group_players:
-                    all_group_totals[group_id] = sum(group_players.values())
-            
-            # Get current group rank
-            sorted_groups = sorted(all_group_totals.items(), key=lambda x: x[1], reverse=True)
-            current_group_global_rank = next((i+1 for i, (gid, _) in enumerate(sorted_groups) if gid == g_id), 0)
-            
-            # Calculate new group total
-            original_group_total = all_group_totals.get(g_id, 0)
-            new_group_total = original_group_total - original_total + new_total
-            
-            # Create simulated group totals
-            simulated_group_global_totals = all_group_totals.copy()
-            simulated_group_global_totals[g_id] = new_group_total
-            
-            # Sort groups by total value
-            sorted_simulated_groups = sorted(simulated_group_global_totals.items(), key=lambda x: x[1], reverse=True)
-            
-            # Find group's new global rank
-            new_group_global_rank = next((i+1 for i, (gid, _) in enumerate(sorted_simulated_groups) if gid == g_id), 0)
+            # Now handle group-to-group comparison, against a cached snapshot of every group's total
+            if start_time is None:
+                group_npc_ranks = group_npc_totals.get(npc_id, get_current_partition(), self.session)
+            else:
+                group_npc_ranks = TotalsRanks(await self._get_all_group_totals(npc_id, start_time, end_time))
+            held_group_total = group_npc_ranks.score(g_id) or 0
+            if already_counted:
+                new_group_total = held_group_total
+                original_group_total = max(held_group_total - (new_total - original_total), 0)
+            else:
+                original_group_total = held_group_total
+                new_group_total = held_group_total + (new_total - original_total)
+            held_group_exclude = held_group_total if held_group_total > 0 else None
+            current_group_global_rank = group_npc_ranks.rank_of(original_group_total, exclude=held_group_exclude) if original_group_total > 0 else 0
+            new_group_global_rank = group_npc_ranks.rank_of(new_group_total, exclude=held_group_exclude)
             
             # Calculate group global rank change
             group_global_rank_change = 0
@@ -269,6 +200,16 @@ class NPCRankChecker:
             }
         
         return result
+
+    async def _get_all_group_totals(self, npc_id, start_time, end_time):
+        all_groups_query = """SELECT DISTINCT group_id FROM user_group_association WHERE group_id != 2"""
+        all_group_ids = [g[0] for g in self.session.execute(text(all_groups_query)).fetchall()]
+        all_group_totals = {}
+        for g_id in all_group_ids:
+            group_players = await self.get_group_players_npc_totals(g_id, npc_id, start_time, end_time)
+            if group_players:
+                all_group_totals[g_id] = sum(group_players.values())
+        return all_group_totals
     
     async def simulate_group_npc_rank_change(self, group_id, player_id, npc_id, drop_value, start_time=None, end_time=None):
         """Helper method to simulate how a drop affects a group's ranking for a specific NPC"""
@@ -276,6 +217,76 @@ class NPCRankChecker:
         # For now, return a placeholder or None
         return None
 
+class ZsetRanks:
+    """Ranks on a leaderboard zset: rank = 1 + the number of members with a strictly higher score"""
+    def __init__(self, key):
+        self.key = key
+
+    def score(self, member):
+        score = redis_client.client.zscore(self.key, member)
+        return int(score) if score is not None else None
+
+    def rank_of(self, value, exclude=None):
+        """
+        The rank a total of `value` has (or would have) on the leaderboard.
+        :param: exclude: a score held by the member being ranked, which shouldn't count against it
+        """
+        above = redis_client.client.zcount(self.key, f"({value}", "+inf")
+        if exclude is not None and exclude > value:
+            above -= 1
+        return above + 1
+
+    def size(self):
+        return redis_client.client.zcard(self.key)
+
+
+class TotalsRanks:
+    """The same ranking over a snapshot of {member: total}, with the totals kept sorted for bisecting"""
+    def __init__(self, totals: dict):
+        self.totals = totals
+        self.sorted_totals = sorted(total for total in totals.values() if total > 0)
+
+    def score(self, member):
+        return self.totals.get(member)
+
+    def rank_of(self, value, exclude=None):
+        above = len(self.sorted_totals) - bisect.bisect_right(self.sorted_totals, value)
+        if exclude is not None and exclude > value:
+            above -= 1
+        return above + 1
+
+    def size(self):
+        return len(self.sorted_totals)
+
+
+class GroupNpcTotals:
+    """Snapshots of every group's total for an NPC this month, summed from the groups' NPC zsets"""
+    def __init__(self, refresh_interval=300):
+        self.refresh_interval = refresh_interval
+        self.snapshots = {}  # (npc_id, partition) -> (built_at, TotalsRanks)
+
+    def get(self, npc_id, partition, db_session) -> TotalsRanks:
+        snapshot = self.snapshots.get((npc_id, partition))
+        if snapshot is not None and time.time() - snapshot[0] < self.refresh_interval:
+            return snapshot[1]
+        all_groups_query = """SELECT DISTINCT group_id FROM user_group_association WHERE group_id != 2"""
+        group_ids = [g[0] for g in db_session.execute(text(all_groups_query)).fetchall() if g[0] is not None]
+        pipeline = redis_client.client.pipeline(transaction=False)
+        for group_id in group_ids:
+            pipeline.zrange(determine_key(npc_id=npc_id, partition=partition, group_id=group_id), 0, -1, withscores=True)
+        totals = {}
+        for group_id, members in zip(group_ids, pipeline.execute()):
+            total = int(sum(score for _, score in members))
+            if total > 0:
+                totals[group_id] = total
+        ranks = TotalsRanks(totals)
+        self.snapshots[(npc_id, partition)] = (time.time(), ranks)
+        return ranks
+
+
+group_npc_totals = GroupNpcTotals()
+
+
 async def check_npc_rank_change_from_drop(player_id: int, drop_data: Drop, specific_group_id: int = None):
     """
     Check if a player or a group has managed to climb a rank due to a drop
@@ -0,0 +1,234 @@
+import bisect
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, extract
+
+from db.models import Drop, Session
+from utils.keys import determine_key
+from utils.redis import RedisClient
+
+"""
+
+    Time-range NPC loot totals.
+
+    A range is split into the coarsest buckets that fit it:
+      - whole months, read from the per-NPC monthly leaderboard zsets (one ZSCORE per player,
+        or one ZRANGE for everyone)
+      - runs of whole days, answered from a per-(npc, month) index of daily prefix sums, built
+        for every player with a single GROUP BY and cached
+      - the partial days at either end, read from the hourly/minute buckets update_player_in_redis
+        writes while they're still retained, and from the drops table otherwise
+
+    So a player's total for any range is a handful of lookups, and a ranking of every player over
+    a range is one pass over each bucket kind instead of one lookup per player per bucket.
+
+"""
+
+redis_client = RedisClient()
+
+HOURLY_RETENTION = timedelta(days=7) - timedelta(hours=1)  # the hourly/minute keys' TTLs, with some margin
+MINUTE_RETENTION = timedelta(days=1) - timedelta(hours=1)
+CURRENT_MONTH_INDEX_TTL = 60  # seconds a daily index of the current month is reused
+PAST_MONTH_INDEX_TTL = 3600
+
+
+def get_partition(moment: datetime) -> int:
+    return moment.year * 100 + moment.month
+
+
+def get_next_month(moment: datetime) -> datetime:
+    if moment.month == 12:
+        return datetime(moment.year + 1, 1, 1)
+    return datetime(moment.year, moment.month + 1, 1)
+
+
+def split_range(start: datetime, end: datetime):
+    """
+        Splits [start, end) into whole months, runs of whole days and partial days.
+            Returns (months: [partition], days: [(partition, first_day, last_day)], edges: [(start, end)])
+    """
+    start = start.replace(second=0, microsecond=0)
+    end = end.replace(second=0, microsecond=0)
+    months, days, edges = [], [], []
+    cursor = start
+    while cursor < end:
+        next_month = get_next_month(cursor)
+        midnight = cursor.replace(hour=0, minute=0)
+        next_day = midnight + timedelta(days=1)
+        if cursor == midnight and cursor.day == 1 and next_month <= end:
+            months.append(get_partition(cursor))
+            cursor = next_month
+        elif cursor == midnight and next_day <= end:
+            run_end = min(end.replace(hour=0, minute=0), next_month)
+            days.append((get_partition(cursor), cursor.day, (run_end - timedelta(days=1)).day))
+            cursor = run_end
+        else:
+            edge_end = min(next_day, end)
+            edges.append((cursor, edge_end))
+            cursor = edge_end
+    return months, days, edges
+
+
+def split_edge(start: datetime, end: datetime):
+    """Splits a partial day into whole hours and the remaining minutes, as bucket names"""
+    hours, minutes = [], []
+    cursor = start
+    while cursor < end:
+        next_hour = cursor.replace(minute=0) + timedelta(hours=1)
+        if cursor.minute == 0 and next_hour <= end:
+            hours.append(cursor.strftime('%Y%m%d%H'))
+            cursor = next_hour
+        else:
+            minutes.append(cursor.strftime('%Y%m%d%H%M'))
+            cursor += timedelta(minutes=1)
+    return hours, minutes
+
+
+class DailyIndex:
+    """Per-player prefix sums of one NPC's daily totals over one month"""
+    def __init__(self, partition: int, rows):
+        self.partition = partition
+        self.built_at = time.time()
+        days = {}
+        for player_id, day, total in rows:
+            days.setdefault(player_id, {})[int(day)] = int(total or 0)
+        ## player_id -> (sorted days with drops, running totals up to and including each of those days)
+        self.prefix_sums = {}
+        for player_id, totals in days.items():
+            sorted_days = sorted(totals)
+            running = []
+            total = 0
+            for day in sorted_days:
+                total += totals[day]
+                running.append(total)
+            self.prefix_sums[player_id] = (sorted_days, running)
+
+    def _sum_to(self, player_id, day: int) -> int:
+        """The player's total from the start of the month up to and including `day`"""
+        sorted_days, running = self.prefix_sums[player_id]
+        position = bisect.bisect_right(sorted_days, day)
+        return running[position - 1] if position else 0
+
+    def get_total(self, player_id, first_day: int, last_day: int) -> int:
+        if player_id not in self.prefix_sums:
+            return 0
+        return self._sum_to(player_id, last_day) - self._sum_to(player_id, first_day - 1)
+
+    def get_totals(self, first_day: int, last_day: int, player_ids=None) -> dict:
+        player_ids = self.prefix_sums.keys() if player_ids is None else [p for p in player_ids if p in self.prefix_sums]
+        totals = {}
+        for player_id in player_ids:
+            total = self.get_total(player_id, first_day, last_day)
+            if total:
+                totals[player_id] = total
+        return totals
+
+
+class RangeTotals:
+    def __init__(self):
+        self.daily_indexes = {}  # (npc_id, partition) -> DailyIndex
+
+    def get_daily_index(self, npc_id: int, partition: int) -> DailyIndex:
+        index = self.daily_indexes.get((npc_id, partition))
+        ttl = CURRENT_MONTH_INDEX_TTL if partition >= get_partition(datetime.now()) else PAST_MONTH_INDEX_TTL
+        if index is None or time.time() - index.built_at > ttl:
+            session = Session()
+            try:
+                day = extract('day', Drop.date_added)
+                rows = session.query(Drop.player_id, day, func.sum(Drop.value * Drop.quantity)).filter(
+                    Drop.npc_id == npc_id,
+                    Drop.partition == partition
+                ).group_by(Drop.player_id, day).all()
+            finally:
+                session.close()
+            index = DailyIndex(partition, rows)
+            self.daily_indexes[(npc_id, partition)] = index
+        return index
+
+    def get_month_totals(self, npc_id: int, partition: int, group_id: int = None) -> dict:
+        """Every player's total loot from an NPC over a whole month, straight from its leaderboard zset"""
+        key = determine_key(npc_id=npc_id, partition=partition, group_id=group_id)
+        return {int(player_id): int(score) for player_id, score in redis_client.client.zrange(key, 0, -1, withscores=True)
+                if score > 0}
+
+    def get_player_total(self, player_id: int, npc_id: int, start: datetime, end: datetime) -> int:
+        """A player's total loot from an NPC in [start, end)"""
+        months, days, edges = split_range(start, end)
+        total = 0
+        pipeline = redis_client.client.pipeline(transaction=False)
+        for partition in months:
+            pipeline.zscore(determine_key(npc_id=npc_id, partition=partition), player_id)
+        sql_edges = []
+        now = datetime.now()
+        for edge_start, edge_end in edges:
+            hours, minutes = split_edge(edge_start, edge_end)
+            ## Use the hourly/minute buckets only while they haven't expired
+            if (hours and now - edge_start > HOURLY_RETENTION) or (minutes and now - edge_start > MINUTE_RETENTION):
+                sql_edges.append((edge_start, edge_end))
+                continue
+            for bucket in hours:
+                pipeline.hget(f"player:{player_id}:hourly:{bucket}:npcs", str(npc_id))
+            for bucket in minutes:
+                pipeline.hget(f"player:{player_id}:minute:{bucket}:npcs", str(npc_id))
+        for value in pipeline.execute():
+            if value:
+                total += int(float(value))
+        for partition, first_day, last_day in days:
+            total += self.get_daily_index(npc_id, partition).get_total(player_id, first_day, last_day)
+        if sql_edges:
+            session = Session()
+            try:
+                for edge_start, edge_end in sql_edges:
+                    total += int(session.query(func.sum(Drop.value * Drop.quantity)).filter(
+                        Drop.player_id == player_id,
+                        Drop.npc_id == npc_id,
+                        Drop.date_added >= edge_start,
+                        Drop.date_added < edge_end
+                    ).scalar() or 0)
+            finally:
+                session.close()
+        return total
+
+    def get_all_totals(self, npc_id: int, start: datetime, end: datetime, group_id: int = None, player_ids=None) -> dict:
+        """
+            Every player's total loot from an NPC in [start, end), in one pass per bucket kind.
+            :param: group_id: read the group's monthly leaderboards instead of the global ones
+            :param: player_ids: only these players (e.g. a group's members) for the daily and edge parts
+                Returns {player_id: total} for the players with a non-zero total
+        """
+        months, days, edges = split_range(start, end)
+        player_filter = set(player_ids) if player_ids is not None else None
+        totals = {}
+
+        def add(player_id, value):
+            player_id = int(player_id)
+            if player_filter is None or player_id in player_filter:
+                totals[player_id] = totals.get(player_id, 0) + int(value)
+
+        for partition in months:
+            for player_id, value in self.get_month_totals(npc_id, partition, group_id).items():
+                add(player_id, value)
+        for partition, first_day, last_day in days:
+            for player_id, value in self.get_daily_index(npc_id, partition).get_totals(first_day, last_day, player_filter).items():
+                add(player_id, value)
+        if edges:
+            session = Session()
+            try:
+                for edge_start, edge_end in edges:
+                    query = session.query(Drop.player_id, func.sum(Drop.value * Drop.quantity)).filter(
+                        Drop.npc_id == npc_id,
+                        Drop.partition == get_partition(edge_start),
+                        Drop.date_added >= edge_start,
+                        Drop.date_added < edge_end
+                    )
+                    if player_filter is not None:
+                        query = query.filter(Drop.player_id.in_(player_filter))
+                    for player_id, value in query.group_by(Drop.player_id).all():
+                        add(player_id, value or 0)
+            finally:
+                session.close()
+        return {player_id: total for player_id, total in totals.items() if total > 0}
+
+
+range_totals = RangeTotals()
@@ -102,10 +102,9 @@ async def do_raw_smwjson_query(query, jsonprops):
         return out
 
 async def get_npc_id(npc_name: str) -> int:
-    if not npc_name:
-        return None
     """
-    Look up an NPC ID from the OSRS Wiki using the semantic API.
+    Look up an NPC ID, using the cached resolver in utils.npc_resolver.
+    Unknown names are resolved against the OSRS Wiki's NPC IDs page.
     
     Args:
         npc_name: The name of the NPC to look up
@@ -113,12 +112,20 @@ async def get_npc_id(npc_name: str) -> int:
     Returns:
         The first matching NPC ID as an integer, or None if not found
     """
+    if not npc_name:
+        return None
+    from utils.npc_resolver import npc_resolver
+    return await npc_resolver.resolve(npc_name)
+
+async def fetch_wiki_npc_ids() -> dict:
+    """
+    Fetches the OSRS Wiki's NPC IDs page and parses every NPC on it.
+    
+    Returns:
+        A dict of NPC name -> the first NPC ID listed for it,
+        or None if the page could not be fetched
+    """
     try:
-        # Handle special cases
-        if npc_name == "Corrupted Gauntlet":
-            return 9035
-        
-        # Get the raw page content from NPC IDs page
         session = await get_aiohttp_session()
         async with session.get('https://oldschool.runescape.wiki/api.php', params={
             'action': 'parse',
@@ -138,30 +145,22 @@ async def get_npc_id(npc_name: str) -> int:
             # Extract the HTML content
             html_content = data.get('parse', {}).get('text', {}).get('*', '')
             
-            logger.log_sync(log_type="debug", message=f"Searching for NPC: {npc_name} in NPC IDs page", context="semantic_check.py")
-            
-            # Look for table rows containing the NPC name
             import re
             
             # This looks for links containing the NPC name followed by the ID in the next cell
             pattern = r'<td>(?:<span class="smw-subobject-entity">)?<a href="[^"]+" title="([^"]+)">[^<]+</a>(?:</span>)?\s*</td>\s*<td><a[^>]+>(\d+)</a>'
-            matches = re.findall(pattern, html_content)
-            
-            for name, npc_id in matches:
+            npc_ids = {}
+            for name, npc_id in re.findall(pattern, html_content):
                 # Extract the base name without any variant info (remove text after #)
-                base_name = name.split('#')[0]
-                
-                # Case-insensitive comparison
-                if base_name.lower().strip() == npc_name.lower().strip():
-                    npc_id = int(npc_id)
-                    logger.log_sync(log_type="info", message=f"Found NPC ID {npc_id} for {npc_name}", context="semantic_check.py")
-                    return npc_id
+                base_name = html.unescape(name.split('#')[0]).strip()
+                if base_name not in npc_ids:
+                    npc_ids[base_name] = int(npc_id)
             
-            logger.log_sync(log_type="info", message=f"No NPC ID found for {npc_name} in NPC IDs page", context="semantic_check.py")
-            return None
+            logger.log_sync(log_type="debug", message=f"Parsed {len(npc_ids)} NPCs from the NPC IDs page", context="semantic_check.py")
+            return npc_ids
             
     except Exception as e:
-        logger.log_sync(log_type="error", message=f"Error getting NPC ID for {npc_name}: {e}", context="semantic_check.py")
+        logger.log_sync(log_type="error", message=f"Error fetching the NPC IDs page: {e}", context="semantic_check.py")
         return None
     finally:
         await close_aiohttp_session()
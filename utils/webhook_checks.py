@@ -0,0 +1,65 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+"""
+
+    Webhook health checks used by the heartbeat bot.
+
+    Kept free of the bot and the database: a check only needs each webhook's webhook_url,
+    so it can be run against a local aiohttp server (see tests/test_webhook_checks.py).
+
+"""
+
+WEBHOOK_CHECK_CONCURRENCY = 10  # webhooks being tested at once
+WEBHOOK_CHECK_TIMEOUT = 10
+WEBHOOK_CHECK_JITTER = 2.0  # seconds; spreads the start of the checks out so they don't arrive as one burst
+## Statuses meaning the webhook no longer exists; anything else (429s, 5xx, timeouts) is treated as transient
+DEAD_WEBHOOK_STATUSES = (401, 403, 404)
+
+async def test_webhook(webhook, session, timeout: float = WEBHOOK_CHECK_TIMEOUT):
+    """Test a single webhook and return its status"""
+    result = {
+        'webhook_id': webhook.webhook_id if hasattr(webhook, 'webhook_id') else 'pending_deletion',
+        'url': webhook.webhook_url,
+        'webhook': webhook,
+        'status': 'Error',
+        'elapsed': 0,
+        'ok': False,
+        'dead': False
+    }
+    if len(str(webhook.webhook_url)) < 5:
+        result['dead'] = True
+        return result
+    try:
+        start_time = time.time()
+        async with session.get(webhook.webhook_url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            status = response.status
+            result.update({
+                'status': status,
+                'elapsed': time.time() - start_time,
+                'ok': 200 <= status < 400,
+                'dead': status in DEAD_WEBHOOK_STATUSES
+            })
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result['error'] = str(e) or type(e).__name__
+    return result
+
+
+async def check_webhooks(webhooks, http_session: aiohttp.ClientSession,
+                         concurrency: int = WEBHOOK_CHECK_CONCURRENCY, jitter: float = WEBHOOK_CHECK_JITTER,
+                         timeout: float = WEBHOOK_CHECK_TIMEOUT):
+    """
+    Tests webhooks concurrently, at most `concurrency` at a time, on one shared HTTP session.
+        Returns the test_webhook results, in the same order as `webhooks`
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(webhook):
+        await asyncio.sleep(random.uniform(0, jitter))
+        async with semaphore:
+            return await test_webhook(webhook, http_session, timeout)
+
+    return await asyncio.gather(*(check(webhook) for webhook in webhooks))
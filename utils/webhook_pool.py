@@ -0,0 +1,182 @@
+"""
+    Health-scored pool of the webhooks published to the plugin through GitHub Pages.
+
+    Every webhook check (the heartbeat bot's routine check and the check run before a GitHub update)
+    records its results here, in Redis, so both processes share them. Webhooks are then picked for
+    publishing by weighted random sampling: the weight is the webhook's success rate, reduced while it
+    has recently been rate limited and for a while after it was last published, so that plugin traffic
+    rotates across the whole pool instead of always landing on the same hooks.
+
+    The picked subset is kept for a rotation period, only replacing the webhooks that turn unhealthy
+    (judged on their health alone, not on having just been published), so that the published files
+    (and GitHub commits) don't change on every update. Webhooks only count as published once
+    mark_published is called for them, after the list has actually been published.
+
+"""
+import json
+import math
+import random
+import time
+
+from db.models import Webhook
+from utils.redis import redis_client
+
+STATS_KEY = "webhook_pool:stats:{}"  # hash of checks/passes per webhook row id
+RATE_LIMITED_KEY = "webhook_pool:rate_limited"  # zset of webhook row id -> time of the last 429
+PUBLISHED_KEY = "webhook_pool:published"  # zset of webhook row id -> time it was last published
+SELECTION_KEY = "webhook_pool:selection"  # the current rotation's selection
+
+ROTATION_INTERVAL = 6 * 3600  # seconds a selection is kept before rotating
+RATE_LIMIT_COOLDOWN = 1800  # seconds over which a 429's penalty wears off
+PUBLISHED_COOLDOWN = 24 * 3600  # seconds over which being recently published stops counting against a webhook
+STATS_DECAY_CHECKS = 50  # checks/passes are halved past this many checks
+MIN_WEIGHT = 0.01
+UNHEALTHY_WEIGHT = 0.2  # webhooks below this are replaced in the current selection
+
+
+class WebhookPool:
+    def record_results(self, results):
+        """
+            Records webhook check results.
+            :param: results: dicts with the 'webhook' row and its 'status', as returned by test_webhook
+        """
+        now = time.time()
+        webhook_ids = []
+        pipeline = redis_client.client.pipeline(transaction=False)
+        for result in results:
+            webhook = result.get('webhook')
+            if not isinstance(webhook, Webhook) or webhook.id is None:
+                continue
+            stats_key = STATS_KEY.format(webhook.id)
+            pipeline.hincrby(stats_key, "checks", 1)
+            pipeline.hincrby(stats_key, "passes", 1 if result.get('ok') else 0)
+            if result.get('status') == 429:
+                pipeline.zadd(RATE_LIMITED_KEY, {webhook.id: now})
+            webhook_ids.append(webhook.id)
+        if not webhook_ids:
+            return
+        try:
+            pipeline.execute()
+            ## Halve long histories, so old results don't outweigh recent ones
+            pipeline = redis_client.client.pipeline(transaction=False)
+            for webhook_id, stats in self._get_stats(webhook_ids).items():
+                if stats['checks'] > STATS_DECAY_CHECKS:
+                    pipeline.hset(STATS_KEY.format(webhook_id), mapping={
+                        "checks": stats['checks'] // 2,
+                        "passes": stats['passes'] // 2
+                    })
+            pipeline.execute()
+        except Exception as e:
+            print(f"Couldn't record webhook check results: {e}")
+
+    def _get_stats(self, webhook_ids) -> dict:
+        pipeline = redis_client.client.pipeline(transaction=False)
+        for webhook_id in webhook_ids:
+            pipeline.hgetall(STATS_KEY.format(webhook_id))
+        stats = {}
+        for webhook_id, raw_stats in zip(webhook_ids, pipeline.execute()):
+            stats[webhook_id] = {
+                'checks': int(raw_stats.get(b"checks", 0)),
+                'passes': int(raw_stats.get(b"passes", 0))
+            }
+        return stats
+
+    def _get_times(self, key) -> dict:
+        return {int(member): score for member, score in redis_client.client.zrange(key, 0, -1, withscores=True)}
+
+    def get_weights(self, webhook_ids, include_published: bool = True) -> dict:
+        """
+            Returns {webhook row id: weight}; higher means the webhook should be published sooner.
+            :param: include_published: whether having been published recently counts against a webhook;
+                without it, the weight only reflects the webhook's health
+        """
+        webhook_ids = list(webhook_ids)
+        now = time.time()
+        stats = self._get_stats(webhook_ids)
+        rate_limited = self._get_times(RATE_LIMITED_KEY)
+        published = self._get_times(PUBLISHED_KEY) if include_published else {}
+        weights = {}
+        for webhook_id in webhook_ids:
+            ## Smoothed success rate, so webhooks that haven't been checked yet start at 0.5
+            weight = (stats[webhook_id]['passes'] + 1) / (stats[webhook_id]['checks'] + 2)
+            if webhook_id in rate_limited:
+                weight *= 1 - math.exp(-(now - rate_limited[webhook_id]) / RATE_LIMIT_COOLDOWN)
+            if webhook_id in published:
+                weight *= min(1.0, 0.25 + (now - published[webhook_id]) / PUBLISHED_COOLDOWN)
+            weights[webhook_id] = max(weight, MIN_WEIGHT)
+        return weights
+
+    def select(self, session, limit: int = 80) -> list:
+        """
+            Returns up to `limit` Webhook rows to publish.
+            The current rotation's selection is reused, with unhealthy or deleted webhooks replaced
+            by a weighted pick from the rest of the pool.
+        """
+        rows = session.query(Webhook).filter(Webhook.webhook_url.isnot(None)).all()
+        webhooks = {webhook.id: webhook for webhook in rows}
+        if not webhooks:
+            return []
+        weights = self.get_weights(webhooks.keys())
+        rotation = int(time.time() // ROTATION_INTERVAL)
+
+        selection = []
+        published_ids = []
+        cached = self._get_selection()
+        if cached and cached.get('rotation') == rotation:
+            health = self.get_weights(webhooks.keys(), include_published=False)
+            selection = [webhook_id for webhook_id in cached['ids']
+                         if webhook_id in webhooks and health[webhook_id] >= UNHEALTHY_WEIGHT][:limit]
+            published_ids = [webhook_id for webhook_id in cached.get('published', []) if webhook_id in selection]
+
+        if len(selection) < limit:
+            ## Weighted sampling without replacement: the largest random() ** (1 / weight) keys win
+            chosen = set(selection)
+            candidates = sorted((webhook_id for webhook_id in webhooks if webhook_id not in chosen),
+                                key=lambda webhook_id: random.random() ** (1 / weights[webhook_id]),
+                                reverse=True)
+            selection.extend(candidates[:limit - len(selection)])
+
+        try:
+            pipeline = redis_client.client.pipeline(transaction=False)
+            pipeline.set(SELECTION_KEY, json.dumps({'rotation': rotation, 'ids': selection, 'published': published_ids}),
+                         ex=ROTATION_INTERVAL)
+            ## Forget webhooks that have been removed since
+            stale_ids = [webhook_id for webhook_id in self._get_times(PUBLISHED_KEY) if webhook_id not in webhooks]
+            if stale_ids:
+                pipeline.zrem(PUBLISHED_KEY, *stale_ids)
+                pipeline.zrem(RATE_LIMITED_KEY, *stale_ids)
+                pipeline.delete(*(STATS_KEY.format(webhook_id) for webhook_id in stale_ids))
+            pipeline.execute()
+        except Exception as e:
+            print(f"Couldn't store the webhook selection: {e}")
+        return [webhooks[webhook_id] for webhook_id in selection]
+
+    def _get_selection(self):
+        cached = redis_client.get(SELECTION_KEY)
+        return json.loads(cached) if cached else None
+
+    def mark_published(self, webhook_ids):
+        """
+            Records that the selected webhooks have been published, starting their published cooldown.
+            Webhooks already published in the current selection keep their original time.
+        """
+        selection = self._get_selection()
+        if not selection:
+            return
+        published_ids = selection.get('published', [])
+        new_ids = [webhook_id for webhook_id in webhook_ids
+                   if webhook_id in selection['ids'] and webhook_id not in published_ids]
+        if not new_ids:
+            return
+        selection['published'] = published_ids + new_ids
+        try:
+            now = time.time()
+            pipeline = redis_client.client.pipeline(transaction=False)
+            pipeline.zadd(PUBLISHED_KEY, {webhook_id: now for webhook_id in new_ids})
+            pipeline.set(SELECTION_KEY, json.dumps(selection), keepttl=True)
+            pipeline.execute()
+        except Exception as e:
+            print(f"Couldn't mark webhooks as published: {e}")
+
+
+webhook_pool = WebhookPool()
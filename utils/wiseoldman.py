@@ -1,10 +1,13 @@
 import os
 import asyncio
+import json
 import httpx
 from asynciolimiter import Limiter
 from dotenv import load_dotenv
+from sqlalchemy import update
 from db.models import Player, Session, session
 from db import models
+from utils.redis import redis_client
 import wom
 from wom import Err
 load_dotenv()
@@ -143,13 +146,69 @@ async def check_group_by_id(wom_group_id: int):
     finally:
         pass
 
+## Players queried per IN (...) clause
+WOM_ID_CHUNK_SIZE = 1000
+
+async def fetch_group_memberships(wom_group_id: int):
+    """
+    Returns a dict of WiseOldMan Player ID -> display name
+    for the members of a specified group, or None if the group couldn't be fetched.
+    Doesn't touch the database.
+    """
+    await client.start()
+    await limiter.wait()
+    try:
+        result = await client.groups.get_details(wom_group_id)
+        if result.is_ok:
+            details = result.unwrap()
+            return {member.player_id: member.player.display_name for member in details.memberships}
+        else:
+            return None
+    except Exception as e:
+        print(f"Couldn't fetch WOM group {wom_group_id}... Error:", e)
+        return None
+
+async def fetch_many_group_memberships(wom_group_ids):
+    """
+    Fetches the memberships of several groups concurrently; 
+    requests are still paced by the shared limiter.
+    Returns a dict of WOM group ID -> fetch_group_memberships result
+    """
+    wom_group_ids = list(wom_group_ids)
+    results = await asyncio.gather(*(fetch_group_memberships(wom_group_id) for wom_group_id in wom_group_ids))
+    return dict(zip(wom_group_ids, results))
+
+def apply_player_renames(names_by_wom_id: dict, session_to_use = None):
+    """
+    Updates the stored names of players whose WiseOldMan display name has changed, in bulk.
+    Returns a list of (player_id, old name, new name) for the players that were renamed
+    """
+    if session_to_use is not None:
+        session = session_to_use
+    else:
+        session = models.session
+    renamed = []
+    wom_ids = list(names_by_wom_id.keys())
+    for i in range(0, len(wom_ids), WOM_ID_CHUNK_SIZE):
+        rows = session.query(Player.player_id, Player.wom_id, Player.player_name).filter(
+            Player.wom_id.in_(wom_ids[i:i + WOM_ID_CHUNK_SIZE])
+        ).all()
+        for player_id, wom_id, old_name in rows:
+            new_name = names_by_wom_id.get(wom_id) or ""
+            if (old_name or "") != new_name:
+                print(f"Updated player name for {old_name} to {new_name}")
+                renamed.append((player_id, old_name, new_name))
+    if renamed:
+        session.execute(update(Player), [{"player_id": player_id, "player_name": new_name}
+                                         for player_id, _, new_name in renamed])
+        session.commit()
+    return renamed
+
 async def fetch_group_members(wom_group_id: int, session_to_use = None):
     """ 
     Returns a list of WiseOldMan Player IDs 
     for members of a specified group 
     """
-    #print("Fetching group members for ID:", wom_group_id)
-    user_list = []
     if session_to_use is not None:
         session = session_to_use
     else:
@@ -161,32 +220,41 @@ async def fetch_group_members(wom_group_id: int, session_to_use = None):
         # Unpack the list of tuples returned by SQLAlchemy
         user_list = [player.wom_id for player in players] 
         return user_list
-    await client.start()
-    await limiter.wait()
+    memberships = await fetch_group_memberships(wom_group_id)
+    if not memberships:
+        return []
     try:
-        result = await client.groups.get_details(wom_group_id)
-        if result.is_ok:
-            details = result.unwrap()
-            members = details.memberships
-            name = details.name
-            #print(f"Group name: {name}")
-            for member in members:
-                player_name = member.player.display_name
-                existing_player = session.query(Player).filter(Player.wom_id == member.player_id).first()
-                if existing_player:
-                    old_name = existing_player.player_name or ""
-                    new_name = player_name or ""
-                    if old_name != new_name:
-                        print(f"Updated player name for {old_name} to {new_name}")
-                        existing_player.player_name = new_name
-                        session.commit()
-                user_list.append(member.player_id)
-            return user_list
-        else:
-            return []
+        apply_player_renames(memberships, session)
     except Exception as e:
-        print("Couldn't find WOM group members... Error:", e)
-        return []
+        session.rollback()
+        print("Couldn't update renamed WOM group members... Error:", e)
+    return list(memberships.keys())
+
+## Member lists are refreshed by update_group_members (hourly); the TTL only guards against that stopping
+GROUP_MEMBERS_KEY = "wom_group_members:{}"
+GROUP_MEMBERS_TTL = 2 * 3600
+
+def cache_group_members(wom_group_id: int, member_wom_ids):
+    """Stores the WOM IDs of a group's members for get_cached_group_members"""
+    try:
+        redis_client.client.set(GROUP_MEMBERS_KEY.format(wom_group_id), json.dumps(list(member_wom_ids)), ex=GROUP_MEMBERS_TTL)
+    except Exception as e:
+        print(f"Couldn't cache the members of WOM group {wom_group_id}: {e}")
+
+async def get_cached_group_members(wom_group_id: int, session_to_use = None):
+    """
+    Returns the list of WiseOldMan Player IDs for members of a group,
+    from the cached member list when there is one; otherwise they are fetched and cached.
+    """
+    if wom_group_id == 1:
+        return await fetch_group_members(wom_group_id, session_to_use)
+    cached = redis_client.get(GROUP_MEMBERS_KEY.format(wom_group_id))
+    if cached:
+        return json.loads(cached)
+    member_wom_ids = await fetch_group_members(wom_group_id, session_to_use)
+    if member_wom_ids:
+        cache_group_members(wom_group_id, member_wom_ids)
+    return member_wom_ids
 
 async def get_collections_logged(username: str):
     """